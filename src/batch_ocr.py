@@ -0,0 +1,118 @@
+# batch_ocr.py
+"""
+Batch OCR - Engine-only batch CLI that can process one shard of the input
+"""
+import os
+from typing import Optional
+import logging
+
+from gutenocr_engine import GutenOCREngine
+from file_processor import FileProcessor, shard_suffix
+from result_sink import ResultStatistics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def run_batch(
+    engine: GutenOCREngine,
+    input_dir: str = "./input",
+    output_dir: str = "./output",
+    task_type: str = "reading",
+    output_format: str = "TEXT",
+    batch_size: Optional[int] = None,
+    time_budget: Optional[float] = None,
+    flush_every: int = 100,
+    shard_index: int = 0,
+    shard_count: int = 1
+) -> ResultStatistics:
+    """
+    OCR every image of one shard, streaming results to a JSON Lines file
+
+    Results go to ``ocr_results<shard suffix>_<timestamp>.jsonl`` in the
+    output directory; merge_shards combines the files of every shard.
+
+    Args:
+        engine: Loaded GutenOCREngine
+        input_dir: Input directory
+        output_dir: Output directory
+        task_type: Type of task
+        output_format: Output format
+        batch_size: Images per generate call (default: engine batch_size)
+        time_budget: Seconds each image may take
+        flush_every: Results between flushes of the output file
+        shard_index: Shard of the input to process (see file_processor.shard_of)
+        shard_count: Number of shards the input is split into
+
+    Returns:
+        Statistics of this shard's results
+    """
+    file_processor = FileProcessor(input_dir=input_dir, output_dir=output_dir)
+    files = file_processor.discover_images(
+        recursive=True, shard_index=shard_index, shard_count=shard_count
+    )
+    with file_processor.open_result_sink(
+        f"ocr_results{shard_suffix(shard_index, shard_count)}", flush_every=flush_every
+    ) as sink:
+        for result in engine.iter_batch_process(
+            files,
+            task_type=task_type,
+            output_format=output_format,
+            batch_size=batch_size,
+            time_budget=time_budget
+        ):
+            sink.write(result)
+    return sink.statistics
+
+
+def main():
+    """Main entry point for command-line usage"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="GutenOCR batch processor")
+    parser.add_argument("--input", default="./input", help="Input directory")
+    parser.add_argument("--output", default="./output", help="Output directory")
+    parser.add_argument("--model", default="rootsautomation/GutenOCR-3B", help="GutenOCR model")
+    parser.add_argument("--cpu", action="store_true", help="Force CPU usage")
+    parser.add_argument("--task", choices=["reading", "detection"], default="reading", help="Task type")
+    parser.add_argument("--format", default="TEXT", help="Output format (TEXT, TEXT2D, LINES, WORDS, PARAGRAPHS, LATEX, BOX)")
+    parser.add_argument("--batch-size", type=int, default=4, help="Images per generate call")
+    parser.add_argument("--pixel-preset", choices=list(GutenOCREngine.PIXEL_PRESETS), default=None, help="Pixel budget preset")
+    parser.add_argument("--time-budget", type=float, default=None, help="Seconds allowed per image before OCR returns partial text")
+    parser.add_argument("--cache-dir", default=None, help="OCR result cache directory (e.g. ./output/.ocr_cache)")
+    parser.add_argument("--flush-every", type=int, default=100, help="Results between flushes of the JSON Lines output")
+    parser.add_argument("--shard-index", type=int, default=int(os.environ.get("JOB_COMPLETION_INDEX", 0)), help="Shard of the input to process (default: JOB_COMPLETION_INDEX)")
+    parser.add_argument("--shard-count", type=int, default=1, help="Number of shards the input is split into")
+
+    args = parser.parse_args()
+
+    engine = GutenOCREngine(
+        model_id=args.model,
+        use_cpu=args.cpu,
+        batch_size=args.batch_size,
+        cache_dir=args.cache_dir,
+        pixel_preset=args.pixel_preset
+    )
+    statistics = run_batch(
+        engine,
+        input_dir=args.input,
+        output_dir=args.output,
+        task_type=args.task,
+        output_format=args.format,
+        time_budget=args.time_budget,
+        flush_every=args.flush_every,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count
+    )
+
+    summary = statistics.summary()
+    print(f"\n=== Processing Complete (shard {args.shard_index}/{args.shard_count}) ===")
+    print(f"Total images: {summary['total_images']}")
+    print(f"Successful: {summary['successful']}")
+    print(f"Failed: {summary['failed']}")
+
+
+if __name__ == "__main__":
+    main()
+
+# Made with Bob
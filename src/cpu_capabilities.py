@@ -0,0 +1,145 @@
+# cpu_capabilities.py
+"""
+CPU Capabilities - Host feature probing and CPU dtype selection
+"""
+import os
+import platform
+import torch
+from typing import Dict, Any, Optional, List
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def detect_cpu_features() -> Dict[str, Any]:
+    """
+    Probe the host CPU for features relevant to inference dtype choice
+
+    Returns:
+        Dictionary with the CPU model name, torch's dispatch capability and
+        whether native bf16 instructions (AVX512-BF16 / AMX) are present
+    """
+    flags = set()
+    model_name = None
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('flags') and not flags:
+                    flags = set(line.split(':', 1)[1].split())
+                elif line.startswith('model name') and model_name is None:
+                    model_name = line.split(':', 1)[1].strip()
+                if flags and model_name:
+                    break
+    except OSError:
+        pass
+
+    try:
+        capability = torch.backends.cpu.get_cpu_capability()
+    except AttributeError:
+        capability = "unknown"
+
+    try:
+        mkldnn_bf16 = bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        mkldnn_bf16 = False
+
+    return {
+        "model_name": model_name or platform.processor() or platform.machine(),
+        "logical_cpus": os.cpu_count(),
+        "capability": capability,
+        "avx512_bf16": "avx512_bf16" in flags,
+        "amx_bf16": "amx_bf16" in flags,
+        "mkldnn_bf16": mkldnn_bf16
+    }
+
+
+def preferred_cpu_dtype(features: Optional[Dict[str, Any]] = None) -> torch.dtype:
+    """
+    Pick the CPU inference dtype for this host
+
+    bfloat16 is only chosen when the CPU executes it natively (AVX512-BF16 or
+    AMX); elsewhere it is emulated and slower than float32.
+
+    Args:
+        features: Output of detect_cpu_features (probed if omitted)
+
+    Returns:
+        torch.bfloat16 or torch.float32
+    """
+    features = features or detect_cpu_features()
+    if features["avx512_bf16"] or features["amx_bf16"]:
+        return torch.bfloat16
+    return torch.float32
+
+
+def benchmark_dtypes(
+    model_id: str = "rootsautomation/GutenOCR-3B",
+    dtypes: Optional[List[torch.dtype]] = None,
+    prompt_tokens: int = 256,
+    new_tokens: int = 32
+) -> List[Dict[str, Any]]:
+    """
+    Compare prefill and decode rates of the model in several CPU dtypes
+
+    Args:
+        model_id: HuggingFace model ID
+        dtypes: Dtypes to compare (default: float32 and bfloat16)
+        prompt_tokens: Synthetic prompt length for the prefill measurement
+        new_tokens: Tokens to decode for the decode measurement
+
+    Returns:
+        One result dictionary per dtype
+    """
+    from gutenocr_engine import GutenOCREngine
+
+    results = []
+    for dtype in dtypes or [torch.float32, torch.bfloat16]:
+        logger.info(f"Benchmarking {model_id} with {dtype}")
+        engine = GutenOCREngine(model_id=model_id, use_cpu=True, torch_dtype=dtype)
+        rates = engine.benchmark(prompt_tokens=prompt_tokens, new_tokens=new_tokens)
+        results.append({"dtype": str(dtype), **rates})
+        del engine
+    return results
+
+
+def main():
+    """Print host CPU features and the fp32 vs bf16 benchmark"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="GutenOCR CPU dtype benchmark")
+    parser.add_argument("--model", default="rootsautomation/GutenOCR-3B", help="GutenOCR model")
+    parser.add_argument("--prompt-tokens", type=int, default=256, help="Synthetic prompt length")
+    parser.add_argument("--new-tokens", type=int, default=32, help="Tokens to decode")
+    parser.add_argument("--features-only", action="store_true", help="Only print CPU features")
+
+    args = parser.parse_args()
+
+    features = detect_cpu_features()
+    print("\n=== CPU Features ===")
+    for key, value in features.items():
+        print(f"{key}: {value}")
+    print(f"preferred_dtype: {preferred_cpu_dtype(features)}")
+
+    if args.features_only:
+        return
+
+    results = benchmark_dtypes(
+        model_id=args.model,
+        prompt_tokens=args.prompt_tokens,
+        new_tokens=args.new_tokens
+    )
+    print("\n=== Benchmark ===")
+    print(f"{'dtype':<16}{'prefill tok/s':>16}{'decode tok/s':>16}")
+    for result in results:
+        print(
+            f"{result['dtype']:<16}"
+            f"{result['prefill_tokens_per_second']:>16.2f}"
+            f"{result['decode_tokens_per_second']:>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
+
+# Made with Bob
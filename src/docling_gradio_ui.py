@@ -10,8 +10,11 @@ from pathlib import Path
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 import logging
+import threading
 
 from docling_gutenocr_combined import DoclingGutenOCRProcessor
+from stopping_criteria import CancellationToken
+from readiness import ReadinessState, launch_with_probes
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,8 +23,12 @@ logger = logging.getLogger(__name__)
 class DoclingGutenOCRUI:
     """Gradio UI for Docling + GutenOCR combined processing"""
     
-    def __init__(self):
+    def __init__(self, idle_unload_seconds: Optional[float] = None):
         self.processor: Optional[DoclingGutenOCRProcessor] = None
+        self.idle_unload_seconds = idle_unload_seconds
+        self.active_tokens = set()
+        # Backs the /ready probe: false only while a model is loading
+        self.readiness = ReadinessState()
         self.input_dir = Path("./input")
         self.output_dir = Path("./output")
         
@@ -34,6 +41,7 @@ class DoclingGutenOCRUI:
         model_choice: str,
         use_cpu: bool,
         use_docling: bool,
+        pixel_budget: str = "Default",
         progress=gr.Progress()
     ) -> str:
         """Initialize the combined processor"""
@@ -43,10 +51,26 @@ class DoclingGutenOCRUI:
             model_id = "rootsautomation/GutenOCR-3B" if model_choice == "GutenOCR-3B" else "rootsautomation/GutenOCR-7B"
             
             progress(0.3, desc=f"Loading {model_choice}...")
+            self.readiness.mark_loading(model_id)
+            if self.processor is not None:
+                self.processor.close()
+                self.processor = None
             self.processor = DoclingGutenOCRProcessor(
                 gutenocr_model=model_id,
                 use_cpu=use_cpu,
-                use_docling=use_docling
+                use_docling=use_docling,
+                cache_dir=str(self.output_dir / ".ocr_cache"),
+                pixel_preset=None if pixel_budget == "Default" else pixel_budget.lower(),
+                idle_unload_seconds=self.idle_unload_seconds
+            )
+            
+            progress(0.7, desc="Warming up...")
+            # Documents are OCR'd as TEXT2D, so that is the only format to warm
+            if not self.processor.gutenocr.warmed_up:
+                self.processor.gutenocr.warmup(formats=[("reading", "TEXT2D")])
+            self.readiness.mark_ready(
+                model_id=model_id,
+                warmup_seconds=self.processor.gutenocr.warmup_stats["warmup_seconds"]
             )
             
             progress(0.9, desc="Getting capabilities...")
@@ -60,6 +84,7 @@ class DoclingGutenOCRUI:
 - Model: {model_choice}
 - Device: {'CPU' if use_cpu else 'GPU'}
 - Docling: {'Enabled' if capabilities['docling_available'] else 'Disabled'}
+- Pixel budget: {pixel_budget}
 
 **Capabilities:**
 - Supported formats: {', '.join(capabilities['supported_formats'])}
@@ -67,8 +92,22 @@ class DoclingGutenOCRUI:
 """
         except Exception as e:
             logger.error(f"Initialization error: {e}")
+            self.readiness.mark_failed(str(e))
             return f"❌ Error: {str(e)}"
     
+    def preload(self, model_choice: str = "GutenOCR-3B", use_cpu: bool = False, use_docling: bool = True) -> threading.Thread:
+        """Load and warm up the processor in the background while the UI starts serving"""
+        thread = threading.Thread(
+            target=self.initialize_processor,
+            args=(model_choice, use_cpu, use_docling),
+            # No Gradio event is running, so there is no progress bar to update
+            kwargs={"progress": lambda *args, **kwargs: None},
+            name="model-preload",
+            daemon=True
+        )
+        thread.start()
+        return thread
+    
     def process_single_document(
         self,
         file,
@@ -129,12 +168,15 @@ class DoclingGutenOCRUI:
         extract_structure: bool,
         extract_tables: bool,
         ocr_images: bool,
+        time_budget: float = 0,
         progress=gr.Progress()
     ) -> str:
         """Batch process documents from input directory"""
         if self.processor is None:
             return "❌ Please initialize the processor first!"
         
+        cancel_token = CancellationToken()
+        self.active_tokens.add(cancel_token)
         try:
             progress(0.1, desc="Discovering files...")
             
@@ -144,7 +186,9 @@ class DoclingGutenOCRUI:
                 output_dir=str(self.output_dir),
                 extract_structure=extract_structure,
                 extract_tables=extract_tables,
-                ocr_images=ocr_images
+                ocr_images=ocr_images,
+                time_budget=time_budget or None,
+                cancel_token=cancel_token
             )
             
             progress(0.9, desc="Generating summary...")
@@ -168,6 +212,9 @@ class DoclingGutenOCRUI:
                 status = "✅" if result.get("success") else "❌"
                 filename = Path(result['file_path']).name
                 mode = result.get('metadata', {}).get('processing_mode', 'unknown')
+                ocr_status = result.get('metadata', {}).get('ocr_status')
+                if ocr_status and ocr_status != "completed":
+                    mode += f", OCR {ocr_status.replace('_', ' ')}"
                 summary += f"\n{status} {filename} ({mode})"
             
             progress(1.0, desc="Complete!")
@@ -176,6 +223,16 @@ class DoclingGutenOCRUI:
         except Exception as e:
             logger.error(f"Batch processing error: {e}")
             return f"❌ Error: {str(e)}"
+        
+        finally:
+            self.active_tokens.discard(cancel_token)
+    
+    def cancel_processing(self) -> str:
+        """Cancel every running batch started from this UI"""
+        tokens = list(self.active_tokens)
+        for token in tokens:
+            token.cancel()
+        return f"⏹ Cancellation requested for {len(tokens)} running batch(es)"
     
     def _format_result(self, result: Dict[str, Any]) -> str:
         """Format processing result for display"""
@@ -262,13 +319,19 @@ class DoclingGutenOCRUI:
                         value=True,
                         info="Enable Docling for structure extraction"
                     )
+                    pixel_budget = gr.Dropdown(
+                        choices=["Default", "Fast", "Balanced", "Accurate"],
+                        value="Default",
+                        label="Pixel Budget",
+                        info="Smaller budgets mean fewer vision tokens and faster OCR"
+                    )
                 
                 init_button = gr.Button("Initialize Processor", variant="primary")
                 init_output = gr.Textbox(label="Status", lines=10)
                 
                 init_button.click(
                     fn=self.initialize_processor,
-                    inputs=[model_choice, use_cpu, use_docling],
+                    inputs=[model_choice, use_cpu, use_docling, pixel_budget],
                     outputs=init_output
                 )
                 
@@ -353,13 +416,25 @@ class DoclingGutenOCRUI:
                         label="Perform OCR",
                         value=True
                     )
+                    batch_time_budget = gr.Number(
+                        value=0,
+                        label="Time Budget per Document (s)",
+                        info="0 = unlimited; late documents keep their partial OCR text"
+                    )
                 
-                batch_button = gr.Button("Start Batch Processing", variant="primary")
+                with gr.Row():
+                    batch_button = gr.Button("Start Batch Processing", variant="primary")
+                    batch_stop_button = gr.Button("Stop", variant="stop")
                 batch_output = gr.Textbox(label="Results", lines=20)
                 
                 batch_button.click(
                     fn=self.batch_process_documents,
-                    inputs=[batch_extract_structure, batch_extract_tables, batch_ocr_images],
+                    inputs=[batch_extract_structure, batch_extract_tables, batch_ocr_images, batch_time_budget],
+                    outputs=batch_output
+                )
+                
+                batch_stop_button.click(
+                    fn=self.cancel_processing,
                     outputs=batch_output
                 )
             
@@ -426,9 +501,12 @@ class DoclingGutenOCRUI:
         server_port: int = 7861,
         share: bool = False
     ):
-        """Launch the Gradio interface"""
+        """Launch the Gradio interface with /healthz and /ready probes"""
         interface = self.create_interface()
-        interface.launch(
+        interface.queue(default_concurrency_limit=8)
+        launch_with_probes(
+            interface,
+            self.readiness,
             server_name=server_name,
             server_port=server_port,
             share=share
@@ -443,10 +521,19 @@ def main():
     parser.add_argument("--host", default="0.0.0.0", help="Server host")
     parser.add_argument("--port", type=int, default=7861, help="Server port")
     parser.add_argument("--share", action="store_true", help="Create public link")
+    parser.add_argument("--model", default="GutenOCR-3B", choices=["GutenOCR-3B", "GutenOCR-7B"], help="Model loaded at startup")
+    parser.add_argument("--cpu", action="store_true", help="Force CPU usage")
+    parser.add_argument("--no-preload", action="store_true", help="Wait for the UI button instead of loading a model at startup")
+    
+    parser.add_argument("--idle-unload-seconds", type=float, default=float(os.environ.get("GUTENOCR_IDLE_UNLOAD_SECONDS", 0)) or None, help="Unload the model after this many idle seconds (reloaded on the next request)")
     
     args = parser.parse_args()
     
-    ui = DoclingGutenOCRUI()
+    ui = DoclingGutenOCRUI(idle_unload_seconds=args.idle_unload_seconds)
+    if args.no_preload:
+        ui.readiness.mark_idle()
+    else:
+        ui.preload(args.model, args.cpu)
     ui.launch(
         server_name=args.host,
         server_port=args.port,
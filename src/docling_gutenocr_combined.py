@@ -4,11 +4,13 @@ Combined Docling + GutenOCR Application
 Integrates Docling's document processing with GutenOCR's OCR capabilities
 """
 import os
-import json
+import time
+import itertools
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 import logging
+import torch
 
 try:
     from docling.document_converter import DocumentConverter
@@ -21,7 +23,14 @@ except ImportError:
     logging.warning("Docling not available. Install with: pip install docling")
 
 from gutenocr_engine import GutenOCREngine
-from file_processor import FileProcessor
+from file_processor import FileProcessor, shard_suffix
+from result_sink import JSONLResultSink, ResultStatistics
+from run_manifest import RunManifest, is_finished
+from work_queue import LeaseWorkQueue
+from ocr_scheduler import OCRScheduler
+from model_registry import get_registry
+from worker_pool import OCRWorkerPool
+from stopping_criteria import CancellationToken
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -36,7 +45,16 @@ class DoclingGutenOCRProcessor:
         self,
         gutenocr_model: str = "rootsautomation/GutenOCR-3B",
         use_cpu: bool = False,
-        use_docling: bool = True
+        use_docling: bool = True,
+        cache_dir: Optional[str] = None,
+        pixel_preset: Optional[str] = None,
+        quantization: Optional[str] = None,
+        torch_dtype: Optional[str] = None,
+        compiled: bool = False,
+        idle_unload_seconds: Optional[float] = None,
+        workers: int = 0,
+        threads_per_worker: Optional[int] = None,
+        docling_threads: Optional[int] = None
     ):
         """
         Initialize combined processor
@@ -45,20 +63,74 @@ class DoclingGutenOCRProcessor:
             gutenocr_model: GutenOCR model to use
             use_cpu: Force CPU usage
             use_docling: Whether to use Docling (if available)
+            cache_dir: Directory for the OCR result cache (None disables caching)
+            pixel_preset: Pixel budget preset for OCR ('fast', 'balanced', 'accurate')
+            quantization: CPU quantization mode for GutenOCR (None or 'int8-dynamic')
+            torch_dtype: GutenOCR dtype name ('float32', 'bfloat16'); None picks per device
+            compiled: Run GutenOCR with a static KV cache and compiled decoder
+            idle_unload_seconds: Unload GutenOCR weights after this many idle seconds
+            workers: Run OCR in this many CPU worker processes (0 or 1: in-process)
+            threads_per_worker: CPU cores per worker (default: even split per NUMA node)
+            docling_threads: Cores for Docling's layout/table models. With workers
+                they are kept out of the OCR slices (default: 1/8 of the cores);
+                in-process Docling on CPU takes turns with OCR on all cores
         """
-        # Initialize GutenOCR
-        self.gutenocr = GutenOCREngine(
-            model_id=gutenocr_model,
-            use_cpu=use_cpu
-        )
+        self.gutenocr_model = gutenocr_model
+        # Applied per request, since the engine may be shared
+        self.pixel_preset = pixel_preset
+        self.gutenocr = None
+        self.scheduler = None
+        self.worker_pool = None
+        self.use_docling = use_docling and DOCLING_AVAILABLE
+        self.docling_cpus: Optional[List[int]] = None
+        self.docling_threads: Optional[int] = None
+        if workers > 1:
+            if self.use_docling:
+                # Keep the last cores for Docling so it never competes with an OCR worker
+                allowed = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+                count = docling_threads or max(1, len(allowed) // 8)
+                self.docling_cpus = allowed[-count:]
+            # Each worker loads its own engine; none is needed in this process
+            self.worker_pool = OCRWorkerPool(
+                model_id=gutenocr_model,
+                num_workers=workers,
+                threads_per_worker=threads_per_worker,
+                engine_kwargs={
+                    "torch_dtype": getattr(torch, torch_dtype) if torch_dtype else None,
+                    "quantization": quantization,
+                    "cache_dir": cache_dir,
+                    "compiled": compiled
+                },
+                exclude_cpus=self.docling_cpus or ()
+            )
+            if self.docling_cpus and hasattr(os, "sched_setaffinity"):
+                # Workers are already pinned; confine this process to the Docling cores
+                os.sched_setaffinity(0, self.docling_cpus)
+                torch.set_num_threads(len(self.docling_cpus))
+        else:
+            # Share an already-loaded GutenOCR engine when one matches
+            self.gutenocr = get_registry().acquire(
+                model_id=gutenocr_model,
+                use_cpu=use_cpu,
+                torch_dtype=getattr(torch, torch_dtype) if torch_dtype else None,
+                quantization=quantization,
+                cache_dir=cache_dir,
+                compiled=compiled,
+                idle_unload_seconds=idle_unload_seconds
+            )
+            # Concurrent process_document calls share generate batches
+            self.scheduler = OCRScheduler(self.gutenocr)
         
         # Initialize Docling if available and requested
-        self.use_docling = use_docling and DOCLING_AVAILABLE
         if self.use_docling:
             try:
                 pipeline_options = PdfPipelineOptions()
                 pipeline_options.do_ocr = False  # We'll use GutenOCR for OCR
                 pipeline_options.do_table_structure = True
+                self._limit_docling_threads(
+                    pipeline_options,
+                    len(self.docling_cpus) if self.docling_cpus else torch.get_num_threads()
+                )
                 
                 self.docling_converter = DocumentConverter(
                     allowed_formats=[
@@ -83,12 +155,26 @@ class DoclingGutenOCRProcessor:
         
         self.file_processor = FileProcessor()
     
+    def _limit_docling_threads(self, pipeline_options, num_threads: int):
+        """Cap Docling's model threads so it does not oversubscribe the OCR cores"""
+        try:
+            from docling.datamodel.pipeline_options import AcceleratorOptions
+        except ImportError:
+            logger.info("This Docling version has no AcceleratorOptions; its thread count is not capped")
+            return
+        pipeline_options.accelerator_options = AcceleratorOptions(num_threads=num_threads)
+        self.docling_threads = num_threads
+        logger.info(f"Docling limited to {num_threads} threads")
+    
     def process_document(
         self,
         file_path: str,
         extract_structure: bool = True,
         extract_tables: bool = True,
-        ocr_images: bool = True
+        ocr_images: bool = True,
+        deadline: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        ocr_result: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Process a document with combined Docling + GutenOCR
@@ -98,6 +184,9 @@ class DoclingGutenOCRProcessor:
             extract_structure: Extract document structure with Docling
             extract_tables: Extract tables with Docling
             ocr_images: Perform OCR on images with GutenOCR
+            deadline: time.monotonic() value after which OCR stops with partial text
+            cancel_token: Token the caller can cancel to stop OCR early
+            ocr_result: OCR result computed elsewhere (e.g. by the worker pool)
         
         Returns:
             Combined processing results
@@ -115,23 +204,21 @@ class DoclingGutenOCRProcessor:
             # Step 1: Process with Docling if available
             if self.use_docling and extract_structure:
                 logger.info(f"Processing with Docling: {file_path}")
-                docling_result = self._process_with_docling(
-                    file_path,
-                    extract_tables=extract_tables
-                )
+                docling_result = self._run_docling(file_path, extract_tables)
                 result["docling_structure"] = docling_result
                 result["metadata"]["docling_processed"] = True
             
             # Step 2: Process with GutenOCR
             if ocr_images:
                 logger.info(f"Processing with GutenOCR: {file_path}")
-                ocr_result = self.gutenocr.process_image(
-                    image_path=file_path,
-                    task_type="reading",
-                    output_format="TEXT2D"
-                )
+                if ocr_result is None:
+                    ocr_result = self._ocr(file_path, deadline, cancel_token)
                 result["gutenocr_ocr"] = ocr_result
                 result["metadata"]["gutenocr_processed"] = True
+                # An OCR error dict carries no status; mark it so resume retries the file
+                result["metadata"]["ocr_status"] = ocr_result.get("status") or (
+                    None if ocr_result.get("success") else "failed"
+                )
                 
                 if ocr_result.get("success"):
                     result["combined_text"] = ocr_result.get("text", "")
@@ -159,6 +246,15 @@ class DoclingGutenOCRProcessor:
         
         return result
     
+    def _run_docling(self, file_path: str, extract_tables: bool) -> Dict[str, Any]:
+        """Run Docling, taking turns with in-process CPU OCR"""
+        if self.gutenocr is not None and self.gutenocr.use_cpu:
+            # Both use torch's process-wide pool sized to every core; while the
+            # scheduler OCRs ahead they would run 2N threads on N cores
+            with self.gutenocr.exclusive():
+                return self._process_with_docling(file_path, extract_tables=extract_tables)
+        return self._process_with_docling(file_path, extract_tables=extract_tables)
+    
     def _process_with_docling(
         self,
         file_path: str,
@@ -233,62 +329,269 @@ class DoclingGutenOCRProcessor:
         
         return "\n".join(merged_text)
     
+    def _ocr(
+        self,
+        file_path: str,
+        deadline: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        """OCR one document in-process or on the worker pool"""
+        if self.worker_pool is not None:
+            return self.worker_pool.map(
+                [file_path],
+                task_type="reading",
+                output_format="TEXT2D",
+                pixel_preset=self.pixel_preset,
+                time_budget=max(0.0, deadline - time.monotonic()) if deadline else None
+            )[0]
+        return self.scheduler.process_image(
+            image_path=file_path,
+            task_type="reading",
+            output_format="TEXT2D",
+            pixel_preset=self.pixel_preset,
+            deadline=deadline,
+            cancel_token=cancel_token
+        )
+    
     def batch_process(
         self,
         input_dir: str = "./input",
         output_dir: str = "./output",
         extract_structure: bool = True,
         extract_tables: bool = True,
-        ocr_images: bool = True
+        ocr_images: bool = True,
+        time_budget: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        prefetch_depth: int = 2,
+        flush_every: int = 100,
+        resume: bool = False,
+        shared_queue: bool = False,
+        lease_seconds: float = 300.0,
+        shard_index: int = 0,
+        shard_count: int = 1
     ) -> List[Dict[str, Any]]:
         """
         Batch process documents
         
+        Collects iter_batch_process into a list; use iter_batch_process
+        directly to keep memory flat on large corpora.
+        
         Args:
             input_dir: Input directory
             output_dir: Output directory
             extract_structure: Extract structure with Docling
             extract_tables: Extract tables
             ocr_images: Perform OCR
+            time_budget: Seconds each document may take before OCR is cut short
+            cancel_token: Token that stops the remaining work when cancelled
+            prefetch_depth: Documents queued for in-process OCR ahead of the one
+                Docling is working on
+            flush_every: Results between flushes of the JSON Lines output
+            resume: Skip files the output directory's manifest records as
+                finished with the same model and options
+            shared_queue: Claim files through the output directory's work queue,
+                so replicas running the same batch split it between them
+            lease_seconds: How long a claim survives without renewal
+            shard_index: Process only this shard of the input (see file_processor.shard_of)
+            shard_count: Number of shards the input is split into; each shard
+                writes its own results file and manifest
         
         Returns:
             List of processing results
         """
+        return list(self.iter_batch_process(
+            input_dir=input_dir,
+            output_dir=output_dir,
+            extract_structure=extract_structure,
+            extract_tables=extract_tables,
+            ocr_images=ocr_images,
+            time_budget=time_budget,
+            cancel_token=cancel_token,
+            prefetch_depth=prefetch_depth,
+            flush_every=flush_every,
+            resume=resume,
+            shared_queue=shared_queue,
+            lease_seconds=lease_seconds,
+            shard_index=shard_index,
+            shard_count=shard_count
+        ))
+    
+    def iter_batch_process(
+        self,
+        input_dir: str = "./input",
+        output_dir: str = "./output",
+        extract_structure: bool = True,
+        extract_tables: bool = True,
+        ocr_images: bool = True,
+        time_budget: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        prefetch_depth: int = 2,
+        flush_every: int = 100,
+        resume: bool = False,
+        shared_queue: bool = False,
+        lease_seconds: float = 300.0,
+        shard_index: int = 0,
+        shard_count: int = 1
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Batch process documents, streaming each result to disk as it completes
+        
+        Results are appended to ``combined_results_<timestamp>.jsonl`` (with a
+        ``_shardNNNofMMM`` suffix when sharded) in the output directory, one
+        line per document, and yielded in file order.
+        Every finished document is also recorded in the run manifest, so a
+        restarted run with ``resume`` only processes new or changed files.
+        
+        Takes the same arguments as batch_process.
+        
+        Yields:
+            One processing result per document
+        """
         # Update file processor directories
         self.file_processor.input_dir = Path(input_dir)
         self.file_processor.output_dir = Path(output_dir)
         
         # Discover files
-        files = self.file_processor.discover_images(recursive=True)
+        files = self.file_processor.discover_images(
+            recursive=True, shard_index=shard_index, shard_count=shard_count
+        )
+        suffix = shard_suffix(shard_index, shard_count)
+        manifest = RunManifest(
+            output_dir,
+            input_dir,
+            self.gutenocr_model,
+            options={
+                "use_docling": self.use_docling,
+                "extract_structure": extract_structure,
+                "extract_tables": extract_tables,
+                "ocr_images": ocr_images,
+                "pixel_preset": self.pixel_preset
+            },
+            name=f"processed_manifest{suffix}.jsonl"
+        )
+        if resume:
+            files = (file_path for file_path in files if not manifest.is_done(file_path))
+        work_queue = None
+        if shared_queue:
+            work_queue = self.file_processor.open_work_queue(
+                options={"model_id": self.gutenocr_model, **manifest.options},
+                lease_seconds=lease_seconds
+            )
+            files = work_queue.claim_iter(files)
+        
+        # Workers OCR ahead while Docling runs here; results arrive in file order
+        ocr_results = None
+        if ocr_images and (self.worker_pool is not None or prefetch_depth > 0):
+            files, ocr_files = itertools.tee(files)
+        if ocr_images and self.worker_pool is not None:
+            ocr_results = self.worker_pool.imap(
+                ocr_files,
+                task_type="reading",
+                output_format="TEXT2D",
+                pixel_preset=self.pixel_preset,
+                time_budget=time_budget
+            )
+        elif ocr_images and prefetch_depth > 0:
+            # The scheduler prepares and runs these while Docling works on earlier files
+            ocr_results = self.scheduler.imap(
+                ocr_files,
+                window=prefetch_depth + 1,
+                task_type="reading",
+                output_format="TEXT2D",
+                pixel_preset=self.pixel_preset,
+                cancel_token=cancel_token,
+                time_budget=time_budget
+            )
         
-        results = []
+        try:
+            with self.file_processor.open_result_sink(
+                f"combined_results{suffix}", flush_every=flush_every, text_key="combined_text"
+            ) as sink:
+                yield from self._process_files(
+                    files, ocr_results, sink, manifest, work_queue,
+                    extract_structure, extract_tables, ocr_images, time_budget, cancel_token
+                )
+        finally:
+            manifest.close()
+            if resume:
+                logger.info(f"Resume: {manifest.get_stats()}")
+            if work_queue is not None:
+                # Unfinished claims go back to the other replicas
+                work_queue.close()
+                logger.info(f"Work queue: {work_queue.get_stats()}")
+    
+    def _process_files(
+        self,
+        files: Iterable[str],
+        ocr_results: Optional[Iterator[Dict[str, Any]]],
+        sink: JSONLResultSink,
+        manifest: RunManifest,
+        work_queue: Optional[LeaseWorkQueue],
+        extract_structure: bool,
+        extract_tables: bool,
+        ocr_images: bool,
+        time_budget: Optional[float],
+        cancel_token: Optional[CancellationToken]
+    ) -> Iterator[Dict[str, Any]]:
+        """Run Docling (and in-line OCR) per file, streaming and recording each result"""
+        # Files are recorded as finished only once their result line is flushed,
+        # so a crash re-does a file rather than losing its result
+        unrecorded = []
         for file_path in files:
+            if self.worker_pool is not None and cancel_token is not None and cancel_token.cancelled:
+                self.worker_pool.cancel()
             logger.info(f"Processing: {file_path}")
             result = self.process_document(
                 file_path,
                 extract_structure=extract_structure,
                 extract_tables=extract_tables,
-                ocr_images=ocr_images
+                ocr_images=ocr_images,
+                deadline=time.monotonic() + time_budget if time_budget else None,
+                cancel_token=cancel_token,
+                ocr_result=next(ocr_results) if ocr_results is not None else None
             )
-            results.append(result)
-        
-        # Save results
-        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_path = Path(output_dir) / f"combined_results_{timestamp_str}.json"
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
-        
-        logger.info(f"Results saved to: {output_path}")
-        
-        return results
+            unrecorded.append((file_path, result))
+            if sink.write(result):
+                self._record_finished(unrecorded, manifest, work_queue)
+            yield result
+        sink.flush()
+        self._record_finished(unrecorded, manifest, work_queue)
+    
+    def _record_finished(
+        self,
+        finished: List[Tuple[str, Dict[str, Any]]],
+        manifest: RunManifest,
+        work_queue: Optional[LeaseWorkQueue]
+    ):
+        """Record results that are now flushed to disk, then forget them"""
+        for file_path, result in finished:
+            manifest.record(file_path, result)
+            if work_queue is None:
+                continue
+            # Failed and partial results go back to the queue to be retried
+            if is_finished(result):
+                work_queue.complete(file_path, result)
+            else:
+                work_queue.release(file_path)
+        finished.clear()
+    
+    def close(self):
+        """Stop the OCR scheduler or worker pool and hand the engine back to the registry"""
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown()
+            return
+        self.scheduler.shutdown()
+        get_registry().release(self.gutenocr)
     
     def get_capabilities(self) -> Dict[str, Any]:
         """Get information about available capabilities"""
         return {
             "docling_available": self.use_docling,
-            "gutenocr_model": self.gutenocr.model_id,
-            "device_info": self.gutenocr.get_device_info(),
+            "gutenocr_model": self.gutenocr_model,
+            "device_info": self.gutenocr.get_device_info() if self.gutenocr else None,
+            "worker_pool": self.worker_pool.get_stats() if self.worker_pool else None,
+            "docling_threads": self.docling_threads,
+            "docling_cpus": self.docling_cpus,
             "supported_formats": [
                 "PDF", "DOCX", "PPTX", "PNG", "JPG", "JPEG",
                 "TIFF", "BMP", "GIF", "WEBP", "HTML", "MD"
@@ -311,6 +614,21 @@ def main():
     parser.add_argument("--no-structure", action="store_true", help="Skip structure extraction")
     parser.add_argument("--no-tables", action="store_true", help="Skip table extraction")
     parser.add_argument("--no-ocr", action="store_true", help="Skip OCR")
+    parser.add_argument("--pixel-preset", choices=list(GutenOCREngine.PIXEL_PRESETS), default=None, help="Pixel budget preset for OCR")
+    parser.add_argument("--quantization", choices=["int8-dynamic"], default=None, help="Quantize the language model on CPU")
+    parser.add_argument("--dtype", choices=["auto", "float32", "bfloat16"], default="auto", help="GutenOCR dtype (auto: bf16 on CPUs with native support)")
+    parser.add_argument("--compile", action="store_true", help="Compile the decoder with a static KV cache (slower startup, faster decoding)")
+    parser.add_argument("--workers", type=int, default=0, help="OCR worker processes on CPU (0 = single in-process engine)")
+    parser.add_argument("--threads-per-worker", type=int, default=None, help="CPU cores per OCR worker (default: even split per NUMA node)")
+    parser.add_argument("--docling-threads", type=int, default=None, help="Cores reserved for Docling when --workers is used")
+    parser.add_argument("--time-budget", type=float, default=None, help="Seconds allowed per document before OCR returns partial text")
+    parser.add_argument("--cache-dir", default=None, help="OCR result cache directory (e.g. ./output/.ocr_cache)")
+    parser.add_argument("--flush-every", type=int, default=100, help="Results between flushes of the JSON Lines output")
+    parser.add_argument("--resume", action="store_true", help="Skip files finished by an earlier run with the same settings")
+    parser.add_argument("--shared-queue", action="store_true", help="Split the batch with other replicas through lease files in the output directory")
+    parser.add_argument("--lease-seconds", type=float, default=300.0, help="How long a claimed file stays leased without renewal")
+    parser.add_argument("--shard-index", type=int, default=int(os.environ.get("JOB_COMPLETION_INDEX", 0)), help="Shard of the input to process (default: JOB_COMPLETION_INDEX)")
+    parser.add_argument("--shard-count", type=int, default=1, help="Number of shards the input is split into")
     
     args = parser.parse_args()
     
@@ -318,7 +636,15 @@ def main():
     processor = DoclingGutenOCRProcessor(
         gutenocr_model=args.model,
         use_cpu=args.cpu,
-        use_docling=not args.no_docling
+        use_docling=not args.no_docling,
+        cache_dir=args.cache_dir,
+        pixel_preset=args.pixel_preset,
+        quantization=args.quantization,
+        torch_dtype=None if args.dtype == "auto" else args.dtype,
+        compiled=args.compile,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        docling_threads=args.docling_threads
     )
     
     # Print capabilities
@@ -328,21 +654,32 @@ def main():
         print(f"{key}: {value}")
     print()
     
-    # Process documents
-    results = processor.batch_process(
+    # Process documents; results stream to disk and only the counts stay in memory
+    statistics = ResultStatistics(text_key="combined_text")
+    for result in processor.iter_batch_process(
         input_dir=args.input,
         output_dir=args.output,
         extract_structure=not args.no_structure,
         extract_tables=not args.no_tables,
-        ocr_images=not args.no_ocr
-    )
+        ocr_images=not args.no_ocr,
+        time_budget=args.time_budget,
+        flush_every=args.flush_every,
+        resume=args.resume,
+        shared_queue=args.shared_queue,
+        lease_seconds=args.lease_seconds,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count
+    ):
+        statistics.add(result)
+    
+    processor.close()
     
     # Print summary
-    successful = sum(1 for r in results if r.get("success"))
+    summary = statistics.summary()
     print(f"\n=== Processing Complete ===")
-    print(f"Total files: {len(results)}")
-    print(f"Successful: {successful}")
-    print(f"Failed: {len(results) - successful}")
+    print(f"Total files: {summary['total_images']}")
+    print(f"Successful: {summary['successful']}")
+    print(f"Failed: {summary['failed']}")
 
 
 if __name__ == "__main__":
@@ -4,15 +4,38 @@ File Processor - Handles recursive file discovery and output management
 """
 import os
 import json
+import hashlib
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 import logging
 
+from result_sink import JSONLResultSink, ResultStatistics
+from work_queue import LeaseWorkQueue
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def shard_of(relative_path: str, shard_count: int) -> int:
+    """
+    Stable shard number for a path relative to the input directory
+    
+    Based on a hash of the path alone, so adding or removing other files
+    never moves a file to another shard.
+    """
+    normalized = relative_path.replace(os.sep, '/')
+    digest = hashlib.sha256(normalized.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+
+def shard_suffix(shard_index: int, shard_count: int) -> str:
+    """File name suffix for one shard's outputs ('' when the input is not sharded)"""
+    if shard_count <= 1:
+        return ""
+    return f"_shard{shard_index:03d}of{shard_count:03d}"
+
+
 class FileProcessor:
     """
     Handles file discovery and output management for OCR processing
@@ -35,45 +58,152 @@ class FileProcessor:
         self.input_dir.mkdir(parents=True, exist_ok=True)
         self.output_dir.mkdir(parents=True, exist_ok=True)
     
-    def discover_images(self, recursive: bool = True) -> List[str]:
+    def discover_images(
+        self,
+        recursive: bool = True,
+        sort: bool = True,
+        skip_hidden: bool = True,
+        exclude_dirs: Optional[Iterable[str]] = None,
+        shard_index: int = 0,
+        shard_count: int = 1
+    ) -> Iterator[str]:
         """
         Discover all supported image files in input directory
         
+        The tree is walked once with os.scandir and paths are yielded as they
+        are found, so a large input volume never has to be listed up front.
+        Extensions match case-insensitively ('.Jpg' counts).
+        
         Args:
             recursive: Whether to search recursively
+            sort: Yield each directory's files, then its subdirectories, in
+                name order (sorts one directory at a time, not the whole tree)
+            skip_hidden: Skip files and directories whose name starts with '.'
+            exclude_dirs: Directory names to skip wherever they occur
+            shard_index: Only yield files of this shard (see shard_of)
+            shard_count: Number of shards the input is split into
+        
+        Yields:
+            Image file paths
+        """
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"shard_index must be in [0, {shard_count}), got {shard_index}")
+        excluded = set(exclude_dirs or ())
+        root = str(self.input_dir)
+        pending = [root]
+        count = 0
+        
+        while pending:
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it) if sort else it
+                    if sort:
+                        entries.sort(key=lambda entry: entry.name)
+                    subdirs = []
+                    for entry in entries:
+                        if skip_hidden and entry.name.startswith('.'):
+                            continue
+                        try:
+                            # Symlinked directories are not followed, as with rglob
+                            if entry.is_dir(follow_symlinks=False):
+                                if recursive and entry.name not in excluded:
+                                    subdirs.append(entry.path)
+                                continue
+                            if not entry.is_file():
+                                continue
+                        except OSError:
+                            continue
+                        if os.path.splitext(entry.name)[1].lower() not in self.SUPPORTED_EXTENSIONS:
+                            continue
+                        if shard_count > 1 and shard_of(os.path.relpath(entry.path, root), shard_count) != shard_index:
+                            continue
+                        count += 1
+                        yield entry.path
+            except OSError as e:
+                logger.warning(f"Cannot scan {directory}: {e}")
+                continue
+            # Stack order: reversed so subdirectories are visited in name order
+            pending.extend(reversed(subdirs))
+        
+        shard = f" (shard {shard_index}/{shard_count})" if shard_count > 1 else ""
+        logger.info(f"Discovered {count} image files{shard}")
+    
+    def open_result_sink(
+        self,
+        name: str = "ocr_results",
+        timestamp: bool = True,
+        flush_every: int = 100,
+        flush_seconds: float = 10.0,
+        text_key: str = "text"
+    ) -> JSONLResultSink:
+        """
+        Open a JSON Lines file in the output directory for streaming results
+        
+        Args:
+            name: File name stem
+            timestamp: Whether to include timestamp in filename
+            flush_every: Flush after this many results
+            flush_seconds: Flush at least this often while results arrive
+            text_key: Result field holding the extracted text
         
         Returns:
-            List of image file paths
+            Sink to write() each result to as it completes
         """
-        image_files = []
+        if timestamp:
+            name = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        return JSONLResultSink(
+            str(self.output_dir / f"{name}.jsonl"),
+            flush_every=flush_every,
+            flush_seconds=flush_seconds,
+            text_key=text_key
+        )
+    
+    def open_work_queue(
+        self,
+        options: Optional[Dict[str, Any]] = None,
+        lease_seconds: float = 300.0,
+        queue_dir: Optional[str] = None
+    ) -> LeaseWorkQueue:
+        """
+        Open the work queue replicas use to split batches over this input directory
         
-        if recursive:
-            for ext in self.SUPPORTED_EXTENSIONS:
-                image_files.extend(self.input_dir.rglob(f"*{ext}"))
-                image_files.extend(self.input_dir.rglob(f"*{ext.upper()}"))
-        else:
-            for ext in self.SUPPORTED_EXTENSIONS:
-                image_files.extend(self.input_dir.glob(f"*{ext}"))
-                image_files.extend(self.input_dir.glob(f"*{ext.upper()}"))
+        Replicas running with the same options share one queue; different
+        options (another task or model) get their own.
         
-        # Convert to strings and sort
-        image_files = sorted([str(f) for f in image_files])
+        Args:
+            options: Settings that change the output, hashed into the queue name
+            lease_seconds: How long a claim survives without renewal
+            queue_dir: Shared directory for lease files (default: output_dir/.work_queue)
         
-        logger.info(f"Discovered {len(image_files)} image files")
-        return image_files
+        Returns:
+            Queue whose claim_iter() filters discover_images() down to this replica's share
+        """
+        namespace = hashlib.sha256(
+            json.dumps(options or {}, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()[:16]
+        return LeaseWorkQueue(
+            queue_dir or str(self.output_dir / ".work_queue"),
+            str(self.input_dir),
+            namespace=namespace,
+            lease_seconds=lease_seconds
+        )
     
     def save_results(
         self,
-        results: List[Dict[str, Any]],
+        results: Iterable[Dict[str, Any]],
         format: str = "json",
         timestamp: bool = True
     ) -> str:
         """
         Save OCR results to output directory
         
+        Results are written one at a time, so a generator is never
+        materialised.
+        
         Args:
-            results: List of OCR results
-            format: Output format ('json', 'txt', 'csv')
+            results: OCR results (list or generator)
+            format: Output format ('json', 'jsonl', 'txt', 'csv')
             timestamp: Whether to include timestamp in filename
         
         Returns:
@@ -86,10 +216,23 @@ class FileProcessor:
         else:
             filename = "ocr_results"
         
+        if format == "jsonl":
+            with self.open_result_sink(filename, timestamp=False) as sink:
+                for result in results:
+                    sink.write(result)
+            return str(sink.path)
+        
         if format == "json":
             output_path = self.output_dir / f"{filename}.json"
             with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+                # Same layout as json.dump(indent=2), one element at a time
+                f.write("[")
+                empty = True
+                for result in results:
+                    element = json.dumps(result, indent=2, ensure_ascii=False)
+                    f.write(("\n  " if empty else ",\n  ") + element.replace("\n", "\n  "))
+                    empty = False
+                f.write("]" if empty else "\n]")
         
         elif format == "txt":
             output_path = self.output_dir / f"{filename}.txt"
@@ -107,10 +250,13 @@ class FileProcessor:
         elif format == "csv":
             import csv
             output_path = self.output_dir / f"{filename}.csv"
+            results = iter(results)
+            first = next(results, None)
             with open(output_path, 'w', newline='', encoding='utf-8') as f:
-                if results:
-                    writer = csv.DictWriter(f, fieldnames=results[0].keys())
+                if first is not None:
+                    writer = csv.DictWriter(f, fieldnames=first.keys())
                     writer.writeheader()
+                    writer.writerow(first)
                     writer.writerows(results)
         
         logger.info(f"Results saved to: {output_path}")
@@ -162,32 +308,20 @@ class FileProcessor:
         
         return saved_files
     
-    def get_statistics(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def get_statistics(self, results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Generate statistics from OCR results
         
         Args:
-            results: List of OCR results
+            results: OCR results (list or generator)
         
         Returns:
             Dictionary with statistics
         """
-        total = len(results)
-        successful = sum(1 for r in results if r.get('success'))
-        failed = total - successful
-        
-        total_chars = sum(len(r.get('text', '')) for r in results if r.get('success'))
-        avg_chars = total_chars / successful if successful > 0 else 0
-        
-        return {
-            "total_images": total,
-            "successful": successful,
-            "failed": failed,
-            "success_rate": f"{(successful/total*100):.2f}%" if total > 0 else "0%",
-            "total_characters": total_chars,
-            "average_characters_per_image": f"{avg_chars:.2f}",
-            "timestamp": datetime.now().isoformat()
-        }
+        statistics = ResultStatistics()
+        for result in results:
+            statistics.add(result)
+        return statistics.summary()
     
     def create_summary_report(
         self,
@@ -5,10 +5,16 @@ Gradio UI for GutenOCR Application
 import gradio as gr
 import os
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Tuple, Iterator, Optional
 import logging
-from gutenocr_engine import GutenOCREngine
+import threading
 from file_processor import FileProcessor
+from ocr_scheduler import OCRScheduler
+from model_registry import get_registry
+from worker_pool import OCRWorkerPool
+from stopping_criteria import CancellationToken
+from run_manifest import is_finished
+from readiness import ReadinessState, launch_with_probes
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,16 +25,27 @@ class GutenOCRUI:
     Gradio-based UI for GutenOCR
     """
     
-    def __init__(self):
+    def __init__(self, idle_unload_seconds: Optional[float] = None):
         self.engine = None
+        # Engines loaded from this UI release their weights after this much idle time
+        self.idle_unload_seconds = idle_unload_seconds
+        self.scheduler = None
         self.file_processor = FileProcessor()
+        # Multi-process CPU pool for the batch tab, created on first use
+        self.worker_pool = None
+        self.model_id = None
         self.current_model = None
         self.use_cpu = False
+        # Tokens for requests still running, so "Stop" can cancel them
+        self.active_tokens = set()
+        # Backs the /ready probe: false only while a model is loading
+        self.readiness = ReadinessState()
     
     def initialize_engine(
         self,
         model_choice: str,
-        use_cpu: bool
+        use_cpu: bool,
+        quantize_int8: bool = False
     ) -> str:
         """Initialize the OCR engine"""
         try:
@@ -40,20 +57,53 @@ class GutenOCRUI:
             model_id = model_map.get(model_choice, "rootsautomation/GutenOCR-3B")
             
             logger.info(f"Initializing engine with model: {model_id}, CPU: {use_cpu}")
-            self.engine = GutenOCREngine(
+            self.readiness.mark_loading(model_id)
+            if self.scheduler is not None:
+                self.scheduler.shutdown()
+                self.scheduler = None
+            # Hand the old model back first so the registry can free it before loading
+            if self.engine is not None:
+                get_registry().release(self.engine)
+                self.engine = None
+            self.engine = get_registry().acquire(
                 model_id=model_id,
-                use_cpu=use_cpu
+                use_cpu=use_cpu,
+                quantization="int8-dynamic" if quantize_int8 else None,
+                cache_dir=str(self.file_processor.output_dir / ".ocr_cache"),
+                idle_unload_seconds=self.idle_unload_seconds
             )
+            # All UI requests share the engine through one batching scheduler
+            self.scheduler = OCRScheduler(self.engine)
             self.current_model = model_choice
+            self.model_id = model_id
             self.use_cpu = use_cpu
             
+            if not self.engine.warmed_up:
+                self.engine.warmup()
+            self.readiness.mark_ready(
+                model_id=model_id,
+                warmup_seconds=self.engine.warmup_stats["warmup_seconds"]
+            )
+            
             device_info = self.engine.get_device_info()
             return f"✓ Model loaded successfully!\n\nDevice Info:\n{self._format_device_info(device_info)}"
         
         except Exception as e:
             logger.error(f"Error initializing engine: {e}")
+            self.readiness.mark_failed(str(e))
             return f"✗ Error loading model: {str(e)}"
     
+    def preload(self, model_choice: str = "GutenOCR-3B (Faster)", use_cpu: bool = False) -> threading.Thread:
+        """Load and warm up a model in the background while the UI starts serving"""
+        thread = threading.Thread(
+            target=self.initialize_engine,
+            args=(model_choice, use_cpu),
+            name="model-preload",
+            daemon=True
+        )
+        thread.start()
+        return thread
+    
     def _format_device_info(self, info: dict) -> str:
         """Format device information for display"""
         lines = []
@@ -61,65 +111,149 @@ class GutenOCRUI:
             lines.append(f"  {key.replace('_', ' ').title()}: {value}")
         return "\n".join(lines)
     
+    def _pixel_preset(self, pixel_budget: str):
+        """Map the UI pixel budget choice to an engine preset (None = engine default)"""
+        return None if pixel_budget == "Default" else pixel_budget.lower()
+    
     def process_single_image(
         self,
         image_path: str,
         task_type: str,
-        output_format: str
-    ) -> Tuple[str, str]:
-        """Process a single image"""
+        output_format: str,
+        pixel_budget: str = "Default"
+    ) -> Iterator[Tuple[str, str]]:
+        """Process a single image, streaming text into the output box as it is decoded"""
         if self.engine is None:
-            return "Error: Please initialize the model first!", ""
+            yield "Error: Please initialize the model first!", ""
+            return
         
+        cancel_token = CancellationToken()
+        self.active_tokens.add(cancel_token)
         try:
-            result = self.engine.process_image(
+            for update in self.engine.stream_image(
                 image_path=image_path,
                 task_type=task_type.lower().replace(" ", "_"),
-                output_format=output_format
-            )
-            
-            if result.get('success'):
-                text_output = result.get('text', '')
-                info = f"✓ Processing successful\n\nTask: {task_type}\nFormat: {output_format}\n\nCharacters: {len(text_output)}"
-                return text_output, info
-            else:
-                error_msg = result.get('error', 'Unknown error')
-                return f"Error: {error_msg}", "✗ Processing failed"
+                output_format=output_format,
+                pixel_preset=self._pixel_preset(pixel_budget),
+                cancel_token=cancel_token
+            ):
+                if not update.get('done'):
+                    yield update['text'], f"⏳ Processing...\n\nCharacters so far: {len(update['text'])}"
+                    continue
+                
+                result = update
+                if result.get('success'):
+                    text_output = result.get('text', '')
+                    status = result.get('status', 'completed')
+                    header = "✓ Processing successful" if status == "completed" else f"⚠ Partial result ({status.replace('_', ' ')})"
+                    info = f"{header}\n\nTask: {task_type}\nFormat: {output_format}\n\nCharacters: {len(text_output)}\nVision tokens: {result.get('vision_tokens', 'n/a')}"
+                    yield text_output, info
+                else:
+                    error_msg = result.get('error', 'Unknown error')
+                    yield f"Error: {error_msg}", "✗ Processing failed"
         
         except Exception as e:
             logger.error(f"Error processing image: {e}")
-            return f"Error: {str(e)}", "✗ Processing failed"
+            yield f"Error: {str(e)}", "✗ Processing failed"
+        
+        finally:
+            self.active_tokens.discard(cancel_token)
+    
+    def cancel_processing(self) -> str:
+        """Cancel every running request started from this UI"""
+        tokens = list(self.active_tokens)
+        for token in tokens:
+            token.cancel()
+        if self.worker_pool is not None:
+            self.worker_pool.cancel()
+        return f"Cancellation requested for {len(tokens)} running request(s)"
+    
+    def _get_worker_pool(self, workers: int) -> OCRWorkerPool:
+        """Return a worker pool of this size for the loaded model, restarting it if needed"""
+        pool = self.worker_pool
+        if pool is not None and (pool.model_id != self.model_id or pool.num_workers != workers):
+            if pool.busy:
+                # Never pull the pool out from under a batch that is still iterating it
+                raise RuntimeError(
+                    f"The {pool.num_workers}-worker pool is still running another batch; "
+                    f"wait for it or use the same worker count"
+                )
+            pool.shutdown()
+            pool = None
+        if pool is None:
+            pool = OCRWorkerPool(
+                model_id=self.model_id,
+                num_workers=workers,
+                engine_kwargs={"cache_dir": str(self.file_processor.output_dir / ".ocr_cache")}
+            )
+            self.worker_pool = pool
+        return pool
     
     def process_batch(
         self,
         task_type: str,
         output_format: str,
         save_format: str,
+        pixel_budget: str = "Default",
+        time_budget: float = 0,
+        workers: int = 0,
+        share_batch: bool = False,
         progress=gr.Progress()
     ) -> str:
         """Process all images in input directory"""
         if self.engine is None:
             return "Error: Please initialize the model first!"
         
+        cancel_token = CancellationToken()
+        self.active_tokens.add(cancel_token)
+        work_queue = None
         try:
             # Discover images
             progress(0, desc="Discovering images...")
+            options = {
+                "task_type": task_type.lower().replace(" ", "_"),
+                "output_format": output_format,
+                "pixel_preset": self._pixel_preset(pixel_budget),
+                "time_budget": time_budget or None
+            }
             image_files = self.file_processor.discover_images(recursive=True)
+            claimed = []
+            total = None
+            if share_batch:
+                # Other replicas pressing Start claim the files this one has not
+                work_queue = self.file_processor.open_work_queue(
+                    options={"model_id": self.model_id, **options}
+                )
+                image_files = (
+                    claimed.append(image_path) or image_path
+                    for image_path in work_queue.claim_iter(image_files)
+                )
+            else:
+                image_files = list(image_files)
+                total = len(image_files)
+                if not image_files:
+                    return "No images found in ./input directory"
             
-            if not image_files:
-                return "No images found in ./input directory"
+            workers = int(workers or 0)
+            if workers > 1:
+                progress(0, desc=f"Starting {workers} OCR workers...")
+                # Workers pull from one shared queue; results come back in file order
+                result_iter = self._get_worker_pool(workers).imap(image_files, **options)
+            else:
+                # Keep enough images queued for the scheduler to batch them
+                result_iter = self.scheduler.imap(image_files, cancel_token=cancel_token, **options)
             
             # Process images
             results = []
-            for idx, image_path in enumerate(image_files):
-                progress((idx + 1) / len(image_files), desc=f"Processing {idx + 1}/{len(image_files)}")
-                
-                result = self.engine.process_image(
-                    image_path=image_path,
-                    task_type=task_type.lower().replace(" ", "_"),
-                    output_format=output_format
-                )
+            for idx, result in enumerate(result_iter):
                 results.append(result)
+                if total:
+                    progress((idx + 1) / total, desc=f"Processing {idx + 1}/{total}")
+                else:
+                    progress((idx + 1, None), desc=f"Processed {idx + 1} (shared batch)")
+            
+            if not results:
+                return "No unclaimed images left in ./input (other replicas have them or they are done)"
             
             # Save results
             progress(0.9, desc="Saving results...")
@@ -136,6 +270,14 @@ class GutenOCRUI:
             # Save individual files
             individual_paths = self.file_processor.save_individual_results(results, format="txt")
             
+            if work_queue is not None:
+                # Outputs are on disk; failed and partial images go back to be retried
+                for image_path, result in zip(claimed, results):
+                    if is_finished(result):
+                        work_queue.complete(image_path, result)
+                    else:
+                        work_queue.release(image_path)
+            
             progress(1.0, desc="Complete!")
             
             return f"""✓ Batch processing complete!
@@ -143,6 +285,7 @@ class GutenOCRUI:
 Processed: {stats['total_images']} images
 Success: {stats['successful']} ({stats['success_rate']})
 Failed: {stats['failed']}
+Partial (deadline/cancelled): {sum(1 for r in results if r.get('status') in ('deadline_exceeded', 'cancelled'))}
 
 Output files:
 - Combined results: {output_path}
@@ -156,6 +299,11 @@ Average per image: {stats['average_characters_per_image']}
         except Exception as e:
             logger.error(f"Error in batch processing: {e}")
             return f"Error: {str(e)}"
+        
+        finally:
+            self.active_tokens.discard(cancel_token)
+            if work_queue is not None:
+                work_queue.close()
     
     def create_interface(self) -> gr.Blocks:
         """Create the Gradio interface"""
@@ -180,13 +328,17 @@ Average per image: {stats['average_characters_per_image']}
                         label="Force CPU Usage (slower but works without GPU)",
                         value=False
                     )
+                    quantize_int8 = gr.Checkbox(
+                        label="Int8 Quantization (CPU only, ~4x less memory)",
+                        value=False
+                    )
                 
                 init_btn = gr.Button("Initialize Model", variant="primary", size="lg")
                 init_output = gr.Textbox(label="Initialization Status", lines=8)
                 
                 init_btn.click(
                     fn=self.initialize_engine,
-                    inputs=[model_choice, use_cpu],
+                    inputs=[model_choice, use_cpu, quantize_int8],
                     outputs=init_output
                 )
             
@@ -209,7 +361,15 @@ Average per image: {stats['average_characters_per_image']}
                             label="Output Format"
                         )
                         
-                        single_process_btn = gr.Button("Process Image", variant="primary")
+                        single_pixels = gr.Dropdown(
+                            choices=["Default", "Fast", "Balanced", "Accurate"],
+                            value="Default",
+                            label="Pixel Budget"
+                        )
+                        
+                        with gr.Row():
+                            single_process_btn = gr.Button("Process Image", variant="primary")
+                            single_stop_btn = gr.Button("Stop", variant="stop")
                     
                     with gr.Column():
                         single_output = gr.Textbox(label="OCR Result", lines=15)
@@ -217,9 +377,14 @@ Average per image: {stats['average_characters_per_image']}
                 
                 single_process_btn.click(
                     fn=self.process_single_image,
-                    inputs=[single_image, single_task, single_format],
+                    inputs=[single_image, single_task, single_format, single_pixels],
                     outputs=[single_output, single_info]
                 )
+                
+                single_stop_btn.click(
+                    fn=self.cancel_processing,
+                    outputs=single_info
+                )
             
             with gr.Tab("📁 Batch Processing"):
                 gr.Markdown("""
@@ -243,17 +408,48 @@ Average per image: {stats['average_characters_per_image']}
                     )
                     
                     save_format = gr.Dropdown(
-                        choices=["JSON", "TXT", "CSV"],
+                        choices=["JSON", "JSONL", "TXT", "CSV"],
                         value="JSON",
                         label="Save Format"
                     )
+                    
+                    batch_pixels = gr.Dropdown(
+                        choices=["Default", "Fast", "Balanced", "Accurate"],
+                        value="Default",
+                        label="Pixel Budget"
+                    )
+                    
+                    batch_time_budget = gr.Number(
+                        value=0,
+                        label="Time Budget per Image (s, 0 = unlimited)"
+                    )
+                    
+                    batch_workers = gr.Slider(
+                        minimum=0,
+                        maximum=max(1, (os.cpu_count() or 1) // 4),
+                        step=1,
+                        value=0,
+                        label="CPU Worker Processes (0 = shared engine)"
+                    )
+                    
+                    batch_share = gr.Checkbox(
+                        value=os.environ.get("GUTENOCR_SHARED_QUEUE", "").lower() in ("1", "true", "yes"),
+                        label="Share with other replicas (skips images already done with these settings)"
+                    )
                 
-                batch_process_btn = gr.Button("Start Batch Processing", variant="primary", size="lg")
+                with gr.Row():
+                    batch_process_btn = gr.Button("Start Batch Processing", variant="primary", size="lg")
+                    batch_stop_btn = gr.Button("Stop", variant="stop", size="lg")
                 batch_output = gr.Textbox(label="Batch Processing Results", lines=15)
                 
                 batch_process_btn.click(
                     fn=self.process_batch,
-                    inputs=[batch_task, batch_format, save_format],
+                    inputs=[batch_task, batch_format, save_format, batch_pixels, batch_time_budget, batch_workers, batch_share],
+                    outputs=batch_output
+                )
+                
+                batch_stop_btn.click(
+                    fn=self.cancel_processing,
                     outputs=batch_output
                 )
             
@@ -297,14 +493,30 @@ Average per image: {stats['average_characters_per_image']}
         return interface
     
     def launch(self, **kwargs):
-        """Launch the Gradio interface"""
+        """Launch the Gradio interface with /healthz and /ready probes"""
         interface = self.create_interface()
-        interface.launch(**kwargs)
+        # Let concurrent users reach the scheduler so their requests can be batched
+        interface.queue(default_concurrency_limit=8)
+        launch_with_probes(interface, self.readiness, **kwargs)
 
 
 def main():
     """Main entry point"""
-    app = GutenOCRUI()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="GutenOCR UI")
+    parser.add_argument("--model", default="GutenOCR-3B (Faster)", choices=["GutenOCR-3B (Faster)", "GutenOCR-7B (More Accurate)"], help="Model loaded at startup")
+    parser.add_argument("--cpu", action="store_true", help="Force CPU usage")
+    parser.add_argument("--no-preload", action="store_true", help="Wait for the UI button instead of loading a model at startup")
+    parser.add_argument("--idle-unload-seconds", type=float, default=float(os.environ.get("GUTENOCR_IDLE_UNLOAD_SECONDS", 0)) or None, help="Unload the model after this many idle seconds (reloaded on the next request)")
+    
+    args = parser.parse_args()
+    
+    app = GutenOCRUI(idle_unload_seconds=args.idle_unload_seconds)
+    if args.no_preload:
+        app.readiness.mark_idle()
+    else:
+        app.preload(args.model, args.cpu)
     app.launch(
         server_name="0.0.0.0",
         server_port=7860,
@@ -3,28 +3,103 @@
 GutenOCR Engine - Core OCR processing with CPU/GPU support
 """
 import os
+import gc
+import math
+import itertools
+import copy
+import json
+import time
+import threading
+import weakref
 import torch
-from typing import Optional, Dict, Any, List
-from PIL import Image
-from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Iterable, Iterator, Callable
+from PIL import Image, ImageDraw
+from transformers import (
+    Qwen2_5_VLForConditionalGeneration,
+    AutoProcessor,
+    BatchFeature,
+    DynamicCache,
+    MaxLengthCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer
+)
 from qwen_vl_utils import process_vision_info
 import logging
 
+from result_cache import OCRResultCache, hash_file
+from cpu_capabilities import detect_cpu_features, preferred_cpu_dtype
+from thread_tuning import load_thread_config
+from prefetch import prefetch
+from stopping_criteria import (
+    CancellationToken,
+    CancellationStoppingCriteria,
+    DeadlineStoppingCriteria,
+    FinishedRowCallback,
+    RepetitionStoppingCriteria
+)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Written next to prepared weights by prepare_model.py
+PREPARED_MANIFEST = "gutenocr_prepared.json"
+
 
 class GutenOCREngine:
     """
     GutenOCR Engine for OCR processing with CPU/GPU support
     """
     
+    # Named (min_pixels, max_pixels) budgets; each 28x28 patch becomes one vision token
+    PIXEL_PRESETS = {
+        "fast": (256 * 28 * 28, 768 * 28 * 28),
+        "balanced": (256 * 28 * 28, 1280 * 28 * 28),
+        "accurate": (256 * 28 * 28, 4096 * 28 * 28),
+    }
+    
+    QUANTIZATION_MODES = (None, "int8-dynamic")
+    
+    # Prompts whose chat-template text is memoised (the fixed ones plus a few custom)
+    CHAT_TEXT_CACHE_SIZE = 32
+    
+    # (task_type, output_format) pairs exercised by warmup()
+    WARMUP_FORMATS = (
+        ("reading", "TEXT"),
+        ("reading", "TEXT2D"),
+        ("reading", "LINES"),
+        ("reading", "WORDS"),
+        ("reading", "PARAGRAPHS"),
+        ("reading", "LATEX"),
+        ("detection", "BOX"),
+    )
+    
+    # Prompt lengths are left-padded up to one of these in compiled mode, so
+    # the compiled decoder only ever sees a handful of shapes
+    COMPILE_BUCKETS = (256, 512, 1024, 2048, 4096)
+    
     def __init__(
         self,
         model_id: str = "rootsautomation/GutenOCR-3B",
         device: str = "auto",
         use_cpu: bool = False,
-        torch_dtype: Optional[torch.dtype] = None
+        torch_dtype: Optional[torch.dtype] = None,
+        batch_size: int = 4,
+        cache_dir: Optional[str] = None,
+        vision_cache_size: int = 4,
+        prefix_cache: bool = True,
+        pixel_preset: Optional[str] = None,
+        min_pixels: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        stop_on_repetition: bool = True,
+        quantization: Optional[str] = None,
+        quantize_vision: bool = False,
+        compiled: bool = False,
+        compile_max_new_tokens: int = 4096,
+        idle_unload_seconds: Optional[float] = None,
+        prepared_dir: Optional[str] = None,
+        num_threads: Optional[int] = None,
+        thread_tuning: bool = True
     ):
         """
         Initialize GutenOCR Engine
@@ -33,44 +108,625 @@ class GutenOCREngine:
             model_id: HuggingFace model ID (GutenOCR-3B or GutenOCR-7B)
             device: Device to use ('auto', 'cuda', 'cpu')
             use_cpu: Force CPU usage even if GPU is available
-            torch_dtype: Torch data type (default: bfloat16 for GPU, float32 for CPU)
+            torch_dtype: Torch data type (default: bfloat16 for GPU; on CPU bfloat16
+                when the host has native AVX512-BF16/AMX, otherwise float32)
+            batch_size: Default number of images per generate call in batch_process
+            cache_dir: Directory for the persistent OCR result cache (None disables caching)
+            vision_cache_size: Number of images whose vision embeddings are kept for
+                re-prompting (0 disables the vision cache)
+            prefix_cache: Re-use the KV cache of the shared chat-template prefix
+                for single-image requests
+            pixel_preset: Default pixel budget preset ('fast', 'balanced', 'accurate')
+            min_pixels: Default minimum image area before tokenization (overrides preset)
+            max_pixels: Default maximum image area before tokenization (overrides preset)
+            stop_on_repetition: Stop decoding early when the output falls into a loop
+            quantization: CPU quantization mode (None or 'int8-dynamic')
+            quantize_vision: Also quantize the vision tower's linear layers
+            compiled: Decode with a static KV cache and a torch.compile'd decoder
+                (compiles every prompt bucket at startup)
+            compile_max_new_tokens: Largest max_new_tokens the compiled static cache
+                is sized for at warmup
+            idle_unload_seconds: Release the model after this many idle seconds and
+                reload it on the next request (None keeps it resident)
+            prepared_dir: Directory written by prepare_model.py; a matching prepared
+                copy is loaded offline instead of the hub checkpoint
+                (default: GUTENOCR_PREPARED_DIR)
+            num_threads: Intra-op CPU threads (overrides the tuned setting)
+            thread_tuning: Apply the thread count saved by thread_tuning.py for this host
         """
         self.model_id = model_id
         self.use_cpu = use_cpu
+        self.batch_size = max(1, batch_size)
+        self.result_cache = OCRResultCache(cache_dir) if cache_dir else None
+        self.min_pixels, self.max_pixels = self._resolve_pixel_budget(
+            pixel_preset, min_pixels, max_pixels, use_defaults=False
+        )
+        self.stop_on_repetition = stop_on_repetition
+        # Serialises model use between the scheduler thread and streaming requests
+        self._model_lock = threading.RLock()
+        # Prefetch threads tokenize while the generating thread decodes; the
+        # fast tokenizer's padding state must not change under a decode
+        self._tokenizer_lock = threading.Lock()
+        self._repetition_stops = 0
+        self._repetition_tokens_saved = 0
+        self._generated_tokens = 0
+        self._generate_seconds = 0.0
+        # Decode counters, updated from prefetch threads too
+        self._decode_lock = threading.Lock()
+        self._decode_stats = {
+            "images": 0,
+            "reduced": 0,
+            "decode_seconds": 0.0,
+            "peak_decoded_bytes": 0,
+            "peak_full_resolution_bytes": 0
+        }
+        
+        # image hash -> (image_embeds, image_grid_thw) from the vision tower
+        self.vision_cache_size = max(0, vision_cache_size)
+        self._vision_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._vision_cache_hits = 0
+        self._vision_cache_misses = 0
+        
+        # Shared chat-template prefix -> precomputed KV cache, plus the
+        # templated text for each fixed prompt
+        self.prefix_cache = prefix_cache
+        self._prefix_kv: Dict[tuple, DynamicCache] = {}
+        # LRU of chat-template output per prompt; custom prompts must not pile up
+        self._chat_text_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._chat_text_lock = threading.Lock()
+        self._prefix_stats: Dict[str, Dict[str, int]] = {}
+        
+        if quantization not in self.QUANTIZATION_MODES:
+            raise ValueError(
+                f"Unknown quantization '{quantization}'. "
+                f"Choose from: {', '.join(str(mode) for mode in self.QUANTIZATION_MODES)}"
+            )
+        self.quantization = quantization
+        self.quantize_vision = quantize_vision
+        self.quantization_stats: Dict[str, Any] = {}
+        
+        self.compiled = compiled
+        self.compile_max_new_tokens = compile_max_new_tokens
+        self.compile_stats: Dict[str, Any] = {}
+        self.warmed_up = False
+        self.warmup_stats: Dict[str, Any] = {}
         
         # Determine device and dtype
-        if use_cpu or not torch.cuda.is_available():
-            self.device = "cpu"
-            self.torch_dtype = torch_dtype or torch.float32
-            logger.info("Using CPU for inference")
+        on_cpu = use_cpu or not torch.cuda.is_available()
+        self.cpu_features = detect_cpu_features() if on_cpu else None
+        self.device, self.torch_dtype, self.quantization = self.resolve_placement(
+            device, use_cpu, torch_dtype, quantization, self.cpu_features
+        )
+        if self.device == "cpu":
+            logger.info(
+                f"Using CPU for inference with dtype {self.torch_dtype} "
+                f"({'explicit' if torch_dtype is not None else 'auto'}; "
+                f"avx512_bf16={self.cpu_features['avx512_bf16']}, "
+                f"amx_bf16={self.cpu_features['amx_bf16']})"
+            )
         else:
-            self.device = device
-            self.torch_dtype = torch_dtype or torch.bfloat16
             logger.info(f"Using GPU for inference with dtype {self.torch_dtype}")
+        self.thread_config = self._configure_threads(num_threads, thread_tuning) if self.device == "cpu" else None
+        
+        # Load model and processor, preferring a copy already converted to this dtype
+        self.prepared_path = self._find_prepared(prepared_dir or os.environ.get("GUTENOCR_PREPARED_DIR"))
+        if self.prepared_path is not None:
+            self.processor = AutoProcessor.from_pretrained(self.prepared_path, local_files_only=True)
+        else:
+            self.processor = AutoProcessor.from_pretrained(model_id)
+        # Decoder-only generation needs left padding so every prompt in a
+        # batch ends right where generation starts
+        self.processor.tokenizer.padding_side = "left"
+        self._model = None
+        # Kept across unloads so read-only lookups never need the weights
+        self._model_config = None
+        self._last_used = time.monotonic()
+        self.load_stats: Dict[str, Any] = {
+            "loads": 0,
+            "last_load_seconds": None,
+            "total_load_seconds": 0.0,
+            "unloads": 0,
+            "last_unload_seconds": None
+        }
+        self._load()
+        
+        # Background thread that releases the model once it has been idle long enough
+        self.idle_unload_seconds = idle_unload_seconds
+        if idle_unload_seconds:
+            threading.Thread(
+                target=self._idle_watch,
+                args=(weakref.ref(self),),
+                name="gutenocr-idle-unload",
+                daemon=True
+            ).start()
+    
+    @property
+    def model(self) -> Qwen2_5_VLForConditionalGeneration:
+        """
+        The loaded model; reloaded transparently if it was unloaded while idle
+        
+        Counts as use for the idle timer and waits for any running generate,
+        so only generate/forward paths go through it; read-only lookups use
+        ``_model`` or ``_model_config``.
+        """
+        with self._model_lock:
+            if self._model is None:
+                self._load()
+            self._last_used = time.monotonic()
+            return self._model
+    
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+    
+    def exclusive(self) -> "threading.RLock":
+        """
+        Lock that keeps generate and forward passes from running meanwhile
+        
+        torch's intra-op thread count is process-wide, so other torch work in
+        this process (e.g. Docling's models) would double the compute threads
+        on the same cores if it ran during a generate. Hold this around it.
+        """
+        return self._model_lock
+    
+    def _load(self):
+        """Load the weights and re-apply quantization and compilation"""
+        with self._model_lock:
+            logger.info(f"Loading model: {self.model_id}")
+            start = time.perf_counter()
+            # After the first load the files are in the local cache; skip the hub round-trip
+            self._model = self._load_model(local_files_only=self.load_stats["loads"] > 0)
+            self._model_config = self._model.config
+            
+            if self.quantization == "int8-dynamic":
+                self._quantize_int8_dynamic()
+            if self.compiled:
+                self._enable_compiled_mode()
+            
+            seconds = time.perf_counter() - start
+            self.load_stats["loads"] += 1
+            self.load_stats["last_load_seconds"] = round(seconds, 2)
+            self.load_stats["total_load_seconds"] = round(self.load_stats["total_load_seconds"] + seconds, 2)
+            self._last_used = time.monotonic()
+            logger.info(f"Model loaded successfully in {seconds:.2f}s")
+    
+    def unload(self):
+        """
+        Release the model weights and every cache holding model tensors
+        
+        The processor and the result cache stay; the next request reloads
+        the weights from the (memory-mapped) safetensors files.
+        """
+        with self._model_lock:
+            if self._model is None:
+                return
+            start = time.perf_counter()
+            self._model = None
+            self._vision_cache.clear()
+            self._prefix_kv.clear()
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            seconds = time.perf_counter() - start
+            self.load_stats["unloads"] += 1
+            self.load_stats["last_unload_seconds"] = round(seconds, 2)
+            logger.info(f"Unloaded idle model {self.model_id} in {seconds:.2f}s")
+    
+    @staticmethod
+    def _idle_watch(engine_ref: "weakref.ref"):
+        """
+        Unload the model once nobody has touched it for idle_unload_seconds
+        
+        Holds only a weak reference between checks so an engine dropped by
+        its owner (or evicted from the registry) can still be collected.
+        """
+        while True:
+            engine = engine_ref()
+            if engine is None:
+                return
+            interval = min(30.0, engine.idle_unload_seconds / 4)
+            del engine
+            time.sleep(interval)
+            
+            engine = engine_ref()
+            if engine is None:
+                return
+            if engine._model is not None and time.monotonic() - engine._last_used >= engine.idle_unload_seconds:
+                # A request holding the lock is mid-generate; try again next round
+                if engine._model_lock.acquire(blocking=False):
+                    try:
+                        if time.monotonic() - engine._last_used >= engine.idle_unload_seconds:
+                            engine.unload()
+                    finally:
+                        engine._model_lock.release()
+            del engine
+    
+    def _configure_threads(self, num_threads: Optional[int], thread_tuning: bool) -> Dict[str, Any]:
+        """Set torch's intra-op thread count: explicit, tuned for this host, or torch's default"""
+        source = "default"
+        if num_threads:
+            source = "explicit"
+        elif thread_tuning:
+            tuned = load_thread_config()
+            if tuned is not None:
+                num_threads = tuned["intra_op_threads"]
+                source = "tuned"
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        config = {
+            "intra_op_threads": torch.get_num_threads(),
+            "inter_op_threads": torch.get_num_interop_threads(),
+            "source": source
+        }
+        logger.info(f"CPU threads: {config}")
+        return config
+    
+    @staticmethod
+    def prepared_path_for(prepared_dir: str, model_id: str, torch_dtype: torch.dtype) -> str:
+        """Location of the prepared copy of a model in a given dtype"""
+        return os.path.join(
+            prepared_dir, model_id.replace("/", "--"), str(torch_dtype).replace("torch.", "")
+        )
+    
+    def _find_prepared(self, prepared_dir: Optional[str]) -> Optional[str]:
+        """Return the prepared copy for this model and dtype, if one was written"""
+        if not prepared_dir:
+            return None
+        path = self.prepared_path_for(prepared_dir, self.model_id, self.torch_dtype)
+        manifest_path = os.path.join(path, PREPARED_MANIFEST)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            logger.info(f"No prepared weights at {path}; loading {self.model_id} from the hub cache")
+            return None
+        if manifest.get("model_id") != self.model_id or manifest.get("torch_dtype") != str(self.torch_dtype):
+            logger.warning(f"Prepared weights at {path} do not match {self.model_id}/{self.torch_dtype}; ignoring them")
+            return None
+        logger.info(f"Using prepared weights from {path}")
+        return path
+    
+    @staticmethod
+    def resolve_placement(
+        device: str = "auto",
+        use_cpu: bool = False,
+        torch_dtype: Optional[torch.dtype] = None,
+        quantization: Optional[str] = None,
+        cpu_features: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, torch.dtype, Optional[str]]:
+        """
+        Decide where and how an engine with these settings would run
+        
+        Args:
+            device: Requested device
+            use_cpu: Force CPU usage
+            torch_dtype: Explicit dtype (None picks per device)
+            quantization: Requested quantization mode
+            cpu_features: Output of detect_cpu_features (probed if omitted)
+        
+        Returns:
+            Tuple of (device, dtype, effective quantization)
+        """
+        if use_cpu or not torch.cuda.is_available():
+            dtype = torch_dtype or preferred_cpu_dtype(cpu_features)
+            if quantization == "int8-dynamic" and dtype != torch.float32:
+                # Dynamic int8 kernels take float32 activations
+                logger.warning("int8-dynamic quantization needs float32 weights; overriding torch_dtype")
+                dtype = torch.float32
+            return "cpu", dtype, quantization
+        
+        if quantization == "int8-dynamic":
+            logger.warning("int8-dynamic quantization is CPU-only; ignoring it on GPU")
+        return device, torch_dtype or torch.bfloat16, None
+    
+    def warmup(
+        self,
+        formats: Optional[List[Tuple[str, str]]] = None,
+        max_new_tokens: int = 8
+    ) -> Dict[str, float]:
+        """
+        Run a synthetic page through each output format once
+        
+        The first request otherwise pays for lazy kernel initialisation,
+        allocator growth and the processor's first tokenization. Warmup goes
+        through the same path as process_image (minus the result cache), so
+        it also fills the prefix KV cache for every warmed format. Token
+        counters are restored afterwards so throughput stats only cover
+        real requests.
+        
+        Args:
+            formats: (task_type, output_format) pairs (default: WARMUP_FORMATS)
+            max_new_tokens: Tokens decoded per format
+        
+        Returns:
+            Seconds spent per format
+        """
+        image = self._warmup_image()
+        pixel_budget = self._resolve_pixel_budget(None, None, None)
+        counters = (self._generated_tokens, self._generate_seconds)
+        timings = {}
+        total_start = time.perf_counter()
+        for task_type, output_format in formats or self.WARMUP_FORMATS:
+            label = f"{task_type}/{output_format}"
+            start = time.perf_counter()
+            prompt = self._generate_prompt(task_type, output_format)
+            inputs = self._prepare_inputs([self._build_messages(image, prompt, pixel_budget)])
+            inputs, _ = self._reuse_vision_embeddings(inputs, None)
+            self._generate(inputs, max_new_tokens, prompt_label=label)
+            timings[label] = round(time.perf_counter() - start, 2)
+            logger.info(f"Warmed up {label} in {timings[label]}s")
+        self._generated_tokens, self._generate_seconds = counters
+        
+        self.warmup_stats = {
+            "formats": timings,
+            "warmup_seconds": round(time.perf_counter() - total_start, 2)
+        }
+        self.warmed_up = True
+        return timings
+    
+    def _warmup_image(self) -> Image.Image:
+        """Draw a small page of text lines for warmup"""
+        image = Image.new("RGB", (640, 480), "white")
+        draw = ImageDraw.Draw(image)
+        for line in range(12):
+            draw.text((32, 24 + line * 36), f"GutenOCR warmup line {line + 1}: 0123456789", fill="black")
+        return image
+    
+    def _language_model(self) -> torch.nn.Module:
+        """Return the text decoder (nested under model.language_model in newer transformers)"""
+        inner = self.model.model
+        return getattr(inner, "language_model", inner)
+    
+    def _enable_compiled_mode(self):
+        """
+        Switch generation to a static KV cache and compile the text decoder
+        
+        A static cache keeps every decode step at the same tensor shapes, so
+        the compiled decoder is traced once per (batch size, prompt bucket)
+        and then replayed. Prompts are padded to COMPILE_BUCKETS; the vision
+        tower and the mrope index computation stay eager. The prefix KV cache
+        builds a DynamicCache and is therefore turned off in this mode.
+        """
+        try:
+            language_model = self._language_model()
+            language_model.forward = torch.compile(
+                language_model.forward,
+                mode="reduce-overhead" if self.device != "cpu" else None,
+                dynamic=False
+            )
+            # One graph per bucket plus the decode step
+            torch._dynamo.config.cache_size_limit = max(
+                torch._dynamo.config.cache_size_limit, 2 * len(self.COMPILE_BUCKETS) + 2
+            )
+        except Exception as e:
+            logger.warning(f"torch.compile unavailable ({e}); staying in eager mode")
+            self.compiled = False
+            return
+        
+        self.model.generation_config.cache_implementation = "static"
+        if self.prefix_cache:
+            logger.info("Compiled mode uses a static KV cache; disabling the prefix KV cache")
+            self.prefix_cache = False
+        self.compile_warmup()
+    
+    def compile_warmup(self, batch_size: int = 1, max_new_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Compile the decoder for every prompt bucket before serving requests
+        
+        Buckets are visited from the largest down: generate keeps its static
+        cache while a request fits, so after the first (largest) bucket every
+        smaller one re-uses the same cache and only the prefill shape is new.
+        
+        Args:
+            batch_size: Batch size to compile for
+            max_new_tokens: Token budget the static cache is sized for
+                (default: compile_max_new_tokens)
+        
+        Returns:
+            Seconds spent per bucket
+        """
+        if not self.compiled:
+            return {}
+        max_new_tokens = max_new_tokens or self.compile_max_new_tokens
+        pad_token_id = self.processor.tokenizer.pad_token_id
+        timings = {}
+        total_start = time.perf_counter()
+        with self._model_lock, torch.no_grad():
+            for bucket in sorted(self.COMPILE_BUCKETS, reverse=True):
+                input_ids = torch.full(
+                    (batch_size, bucket), pad_token_id, dtype=torch.long, device=self.model.device
+                )
+                start = time.perf_counter()
+                # Stop after a few decode steps; the cache is still sized for max_new_tokens
+                self.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=max_new_tokens,
+                    stopping_criteria=StoppingCriteriaList([MaxLengthCriteria(bucket + 3)]),
+                    do_sample=False
+                )
+                timings[bucket] = round(time.perf_counter() - start, 2)
+                logger.info(f"Compiled prompt bucket {bucket} in {timings[bucket]}s")
         
-        # Load model and processor
-        logger.info(f"Loading model: {model_id}")
-        self.model = self._load_model()
-        self.processor = AutoProcessor.from_pretrained(model_id)
-        logger.info("Model loaded successfully")
+        self.compile_stats = {
+            "batch_size": batch_size,
+            "max_new_tokens": max_new_tokens,
+            "bucket_seconds": timings,
+            "warmup_seconds": round(time.perf_counter() - total_start, 2)
+        }
+        return timings
+    
+    def _pad_to_bucket(self, inputs) -> Dict[str, Any]:
+        """
+        Left-pad a prepared batch up to the next compile bucket
+        
+        Prompts longer than the largest bucket are rounded up to a multiple
+        of it. Padding is masked out, so the multimodal rope positions and
+        the generated text are unchanged.
+        """
+        length = inputs["input_ids"].shape[1]
+        bucket = next((b for b in self.COMPILE_BUCKETS if b >= length), None)
+        if bucket is None:
+            largest = self.COMPILE_BUCKETS[-1]
+            bucket = -(-length // largest) * largest
+        
+        padded = dict(inputs)
+        pad = bucket - length
+        if pad == 0:
+            return padded
+        input_ids = inputs["input_ids"]
+        padded["input_ids"] = torch.cat(
+            [input_ids.new_full((input_ids.shape[0], pad), self.processor.tokenizer.pad_token_id), input_ids],
+            dim=1
+        )
+        attention_mask = inputs["attention_mask"]
+        padded["attention_mask"] = torch.cat(
+            [attention_mask.new_zeros((attention_mask.shape[0], pad)), attention_mask], dim=1
+        )
+        if "inputs_embeds" in inputs:
+            embeds = inputs["inputs_embeds"]
+            padded["inputs_embeds"] = torch.cat(
+                [embeds.new_zeros((embeds.shape[0], pad, embeds.shape[2])), embeds], dim=1
+            )
+        return padded
+    
+    def _quantize_int8_dynamic(self):
+        """
+        Quantize the language model's linear layers to int8 in place
+        
+        Weights are stored as int8 and activations are quantized on the fly,
+        which roughly quarters the memory of the decoder compared with
+        float32. The vision tower stays in float unless quantize_vision is set.
+        Memory and a short decode benchmark are recorded before and after.
+        """
+        inner = self.model.model
+        language_model = "model.language_model" if hasattr(inner, "language_model") else "model"
+        targets = {language_model, "lm_head"}
+        if self.quantize_vision:
+            targets.add("model.visual" if hasattr(inner, "visual") else "visual")
+        
+        if self.quantization_stats:
+            # Reload after an idle unload: the numbers were recorded the first time
+            torch.ao.quantization.quantize_dynamic(
+                self.model, qconfig_spec=targets, dtype=torch.qint8, inplace=True
+            )
+            return
+        
+        before = {
+            "memory_bytes": self._model_memory_bytes(),
+            "tokens_per_second": self.benchmark(prompt_tokens=32, new_tokens=16)["decode_tokens_per_second"]
+        }
+        start = time.perf_counter()
+        torch.ao.quantization.quantize_dynamic(
+            self.model,
+            qconfig_spec=targets,
+            dtype=torch.qint8,
+            inplace=True
+        )
+        quantize_seconds = time.perf_counter() - start
+        after = {
+            "memory_bytes": self._model_memory_bytes(),
+            "tokens_per_second": self.benchmark(prompt_tokens=32, new_tokens=16)["decode_tokens_per_second"]
+        }
+        
+        self.quantization_stats = {
+            "mode": self.quantization,
+            "quantized_modules": sorted(targets),
+            "quantize_seconds": round(quantize_seconds, 2),
+            "before": before,
+            "after": after
+        }
+        logger.info(
+            f"Quantized {sorted(targets)} to int8: "
+            f"{before['memory_bytes'] / 2**30:.2f} GiB -> {after['memory_bytes'] / 2**30:.2f} GiB, "
+            f"{before['tokens_per_second']:.2f} -> {after['tokens_per_second']:.2f} tokens/s"
+        )
+    
+    def _model_memory_bytes(self) -> int:
+        """Bytes held by the model's weights, including packed quantized weights"""
+        def tensor_bytes(value) -> int:
+            if isinstance(value, torch.Tensor):
+                return value.numel() * value.element_size()
+            if isinstance(value, (tuple, list)):
+                return sum(tensor_bytes(item) for item in value)
+            return 0
+        # No lock: a device-info poll must neither wait for a generate nor keep the model loaded
+        model = self._model
+        if model is None:
+            return 0
+        return sum(tensor_bytes(value) for value in model.state_dict().values())
     
-    def _load_model(self) -> Qwen2_5_VLForConditionalGeneration:
-        """Load the model with appropriate settings"""
+    def benchmark(self, prompt_tokens: int = 256, new_tokens: int = 32) -> Dict[str, float]:
+        """
+        Measure prefill and decode throughput on a synthetic text prompt
+        
+        Args:
+            prompt_tokens: Length of the synthetic prompt
+            new_tokens: Number of tokens to decode
+        
+        Returns:
+            Dictionary with prefill and decode tokens per second
+        """
+        tokenizer = self.processor.tokenizer
+        seed_ids = tokenizer("Read all text in the image. ")["input_ids"]
+        input_ids = torch.tensor(
+            [(seed_ids * (prompt_tokens // len(seed_ids) + 1))[:prompt_tokens]],
+            device=self.model.device
+        )
+        attention_mask = torch.ones_like(input_ids)
+        
+        with self._model_lock, torch.no_grad():
+            start = time.perf_counter()
+            self.model(input_ids=input_ids, attention_mask=attention_mask)
+            prefill_seconds = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            output = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=new_tokens,
+                min_new_tokens=new_tokens,
+                do_sample=False
+            )
+            # generate repeats the prefill once before decoding
+            decode_seconds = max(time.perf_counter() - start - prefill_seconds, 1e-6)
+        
+        generated = output.shape[1] - input_ids.shape[1]
+        return {
+            "prefill_tokens_per_second": round(prompt_tokens / prefill_seconds, 2),
+            "decode_tokens_per_second": round(generated / decode_seconds, 2)
+        }
+    
+    def _load_model(self, local_files_only: bool = False) -> Qwen2_5_VLForConditionalGeneration:
+        """
+        Load the model with appropriate settings
+        
+        Weights come from safetensors, which are memory-mapped. A prepared
+        copy is already in the engine dtype, so nothing is converted and the
+        pages are shared with other replicas on the node through the page
+        cache; it is always loaded offline.
+        """
+        source = self.prepared_path or self.model_id
+        local_files_only = local_files_only or self.prepared_path is not None
         try:
             if self.use_cpu:
                 # CPU-specific loading
                 model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-                    self.model_id,
+                    source,
                     torch_dtype=self.torch_dtype,
                     device_map="cpu",
-                    low_cpu_mem_usage=True
+                    low_cpu_mem_usage=True,
+                    use_safetensors=True,
+                    local_files_only=local_files_only
                 )
             else:
                 # GPU loading
                 model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-                    self.model_id,
+                    source,
                     torch_dtype=self.torch_dtype,
-                    device_map=self.device
+                    device_map=self.device,
+                    use_safetensors=True,
+                    local_files_only=local_files_only
                 )
             return model
         except Exception as e:
@@ -83,7 +739,12 @@ class GutenOCREngine:
         task_type: str = "reading",
         output_format: str = "TEXT",
         max_new_tokens: int = 4096,
-        custom_prompt: Optional[str] = None
+        custom_prompt: Optional[str] = None,
+        pixel_preset: Optional[str] = None,
+        min_pixels: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        deadline: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None
     ) -> Dict[str, Any]:
         """
         Process an image with OCR
@@ -94,13 +755,22 @@ class GutenOCREngine:
             output_format: Output format ('TEXT', 'TEXT2D', 'LINES', 'WORDS', 'PARAGRAPHS', 'LATEX', 'BOX')
             max_new_tokens: Maximum number of tokens to generate
             custom_prompt: Custom prompt (overrides default)
+            pixel_preset: Pixel budget preset for this call (default: engine setting)
+            min_pixels: Minimum image area for this call (overrides preset)
+            max_pixels: Maximum image area for this call (overrides preset)
+            deadline: time.monotonic() value after which decoding stops with partial text
+            cancel_token: Token the caller can cancel to stop decoding early
         
         Returns:
-            Dictionary with OCR results
+            Dictionary with OCR results; ``status`` is 'completed', 'deadline_exceeded'
+            or 'cancelled'
         """
         try:
-            # Load image
-            image = Image.open(image_path).convert("RGB")
+            abandoned = self._check_abandoned(image_path, deadline, cancel_token)
+            if abandoned is not None:
+                return abandoned
+            
+            pixel_budget = self._resolve_pixel_budget(pixel_preset, min_pixels, max_pixels)
             
             # Generate prompt
             if custom_prompt:
@@ -108,71 +778,682 @@ class GutenOCREngine:
             else:
                 prompt = self._generate_prompt(task_type, output_format)
             
-            # Prepare messages
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "image", "image": image},
-                        {"type": "text", "text": prompt},
-                    ],
-                }
-            ]
+            # Serve unchanged images from the result cache
+            image_hash = self._image_hash(image_path)
+            cache_key = self._cache_key(image_hash, prompt, max_new_tokens, pixel_budget)
+            cached = self._cached_result(cache_key, image_path, task_type, output_format)
+            if cached is not None:
+                return cached
+            
+            # Load image
+            image = self._load_image(image_path, pixel_budget)
             
             # Process and generate
-            text = self.processor.apply_chat_template(
-                messages, tokenize=False, add_generation_prompt=True
+            inputs = self._prepare_inputs([self._build_messages(image, prompt, pixel_budget)])
+            return self._run_single(
+                image_path, inputs, image_hash, cache_key, prompt,
+                task_type, output_format, max_new_tokens,
+                bool(custom_prompt), deadline, cancel_token
+            )
+            
+        except Exception as e:
+            logger.error(f"Error processing image {image_path}: {e}")
+            return {
+                "success": False,
+                "image_path": image_path,
+                "error": str(e)
+            }
+    
+    def _run_single(
+        self,
+        image_path: str,
+        inputs,
+        image_hash: Optional[str],
+        cache_key: Optional[str],
+        prompt: str,
+        task_type: str,
+        output_format: str,
+        max_new_tokens: int,
+        custom: bool,
+        deadline: Optional[float],
+        cancel_token: Optional[CancellationToken]
+    ) -> Dict[str, Any]:
+        """Generate for one tokenized image, with the vision and prefix caches"""
+        vision_tokens = self._count_vision_tokens(inputs)
+        
+        # Re-use the vision tower output when this image was seen recently
+        inputs, vision_cache_hit = self._reuse_vision_embeddings(inputs, image_hash)
+        
+        logger.info(f"Processing image: {image_path}")
+        output_text, stop_reasons = self._generate(
+            inputs,
+            max_new_tokens,
+            prompt_label="custom" if custom else f"{task_type}/{output_format}",
+            deadlines=[deadline],
+            cancel_tokens=[cancel_token]
+        )
+        
+        result = self._success_result(
+            image_path, task_type, output_format, output_text[0], prompt,
+            vision_cache_hit, vision_tokens[0], stop_reasons[0]
+        )
+        self._store_result(cache_key, result)
+        return result
+    
+    def stream_image(
+        self,
+        image_path: str,
+        task_type: str = "reading",
+        output_format: str = "TEXT",
+        max_new_tokens: int = 4096,
+        custom_prompt: Optional[str] = None,
+        pixel_preset: Optional[str] = None,
+        min_pixels: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        deadline: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Process an image with OCR, yielding text as it is decoded
+        
+        Takes the same arguments as process_image. Generation runs on a
+        background thread; closing the generator early (e.g. the client went
+        away) cancels it at the next decode step.
+        
+        Yields:
+            ``{"delta", "text", "done": False}`` updates while decoding, then the
+            full process_image result dictionary with ``"done": True``
+        """
+        cancel_token = cancel_token or CancellationToken()
+        try:
+            abandoned = self._check_abandoned(image_path, deadline, cancel_token)
+            if abandoned is not None:
+                yield {**abandoned, "done": True}
+                return
+            
+            pixel_budget = self._resolve_pixel_budget(pixel_preset, min_pixels, max_pixels)
+            prompt = custom_prompt or self._generate_prompt(task_type, output_format)
+            image_hash = self._image_hash(image_path)
+            cache_key = self._cache_key(image_hash, prompt, max_new_tokens, pixel_budget)
+            cached = self._cached_result(cache_key, image_path, task_type, output_format)
+            if cached is not None:
+                yield {**cached, "done": True}
+                return
+            
+            image = self._load_image(image_path, pixel_budget)
+            inputs = self._prepare_inputs([self._build_messages(image, prompt, pixel_budget)])
+            vision_tokens = self._count_vision_tokens(inputs)
+            inputs, vision_cache_hit = self._reuse_vision_embeddings(inputs, image_hash)
+        except Exception as e:
+            logger.error(f"Error processing image {image_path}: {e}")
+            yield {"success": False, "image_path": image_path, "error": str(e), "done": True}
+            return
+        
+        streamer = TextIteratorStreamer(
+            self.processor.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=False
+        )
+        outcome: Dict[str, Any] = {}
+        
+        def run():
+            try:
+                outcome["texts"], outcome["stop_reasons"] = self._generate(
+                    inputs,
+                    max_new_tokens,
+                    prompt_label="custom" if custom_prompt else f"{task_type}/{output_format}",
+                    deadlines=[deadline],
+                    cancel_tokens=[cancel_token],
+                    streamer=streamer
+                )
+            except Exception as e:
+                outcome["error"] = e
+                # Unblock the consumer loop below
+                streamer.end()
+        
+        logger.info(f"Streaming image: {image_path}")
+        worker = threading.Thread(target=run, name="ocr-stream", daemon=True)
+        worker.start()
+        
+        text = ""
+        try:
+            for delta in streamer:
+                text += delta
+                yield {"delta": delta, "text": text, "done": False}
+        except GeneratorExit:
+            cancel_token.cancel()
+            raise
+        worker.join()
+        
+        if "error" in outcome:
+            logger.error(f"Error processing image {image_path}: {outcome['error']}")
+            yield {
+                "success": False,
+                "image_path": image_path,
+                "error": str(outcome["error"]),
+                "text": text,
+                "done": True
+            }
+            return
+        
+        result = self._success_result(
+            image_path, task_type, output_format, outcome["texts"][0], prompt,
+            vision_cache_hit, vision_tokens[0], outcome["stop_reasons"][0]
+        )
+        self._store_result(cache_key, result)
+        yield {**result, "done": True}
+    
+    def _check_abandoned(
+        self,
+        image_path: str,
+        deadline: Optional[float],
+        cancel_token: Optional[CancellationToken]
+    ) -> Optional[Dict[str, Any]]:
+        """Return a result for requests cancelled or out of time before they start"""
+        if cancel_token is not None and cancel_token.cancelled:
+            status, error = "cancelled", "Cancelled before processing"
+        elif deadline is not None and time.monotonic() >= deadline:
+            status, error = "deadline_exceeded", "Deadline exceeded before processing"
+        else:
+            return None
+        logger.warning(f"Skipping image {image_path}: {error}")
+        return {
+            "success": False,
+            "image_path": image_path,
+            "error": error,
+            "status": status
+        }
+    
+    def _status(self, stop_reason: Optional[str]) -> str:
+        """Map a generate stop reason to the result status"""
+        if stop_reason in ("deadline_exceeded", "cancelled"):
+            return stop_reason
+        return "completed"
+    
+    def _success_result(
+        self,
+        image_path: str,
+        task_type: str,
+        output_format: str,
+        text: str,
+        prompt: str,
+        vision_cache_hit: bool,
+        vision_tokens: int,
+        stop_reason: Optional[str]
+    ) -> Dict[str, Any]:
+        """Build the result dictionary for a decoded image"""
+        return {
+            "success": True,
+            "image_path": image_path,
+            "task_type": task_type,
+            "output_format": output_format,
+            "text": text,
+            "prompt": prompt,
+            "cache_hit": False,
+            "vision_cache_hit": vision_cache_hit,
+            "vision_tokens": vision_tokens,
+            "truncated_due_to_repetition": stop_reason == "repetition",
+            "status": self._status(stop_reason)
+        }
+    
+    def _image_hash(self, image_path: str) -> Optional[str]:
+        """Hash the image bytes when any content-addressed cache is enabled"""
+        if self.result_cache is None and self.vision_cache_size == 0:
+            return None
+        return hash_file(image_path)
+    
+    def _resolve_pixel_budget(
+        self,
+        pixel_preset: Optional[str],
+        min_pixels: Optional[int],
+        max_pixels: Optional[int],
+        use_defaults: bool = True
+    ) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Resolve a (min_pixels, max_pixels) budget
+        
+        Explicit values win over the preset, and the preset wins over the
+        engine defaults. None leaves the processor's own limit in place.
+        """
+        if pixel_preset is not None and pixel_preset not in self.PIXEL_PRESETS:
+            raise ValueError(
+                f"Unknown pixel preset '{pixel_preset}'. "
+                f"Choose from: {', '.join(self.PIXEL_PRESETS)}"
+            )
+        preset_min, preset_max = self.PIXEL_PRESETS.get(pixel_preset, (None, None))
+        if use_defaults and pixel_preset is None:
+            preset_min, preset_max = self.min_pixels, self.max_pixels
+        return (
+            min_pixels if min_pixels is not None else preset_min,
+            max_pixels if max_pixels is not None else preset_max
+        )
+    
+    def _cache_key(
+        self,
+        image_hash: Optional[str],
+        prompt: str,
+        max_new_tokens: int,
+        pixel_budget: Tuple[Optional[int], Optional[int]]
+    ) -> Optional[str]:
+        """Build the result cache key for an image, or None when caching is off"""
+        if self.result_cache is None:
+            return None
+        return OCRResultCache.make_key(
+            image_hash,
+            model_id=self.model_id,
+            torch_dtype=self.torch_dtype,
+            # int8 runs in float32, so the dtype alone does not tell it apart
+            quantization=self.quantization,
+            quantize_vision=self.quantize_vision,
+            stop_on_repetition=self.stop_on_repetition,
+            prompt=prompt,
+            max_new_tokens=max_new_tokens,
+            min_pixels=pixel_budget[0],
+            max_pixels=pixel_budget[1]
+        )
+    
+    def _cached_result(
+        self,
+        cache_key: Optional[str],
+        image_path: str,
+        task_type: str,
+        output_format: str
+    ) -> Optional[Dict[str, Any]]:
+        """Return a cached result re-labelled for this request, if present"""
+        if cache_key is None:
+            return None
+        cached = self.result_cache.get(cache_key)
+        if cached is None:
+            return None
+        cached.update(
+            image_path=image_path,
+            task_type=task_type,
+            output_format=output_format,
+            cache_hit=True
+        )
+        return cached
+    
+    def _store_result(self, cache_key: Optional[str], result: Dict[str, Any]):
+        """Store a successful, complete result in the result cache"""
+        if cache_key is not None and result.get("success") and result.get("status") == "completed":
+            self.result_cache.put(cache_key, result)
+    
+    def _load_image(
+        self,
+        image_path: str,
+        pixel_budget: Tuple[Optional[int], Optional[int]] = (None, None)
+    ) -> Image.Image:
+        """
+        Load an image from disk as RGB, no larger than the pixel budget needs
+        
+        process_vision_info shrinks every image to at most max_pixels anyway,
+        so oversized images are decoded small: JPEGs at a reduced DCT scale
+        (draft mode), other formats reduced by an integer factor before the
+        RGB conversion. The result never drops below the size the image is
+        resized to, so the model sees the same detail.
+        """
+        start = time.perf_counter()
+        image = Image.open(image_path)
+        width, height = image.size
+        max_pixels = pixel_budget[1] if pixel_budget[1] is not None else self._default_max_pixels()
+        target = None
+        if max_pixels and width * height > max_pixels:
+            scale = math.sqrt(max_pixels / (width * height))
+            target = (max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale)))
+            if image.format == "JPEG":
+                # Picks the smallest 1/2, 1/4 or 1/8 scale still >= target
+                image.draft("RGB", target)
+        image.load()
+        decoded_bytes = image.size[0] * image.size[1] * len(image.getbands())
+        
+        if target is not None:
+            factor = min(image.size[0] // target[0], image.size[1] // target[1])
+            if factor >= 2:
+                if image.mode not in ("L", "LA", "RGB", "RGBA", "CMYK", "I", "F"):
+                    image = image.convert("RGB")
+                image = image.reduce(factor)
+        image = image.convert("RGB")
+        
+        with self._decode_lock:
+            stats = self._decode_stats
+            stats["images"] += 1
+            stats["reduced"] += int(image.size != (width, height))
+            stats["decode_seconds"] += time.perf_counter() - start
+            stats["peak_decoded_bytes"] = max(stats["peak_decoded_bytes"], decoded_bytes)
+            stats["peak_full_resolution_bytes"] = max(
+                stats["peak_full_resolution_bytes"], width * height * 3
             )
-            image_inputs, video_inputs = process_vision_info(messages)
-            inputs = self.processor(
-                text=[text],
+        return image
+    
+    def _default_max_pixels(self) -> Optional[int]:
+        """The processor's own max_pixels, used when no budget is set"""
+        image_processor = self.processor.image_processor
+        max_pixels = getattr(image_processor, "max_pixels", None)
+        if max_pixels is None:
+            max_pixels = (getattr(image_processor, "size", None) or {}).get("longest_edge")
+        return max_pixels
+    
+    def _build_messages(
+        self,
+        image: Image.Image,
+        prompt: str,
+        pixel_budget: Tuple[Optional[int], Optional[int]] = (None, None)
+    ) -> List[Dict[str, Any]]:
+        """Build the chat messages for a single image/prompt pair"""
+        image_content = {"type": "image", "image": image}
+        # process_vision_info resizes the image into this area range before tokenization
+        if pixel_budget[0] is not None:
+            image_content["min_pixels"] = pixel_budget[0]
+        if pixel_budget[1] is not None:
+            image_content["max_pixels"] = pixel_budget[1]
+        return [
+            {
+                "role": "user",
+                "content": [
+                    image_content,
+                    {"type": "text", "text": prompt},
+                ],
+            }
+        ]
+    
+    def _count_vision_tokens(self, inputs) -> List[int]:
+        """Count the image placeholder tokens in each row of a batch"""
+        image_mask = inputs["input_ids"] == self._model_config.image_token_id
+        return [int(count) for count in image_mask.sum(dim=1)]
+    
+    def _chat_text(self, messages: List[Dict[str, Any]]) -> str:
+        """Apply the chat template, memoised per prompt since the scaffold never changes"""
+        prompt = messages[0]["content"][-1]["text"]
+        with self._chat_text_lock:
+            text = self._chat_text_cache.get(prompt)
+            if text is not None:
+                self._chat_text_cache.move_to_end(prompt)
+                return text
+        text = self.processor.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True
+        )
+        with self._chat_text_lock:
+            self._chat_text_cache[prompt] = text
+            while len(self._chat_text_cache) > self.CHAT_TEXT_CACHE_SIZE:
+                self._chat_text_cache.popitem(last=False)
+        return text
+    
+    def _prepare_inputs(self, conversations: List[List[Dict[str, Any]]]):
+        """
+        Tokenize one or more conversations into a single (left-padded) batch
+        
+        Args:
+            conversations: List of chat message lists, one per image
+        
+        Returns:
+            Processor outputs moved to the engine device
+        """
+        return self._to_device(self._tokenize(conversations))
+    
+    def _tokenize(self, conversations: List[List[Dict[str, Any]]]):
+        """Resize images and tokenize conversations on the CPU (safe off the model thread)"""
+        texts = [self._chat_text(messages) for messages in conversations]
+        image_inputs, video_inputs = process_vision_info(conversations)
+        with self._tokenizer_lock:
+            return self.processor(
+                text=texts,
                 images=image_inputs,
                 videos=video_inputs,
                 padding=True,
                 return_tensors="pt",
             )
+    
+    def _to_device(self, inputs):
+        """Move tokenized inputs to the engine device"""
+        if self.use_cpu:
+            return inputs.to("cpu")
+        return inputs.to(self.device)
+    
+    def _reuse_vision_embeddings(self, inputs, image_hash: Optional[str]):
+        """
+        Swap pixel_values for precomputed input embeddings of a single image
+        
+        The vision tower output for each recently seen image is kept in a
+        bounded LRU keyed by image hash. On later prompts for the same image
+        the cached embeddings are scattered into the text embeddings and
+        passed as ``inputs_embeds``, so generate skips the vision encoder.
+        ``image_grid_thw`` stays in the inputs for the multimodal rope.
+        
+        Args:
+            inputs: Processor outputs for a single conversation
+            image_hash: Hash of the image bytes (None disables re-use)
+        
+        Returns:
+            Tuple of (generate inputs, whether the vision cache was hit)
+        """
+        use_cache = self.vision_cache_size > 0 and image_hash is not None
+        # The prefix-cache prefill also needs inputs_embeds, even when nothing is cached
+        if "pixel_values" not in inputs or not (use_cache or self.prefix_cache):
+            return inputs, False
+        
+        grid_thw = inputs["image_grid_thw"]
+        with self._model_lock, torch.no_grad():
+            cached = self._vision_cache.get(image_hash) if use_cache else None
+            # A different grid means different preprocessing, so the cached embeddings no longer fit
+            hit = cached is not None and torch.equal(cached[1], grid_thw)
             
-            # Move to device
-            if self.use_cpu:
-                inputs = {k: v.to("cpu") for k, v in inputs.items()}
+            if hit:
+                self._vision_cache.move_to_end(image_hash)
+                self._vision_cache_hits += 1
+                image_embeds = cached[0]
             else:
-                inputs = inputs.to(self.device)
+                image_embeds = self.model.visual(
+                    inputs["pixel_values"].type(self.torch_dtype), grid_thw=grid_thw
+                )
+                if use_cache:
+                    self._vision_cache_misses += 1
+                    self._vision_cache[image_hash] = (image_embeds, grid_thw.clone())
+                    while len(self._vision_cache) > self.vision_cache_size:
+                        self._vision_cache.popitem(last=False)
+            
+            input_ids = inputs["input_ids"]
+            inputs_embeds = self.model.get_input_embeddings()(input_ids)
+            image_mask = (input_ids == self.model.config.image_token_id).unsqueeze(-1)
+            inputs_embeds = inputs_embeds.masked_scatter(
+                image_mask.expand_as(inputs_embeds),
+                image_embeds.to(inputs_embeds.device, inputs_embeds.dtype)
+            )
+        
+        generate_inputs = {k: v for k, v in inputs.items() if k != "pixel_values"}
+        generate_inputs["inputs_embeds"] = inputs_embeds
+        return generate_inputs, hit
+    
+    def _rope_owner(self):
+        """Return the module holding get_rope_index/rope_deltas (moved in newer transformers)"""
+        # Only called mid-prefill, with the model loaded and its lock held
+        inner = getattr(self._model, "model", None)
+        return inner if hasattr(inner, "get_rope_index") else self._model
+    
+    def _prefill_from_prefix(self, inputs, prompt_label: str) -> Optional[Dict[str, Any]]:
+        """
+        Prefill a single request on top of the cached chat-template prefix
+        
+        Everything up to and including ``<|vision_start|>`` is identical for
+        every request, so its KV cache is computed once and copied. The image
+        tokens and the prompt text follow it and are prefilled here with the
+        full multimodal rope positions; generate then only runs the last
+        prompt token and the decode steps.
+        
+        Args:
+            inputs: Single-request inputs carrying inputs_embeds
+            prompt_label: Label for the per-format counters
+        
+        Returns:
+            Generate kwargs with a filled past_key_values, or None if not applicable
+        """
+        input_ids = inputs["input_ids"]
+        if input_ids.shape[0] != 1 or "inputs_embeds" not in inputs:
+            return None
+        vision_start = (input_ids[0] == self.model.config.vision_start_token_id).nonzero()
+        if len(vision_start) == 0:
+            return None
+        prefix_len = int(vision_start[0]) + 1
+        end = input_ids.shape[1] - 1
+        attention_mask = inputs["attention_mask"]
+        
+        with torch.no_grad():
+            prefix_key = tuple(input_ids[0, :prefix_len].tolist())
+            prefix_kv = self._prefix_kv.get(prefix_key)
+            hit = prefix_kv is not None
+            if not hit:
+                prefix_kv = DynamicCache()
+                self.model(
+                    input_ids=input_ids[:, :prefix_len],
+                    attention_mask=attention_mask[:, :prefix_len],
+                    past_key_values=prefix_kv,
+                    use_cache=True
+                )
+                self._prefix_kv[prefix_key] = prefix_kv
+            
+            rope_owner = self._rope_owner()
+            position_ids, rope_deltas = rope_owner.get_rope_index(
+                input_ids,
+                image_grid_thw=inputs["image_grid_thw"],
+                attention_mask=attention_mask
+            )
+            past_key_values = copy.deepcopy(prefix_kv)
+            self.model(
+                inputs_embeds=inputs["inputs_embeds"][:, prefix_len:end],
+                attention_mask=attention_mask[:, :end],
+                position_ids=position_ids[:, :, prefix_len:end],
+                past_key_values=past_key_values,
+                cache_position=torch.arange(prefix_len, end, device=input_ids.device),
+                use_cache=True
+            )
+            # Decode steps derive their positions from rope_deltas
+            rope_owner.rope_deltas = rope_deltas
+        
+        stats = self._prefix_stats.setdefault(
+            prompt_label, {"hits": 0, "misses": 0, "prefill_tokens_saved": 0}
+        )
+        if hit:
+            stats["hits"] += 1
+            stats["prefill_tokens_saved"] += prefix_len
+        else:
+            stats["misses"] += 1
+        
+        return {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "past_key_values": past_key_values
+        }
+    
+    def _generate(
+        self,
+        inputs,
+        max_new_tokens: int,
+        prompt_label: Optional[str] = None,
+        deadlines: Optional[List[Optional[float]]] = None,
+        cancel_tokens: Optional[List[Optional[CancellationToken]]] = None,
+        streamer: Optional[TextIteratorStreamer] = None,
+        on_row_finished: Optional[Callable[[int, str], None]] = None
+    ) -> Tuple[List[str], List[Optional[str]]]:
+        """
+        Run generate on prepared inputs and decode only the new tokens
+        
+        Args:
+            inputs: Prepared (left-padded) inputs
+            max_new_tokens: Maximum number of tokens to generate
+            prompt_label: Label for prefix-cache counters (single requests only)
+            deadlines: Per-row time.monotonic() deadlines
+            cancel_tokens: Per-row cancellation tokens
+            streamer: Receives tokens as they are generated (single requests only)
+            on_row_finished: Called with (row, decoded text) as soon as a row
+                emits EOS, while the rest of the batch keeps decoding
+        
+        Returns:
+            Tuple of (decoded texts, per-row early stop reason or None)
+        """
+        if self.compiled:
+            inputs = self._pad_to_bucket(inputs)
+        prompt_length = inputs["input_ids"].shape[1]
+        tokenizer = self.processor.tokenizer
+        # Finished rows of a batch are padded with these; no criterion may claim them
+        finished_ids = [
+            token_id for token_id in (tokenizer.eos_token_id, tokenizer.pad_token_id)
+            if token_id is not None
+        ]
+        criteria = []
+        # Checked between decode steps; rows stop with whatever text they have so far
+        deadline_criteria = None
+        if deadlines and any(d is not None for d in deadlines):
+            deadline_criteria = DeadlineStoppingCriteria(prompt_length, deadlines, ignore_token_ids=finished_ids)
+            criteria.append(deadline_criteria)
+        cancel_criteria = None
+        if cancel_tokens and any(t is not None for t in cancel_tokens):
+            cancel_criteria = CancellationStoppingCriteria(prompt_length, cancel_tokens, ignore_token_ids=finished_ids)
+            criteria.append(cancel_criteria)
+        repetition = None
+        if self.stop_on_repetition:
+            repetition = RepetitionStoppingCriteria(prompt_length, ignore_token_ids=finished_ids)
+            criteria.append(repetition)
+        if on_row_finished is not None:
+            criteria.append(FinishedRowCallback(
+                prompt_length,
+                lambda row, token_ids: on_row_finished(row, self._decode([token_ids])[0]),
+                finished_ids,
+                others=(deadline_criteria, cancel_criteria, repetition)
+            ))
+        
+        with self._model_lock:
+            generate_inputs = inputs
+            if self.prefix_cache and prompt_label is not None:
+                try:
+                    generate_inputs = self._prefill_from_prefix(inputs, prompt_label) or inputs
+                except Exception as e:
+                    logger.warning(f"Prefix KV cache unavailable ({e}); disabling it")
+                    self.prefix_cache = False
+                    generate_inputs = inputs
             
-            # Generate
-            logger.info(f"Processing image: {image_path}")
+            start = time.perf_counter()
             with torch.no_grad():
                 generated_ids = self.model.generate(
-                    **inputs,
-                    max_new_tokens=max_new_tokens
+                    **generate_inputs,
+                    max_new_tokens=max_new_tokens,
+                    stopping_criteria=StoppingCriteriaList(criteria),
+                    streamer=streamer
                 )
-            
-            # Decode output
-            generated_ids_trimmed = [
-                out_ids[len(in_ids):]
-                for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-            ]
-            output_text = self.processor.batch_decode(
-                generated_ids_trimmed,
+            self._generate_seconds += time.perf_counter() - start
+            self._generated_tokens += (generated_ids.shape[1] - prompt_length) * generated_ids.shape[0]
+        
+        stop_reasons: List[Optional[str]] = [None] * generated_ids.shape[0]
+        for reason, criterion in (("deadline_exceeded", deadline_criteria), ("cancelled", cancel_criteria)):
+            if criterion is None:
+                continue
+            for row, generated_length in criterion.triggered.items():
+                stop_reasons[row] = stop_reasons[row] or reason
+                logger.warning(f"Generation {reason.replace('_', ' ')} after {generated_length} tokens")
+        if repetition is not None:
+            for row, generated_length in repetition.triggered.items():
+                stop_reasons[row] = stop_reasons[row] or "repetition"
+                self._repetition_stops += 1
+                self._repetition_tokens_saved += max_new_tokens - generated_length
+                logger.warning(
+                    f"Stopped repeating output after {generated_length} tokens "
+                    f"({max_new_tokens - generated_length} tokens saved)"
+                )
+        
+        # With left padding every row shares the same prompt length
+        generated_ids_trimmed = [
+            out_ids[prompt_length:]
+            for out_ids in generated_ids
+        ]
+        return self._decode(generated_ids_trimmed), stop_reasons
+    
+    def _decode(self, token_ids: List[torch.Tensor]) -> List[str]:
+        """Decode generated token ids to text"""
+        with self._tokenizer_lock:
+            return self.processor.batch_decode(
+                token_ids,
                 skip_special_tokens=True,
                 clean_up_tokenization_spaces=False
             )
-            
-            return {
-                "success": True,
-                "image_path": image_path,
-                "task_type": task_type,
-                "output_format": output_format,
-                "text": output_text[0],
-                "prompt": prompt
-            }
-            
-        except Exception as e:
-            logger.error(f"Error processing image {image_path}: {e}")
-            return {
-                "success": False,
-                "image_path": image_path,
-                "error": str(e)
-            }
     
     def _generate_prompt(self, task_type: str, output_format: str) -> str:
         """Generate appropriate prompt based on task type and output format"""
@@ -203,43 +1484,440 @@ class GutenOCREngine:
     
     def batch_process(
         self,
-        image_paths: List[str],
+        image_paths: Iterable[str],
         task_type: str = "reading",
         output_format: str = "TEXT",
-        max_new_tokens: int = 4096
+        max_new_tokens: int = 4096,
+        batch_size: Optional[int] = None,
+        pixel_preset: Optional[str] = None,
+        min_pixels: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        prefetch_depth: int = 2
     ) -> List[Dict[str, Any]]:
         """
         Process multiple images in batch
         
+        Collects iter_batch_process into a list; see it for the arguments.
+        
+        Returns:
+            List of results for each image, in input order
+        """
+        return list(self.iter_batch_process(
+            image_paths,
+            task_type=task_type,
+            output_format=output_format,
+            max_new_tokens=max_new_tokens,
+            batch_size=batch_size,
+            pixel_preset=pixel_preset,
+            min_pixels=min_pixels,
+            max_pixels=max_pixels,
+            time_budget=time_budget,
+            cancel_token=cancel_token,
+            prefetch_depth=prefetch_depth
+        ))
+    
+    def iter_batch_process(
+        self,
+        image_paths: Iterable[str],
+        task_type: str = "reading",
+        output_format: str = "TEXT",
+        max_new_tokens: int = 4096,
+        batch_size: Optional[int] = None,
+        pixel_preset: Optional[str] = None,
+        min_pixels: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        prefetch_depth: int = 2
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Process multiple images in batch, yielding results as chunks finish
+        
+        Images are grouped into chunks of ``batch_size`` and each chunk is run
+        through a single left-padded ``generate`` call. If a chunk fails, its
+        images are retried one by one so a single bad image does not fail the
+        whole batch. While a chunk generates, the next ``prefetch_depth``
+        chunks are decoded and tokenized on a background thread.
+        
         Args:
-            image_paths: List of image paths
+            image_paths: Image paths (list or generator)
             task_type: Type of task
             output_format: Output format
             max_new_tokens: Maximum tokens to generate
+            batch_size: Images per generate call (default: engine batch_size)
+            pixel_preset: Pixel budget preset (default: engine setting)
+            min_pixels: Minimum image area (overrides preset)
+            max_pixels: Maximum image area (overrides preset)
+            time_budget: Seconds each image may take, counted from when its chunk starts
+            cancel_token: Token that stops the remaining work when cancelled
+            prefetch_depth: Chunks prepared ahead of the model; bounds the
+                tokenized images held in memory (0 prepares inline)
         
-        Returns:
-            List of results for each image
+        Yields:
+            One result per image, in input order
         """
-        results = []
-        for image_path in image_paths:
-            result = self.process_image(
-                image_path,
-                task_type=task_type,
-                output_format=output_format,
-                max_new_tokens=max_new_tokens
+        batch_size = max(1, batch_size or self.batch_size)
+        # Chunks are cut lazily, so image_paths may be a discovery generator
+        paths = iter(image_paths)
+        chunks = iter(lambda: list(itertools.islice(paths, batch_size)), [])
+        
+        def prepare(chunk: List[str]) -> Dict[str, Any]:
+            return self._prepare_chunk(
+                chunk,
+                task_type,
+                output_format,
+                max_new_tokens,
+                pixel_preset=pixel_preset,
+                min_pixels=min_pixels,
+                max_pixels=max_pixels,
+                cancel_tokens=[cancel_token] * len(chunk)
             )
-            results.append(result)
+        
+        for prepared in prefetch(prepare, chunks, depth=prefetch_depth):
+            count = len(prepared["image_paths"])
+            deadline = time.monotonic() + time_budget if time_budget else None
+            yield from self._run_chunk(
+                prepared,
+                deadlines=[deadline] * count,
+                cancel_tokens=[cancel_token] * count
+            )
+    
+    def _process_chunk(
+        self,
+        image_paths: List[str],
+        task_type: str,
+        output_format: str,
+        max_new_tokens: int,
+        custom_prompt: Optional[str] = None,
+        pixel_preset: Optional[str] = None,
+        min_pixels: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        deadlines: Optional[List[Optional[float]]] = None,
+        cancel_tokens: Optional[List[Optional[CancellationToken]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Process one chunk with a single generate call, falling back per image"""
+        prepared = self._prepare_chunk(
+            image_paths,
+            task_type,
+            output_format,
+            max_new_tokens,
+            custom_prompt=custom_prompt,
+            pixel_preset=pixel_preset,
+            min_pixels=min_pixels,
+            max_pixels=max_pixels,
+            cancel_tokens=cancel_tokens
+        )
+        return self._run_chunk(prepared, deadlines=deadlines, cancel_tokens=cancel_tokens)
+    
+    def _prepare_chunk(
+        self,
+        image_paths: List[str],
+        task_type: str,
+        output_format: str,
+        max_new_tokens: int,
+        custom_prompt: Optional[str] = None,
+        pixel_preset: Optional[str] = None,
+        min_pixels: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        cancel_tokens: Optional[List[Optional[CancellationToken]]] = None
+    ) -> Dict[str, Any]:
+        """
+        CPU half of a chunk: hash, result cache lookup, decode and tokenize
+        
+        Never touches the model or the device, so the next chunk can be
+        prepared on another thread while the current one generates.
+        
+        Returns:
+            Prepared chunk for _run_chunk
+        """
+        prompt = custom_prompt or self._generate_prompt(task_type, output_format)
+        pixel_budget = self._resolve_pixel_budget(pixel_preset, min_pixels, max_pixels)
+        cancel_tokens = cancel_tokens or [None] * len(image_paths)
+        prepared = {
+            "image_paths": image_paths,
+            "task_type": task_type,
+            "output_format": output_format,
+            "max_new_tokens": max_new_tokens,
+            "custom_prompt": custom_prompt,
+            "pixel_options": {
+                "pixel_preset": pixel_preset,
+                "min_pixels": min_pixels,
+                "max_pixels": max_pixels
+            },
+            "prompt": prompt,
+            "results": [None] * len(image_paths),
+            "image_hashes": [None] * len(image_paths),
+            "cache_keys": [None] * len(image_paths),
+            "batch_indices": [],
+            "conversations": [],
+            "inputs": None,
+            "error": None
+        }
+        
+        # Cache hits and images that cannot be loaded get their result up
+        # front and are left out of the batched generate call
+        for idx, image_path in enumerate(image_paths):
+            if cancel_tokens[idx] is not None and cancel_tokens[idx].cancelled:
+                # Reported as cancelled by _run_chunk
+                continue
+            try:
+                prepared["image_hashes"][idx] = self._image_hash(image_path)
+                prepared["cache_keys"][idx] = self._cache_key(
+                    prepared["image_hashes"][idx], prompt, max_new_tokens, pixel_budget
+                )
+                cached = self._cached_result(
+                    prepared["cache_keys"][idx], image_path, task_type, output_format
+                )
+                if cached is not None:
+                    prepared["results"][idx] = cached
+                    continue
+                image = self._load_image(image_path, pixel_budget)
+            except Exception as e:
+                logger.error(f"Error processing image {image_path}: {e}")
+                prepared["results"][idx] = {
+                    "success": False,
+                    "image_path": image_path,
+                    "error": str(e)
+                }
+                continue
+            prepared["batch_indices"].append(idx)
+            prepared["conversations"].append(self._build_messages(image, prompt, pixel_budget))
+        
+        if prepared["conversations"]:
+            try:
+                prepared["inputs"] = self._tokenize(prepared["conversations"])
+            except Exception as e:
+                # _run_chunk retries these images one by one
+                prepared["error"] = e
+        return prepared
+    
+    def _merge_chunks(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Combine chunks prepared separately (same prompt and budgets) into one
+        
+        Lets callers prepare requests one at a time ahead of the model and
+        decide the batch only when the model is free. Tokenized inputs are
+        left-padded and concatenated, exactly as one processor call would
+        have produced them.
+        
+        Args:
+            chunks: Prepared chunks from _prepare_chunk, in batch order
+        
+        Returns:
+            Prepared chunk for _run_chunk
+        """
+        if len(chunks) == 1:
+            return chunks[0]
+        merged = {
+            **chunks[0],
+            "image_paths": [],
+            "results": [],
+            "image_hashes": [],
+            "cache_keys": [],
+            "batch_indices": [],
+            "conversations": [],
+            "inputs": None,
+            "error": None
+        }
+        parts = []
+        for chunk in chunks:
+            offset = len(merged["image_paths"])
+            for key in ("image_paths", "results", "image_hashes", "cache_keys", "conversations"):
+                merged[key].extend(chunk[key])
+            merged["batch_indices"].extend(offset + idx for idx in chunk["batch_indices"])
+            if chunk["conversations"]:
+                if chunk["error"] is not None:
+                    merged["error"] = chunk["error"]
+                parts.append(chunk["inputs"])
+        if parts and merged["error"] is None:
+            try:
+                merged["inputs"] = self._concat_inputs(parts)
+            except Exception as e:
+                # _run_chunk retries these images one by one
+                merged["error"] = e
+        return merged
+    
+    def _concat_inputs(self, parts: List[BatchFeature]) -> BatchFeature:
+        """Left-pad tokenized batches to a common length and stack them into one"""
+        length = max(part["input_ids"].shape[1] for part in parts)
+        pad_values = {"input_ids": self.processor.tokenizer.pad_token_id, "attention_mask": 0}
+        merged = {}
+        for key in parts[0].keys():
+            if key in pad_values:
+                merged[key] = torch.cat([
+                    torch.nn.functional.pad(
+                        part[key], (length - part[key].shape[1], 0), value=pad_values[key]
+                    )
+                    for part in parts
+                ])
+            else:
+                # pixel_values and image_grid_thw are stacked along the patch/image axis
+                merged[key] = torch.cat([part[key] for part in parts])
+        return BatchFeature(merged)
+    
+    def _run_chunk(
+        self,
+        prepared: Dict[str, Any],
+        deadlines: Optional[List[Optional[float]]] = None,
+        cancel_tokens: Optional[List[Optional[CancellationToken]]] = None,
+        on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Model half of a chunk: one generate call over the prepared images, falling back per image
+        
+        ``on_result(index, result)`` is called for each batched image whose
+        output ends (EOS) before the rest of the batch, as soon as it does;
+        every result is also in the returned list.
+        """
+        image_paths = prepared["image_paths"]
+        task_type = prepared["task_type"]
+        output_format = prepared["output_format"]
+        max_new_tokens = prepared["max_new_tokens"]
+        prompt = prepared["prompt"]
+        deadlines = deadlines or [None] * len(image_paths)
+        cancel_tokens = cancel_tokens or [None] * len(image_paths)
+        results = list(prepared["results"])
+        
+        # Deadlines and cancellation are checked now, not when the chunk was prepared
+        for idx, image_path in enumerate(image_paths):
+            if results[idx] is None:
+                results[idx] = self._check_abandoned(image_path, deadlines[idx], cancel_tokens[idx])
+        rows = [
+            (row, idx) for row, idx in enumerate(prepared["batch_indices"])
+            if results[idx] is None
+        ]
+        batch_indices = [idx for _, idx in rows]
+        
+        # Rows that finish early are handed back while the rest decode
+        early: Dict[int, Dict[str, Any]] = {}
+        if batch_indices:
+            try:
+                if prepared["error"] is not None:
+                    raise prepared["error"]
+                inputs = prepared["inputs"]
+                if len(rows) < len(prepared["batch_indices"]):
+                    inputs = self._tokenize([prepared["conversations"][row] for row, _ in rows])
+                inputs = self._to_device(inputs)
+                
+                if len(batch_indices) == 1:
+                    idx = batch_indices[0]
+                    results[idx] = self._run_single(
+                        image_paths[idx], inputs, prepared["image_hashes"][idx],
+                        prepared["cache_keys"][idx], prompt, task_type, output_format,
+                        max_new_tokens, bool(prepared["custom_prompt"]),
+                        deadlines[idx], cancel_tokens[idx]
+                    )
+                else:
+                    vision_tokens = self._count_vision_tokens(inputs)
+                    logger.info(f"Processing batch of {len(batch_indices)} images")
+                    
+                    def row_finished(row: int, text: str):
+                        idx = batch_indices[row]
+                        early[idx] = self._success_result(
+                            image_paths[idx], task_type, output_format, text, prompt,
+                            False, vision_tokens[row], None
+                        )
+                        self._store_result(prepared["cache_keys"][idx], early[idx])
+                        on_result(idx, early[idx])
+                    
+                    output_text, stop_reasons = self._generate(
+                        inputs,
+                        max_new_tokens,
+                        deadlines=[deadlines[idx] for idx in batch_indices],
+                        cancel_tokens=[cancel_tokens[idx] for idx in batch_indices],
+                        on_row_finished=row_finished if on_result is not None else None
+                    )
+                    for idx, text, n_vision, stop_reason in zip(
+                        batch_indices, output_text, vision_tokens, stop_reasons
+                    ):
+                        if idx in early:
+                            results[idx] = early[idx]
+                            continue
+                        results[idx] = self._success_result(
+                            image_paths[idx], task_type, output_format, text, prompt,
+                            False, n_vision, stop_reason
+                        )
+                        self._store_result(prepared["cache_keys"][idx], results[idx])
+            except Exception as e:
+                logger.warning(
+                    f"Batched generation failed ({e}); falling back to per-image processing"
+                )
+                for idx in batch_indices:
+                    # Rows already handed back keep their result
+                    results[idx] = early.get(idx)
+        
+        for idx, image_path in enumerate(image_paths):
+            if results[idx] is None:
+                results[idx] = self.process_image(
+                    image_path,
+                    task_type=task_type,
+                    output_format=output_format,
+                    max_new_tokens=max_new_tokens,
+                    custom_prompt=prepared["custom_prompt"],
+                    deadline=deadlines[idx],
+                    cancel_token=cancel_tokens[idx],
+                    **prepared["pixel_options"]
+                )
+        
         return results
     
+    def _decode_info(self) -> Dict[str, Any]:
+        """Image decode time and the largest bitmap materialised so far"""
+        with self._decode_lock:
+            stats = dict(self._decode_stats)
+        stats["average_decode_ms"] = round(
+            1000 * stats["decode_seconds"] / stats["images"], 2
+        ) if stats["images"] else 0
+        stats["decode_seconds"] = round(stats["decode_seconds"], 3)
+        return stats
+    
     def get_device_info(self) -> Dict[str, Any]:
         """Get information about the device being used"""
         return {
             "device": self.device,
             "use_cpu": self.use_cpu,
             "torch_dtype": str(self.torch_dtype),
+            "cpu_features": self.cpu_features,
+            "thread_config": self.thread_config,
             "cuda_available": torch.cuda.is_available(),
             "cuda_device_count": torch.cuda.device_count() if torch.cuda.is_available() else 0,
-            "model_id": self.model_id
+            "model_id": self.model_id,
+            "batch_size": self.batch_size,
+            "min_pixels": self.min_pixels,
+            "max_pixels": self.max_pixels,
+            "quantization": self.quantization,
+            "quantization_stats": self.quantization_stats or None,
+            "compiled": self.compiled,
+            "compile_stats": self.compile_stats or None,
+            "warmed_up": self.warmed_up,
+            "warmup_stats": self.warmup_stats or None,
+            "prepared_path": self.prepared_path,
+            "model_loaded": self.loaded,
+            "model_memory_bytes": self._model_memory_bytes() if self.loaded else 0,
+            "load_stats": {
+                **self.load_stats,
+                "idle_unload_seconds": self.idle_unload_seconds,
+                "idle_seconds": round(time.monotonic() - self._last_used, 1)
+            },
+            "generated_tokens": self._generated_tokens,
+            "tokens_per_second": round(self._generated_tokens / self._generate_seconds, 2) if self._generate_seconds else 0,
+            "repetition_stops": self._repetition_stops,
+            "repetition_tokens_saved": self._repetition_tokens_saved,
+            "image_decode": self._decode_info(),
+            "result_cache": self.result_cache.get_stats() if self.result_cache else None,
+            "vision_cache": {
+                "size": self.vision_cache_size,
+                "entries": len(self._vision_cache),
+                "hits": self._vision_cache_hits,
+                "misses": self._vision_cache_misses
+            },
+            "prefix_cache": {
+                "enabled": self.prefix_cache,
+                "prefixes": len(self._prefix_kv),
+                "per_format": {label: dict(stats) for label, stats in self._prefix_stats.items()}
+            }
         }
 
 # Made with Bob
@@ -0,0 +1,181 @@
+# merge_shards.py
+"""
+Merge Shards - Combine per-shard batch outputs and statistics into one report
+"""
+import re
+import json
+from pathlib import Path
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+import logging
+
+from result_sink import JSONLResultSink, ResultStatistics, read_jsonl
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SHARD_FILE = re.compile(r"_shard(\d+)of(\d+)_")
+
+
+def find_shard_files(output_dir: str, prefix: str) -> List[Dict[str, Any]]:
+    """
+    Find the JSON Lines files written by each shard of a batch
+
+    Args:
+        output_dir: Directory the shards wrote to
+        prefix: Results file stem ('ocr_results' or 'combined_results')
+
+    Returns:
+        One entry per file with its path, shard index and shard count,
+        ordered by shard and newest file first within a shard
+    """
+    files = []
+    for path in Path(output_dir).glob(f"{prefix}_shard*of*_*.jsonl"):
+        match = SHARD_FILE.search(path.name[len(prefix):])
+        if match is None:
+            continue
+        files.append({
+            "path": path,
+            "shard_index": int(match.group(1)),
+            "shard_count": int(match.group(2)),
+            "mtime": path.stat().st_mtime
+        })
+    files.sort(key=lambda f: (f["shard_count"], f["shard_index"], -f["mtime"]))
+    return files
+
+
+def merge_shards(
+    output_dir: str = "./output",
+    prefix: str = "combined_results",
+    shard_count: Optional[int] = None,
+    text_key: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Merge every shard's results into one JSON Lines file and one report
+
+    Results are streamed, so memory holds only the paths seen so far. A
+    shard that ran more than once (a retried Job index) contributes each
+    file once, from its newest output.
+
+    Args:
+        output_dir: Directory the shards wrote to; the merged files go here too
+        prefix: Results file stem ('ocr_results' or 'combined_results')
+        shard_count: Only merge outputs of this split (default: the largest found)
+        text_key: Result field holding the text (default: from the prefix)
+
+    Returns:
+        Report with overall and per-shard statistics and the written paths
+    """
+    text_key = text_key or ("combined_text" if prefix.startswith("combined") else "text")
+    files = find_shard_files(output_dir, prefix)
+    counts = sorted({f["shard_count"] for f in files})
+    if not counts:
+        raise FileNotFoundError(f"No {prefix}_shard*of*_*.jsonl files in {output_dir}")
+    if shard_count is None:
+        shard_count = counts[-1]
+    if len(counts) > 1:
+        logger.warning(f"Found outputs of {counts} shard splits; merging the {shard_count}-shard one")
+    files = [f for f in files if f["shard_count"] == shard_count]
+
+    timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = Path(output_dir)
+    per_shard: Dict[int, ResultStatistics] = {}
+    seen = set()
+    duplicates = 0
+    with JSONLResultSink(
+        str(output / f"{prefix}_merged_{timestamp_str}.jsonl"), text_key=text_key
+    ) as sink:
+        for shard_file in files:
+            statistics = per_shard.setdefault(shard_file["shard_index"], ResultStatistics(text_key=text_key))
+            for result in read_jsonl(shard_file["path"]):
+                key = result.get("file_path") or result.get("image_path")
+                if key is not None:
+                    if key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(key)
+                sink.write(result)
+                statistics.add(result)
+
+    report = {
+        "prefix": prefix,
+        "shard_count": shard_count,
+        "shards_found": sorted(per_shard),
+        "shards_missing": [index for index in range(shard_count) if index not in per_shard],
+        "duplicates_dropped": duplicates,
+        "source_files": [str(f["path"]) for f in files],
+        "merged_results": str(sink.path),
+        "statistics": sink.statistics.summary(),
+        "per_shard": {str(index): per_shard[index].summary() for index in sorted(per_shard)}
+    }
+    if report["shards_missing"]:
+        logger.warning(f"No output for shard(s) {report['shards_missing']} of {shard_count}")
+
+    stats_path = output / f"{prefix}_merged_{timestamp_str}_statistics.json"
+    with open(stats_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    report["statistics_path"] = str(stats_path)
+    report["report_path"] = _write_report(output / f"{prefix}_merged_{timestamp_str}_report.txt", report)
+    logger.info(f"Merged {len(files)} shard files into {sink.path}")
+    return report
+
+
+def _write_report(report_path: Path, report: Dict[str, Any]) -> str:
+    """Write the merge report in the layout of FileProcessor.create_summary_report"""
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write("="*80 + "\n")
+        f.write("GutenOCR Sharded Batch Summary Report\n")
+        f.write("="*80 + "\n\n")
+
+        f.write(f"Shards: {len(report['shards_found'])} of {report['shard_count']} reported\n")
+        if report["shards_missing"]:
+            f.write(f"Missing shards: {', '.join(map(str, report['shards_missing']))}\n")
+        f.write(f"Duplicates dropped: {report['duplicates_dropped']}\n")
+        f.write(f"Merged results: {report['merged_results']}\n\n")
+
+        f.write("Statistics:\n")
+        f.write("-" * 40 + "\n")
+        for key, value in report["statistics"].items():
+            f.write(f"{key.replace('_', ' ').title()}: {value}\n")
+
+        f.write("\n" + "="*80 + "\n")
+        f.write("Per Shard:\n")
+        f.write("="*80 + "\n\n")
+        for index, statistics in report["per_shard"].items():
+            f.write(
+                f"Shard {index}: {statistics['total_images']} files, "
+                f"{statistics['successful']} successful, {statistics['failed']} failed, "
+                f"{statistics['partial']} partial\n"
+            )
+
+    logger.info(f"Summary report saved to: {report_path}")
+    return str(report_path)
+
+
+def main():
+    """Main entry point for command-line usage"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge the outputs of a sharded GutenOCR batch")
+    parser.add_argument("--output", default="./output", help="Directory the shards wrote to")
+    parser.add_argument("--prefix", default="combined_results", help="Results file stem (combined_results or ocr_results)")
+    parser.add_argument("--shard-count", type=int, default=None, help="Shard split to merge (default: the largest found)")
+
+    args = parser.parse_args()
+
+    report = merge_shards(output_dir=args.output, prefix=args.prefix, shard_count=args.shard_count)
+    summary = report["statistics"]
+    print(f"\n=== Merge Complete ({len(report['shards_found'])}/{report['shard_count']} shards) ===")
+    print(f"Total files: {summary['total_images']}")
+    print(f"Successful: {summary['successful']}")
+    print(f"Failed: {summary['failed']}")
+    if report["shards_missing"]:
+        print(f"Missing shards: {report['shards_missing']}")
+    print(f"Merged results: {report['merged_results']}")
+    print(f"Report: {report['report_path']}")
+
+
+if __name__ == "__main__":
+    main()
+
+# Made with Bob
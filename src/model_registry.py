@@ -0,0 +1,224 @@
+# model_registry.py
+"""
+Model Registry - Process-wide cache of loaded GutenOCR engines
+"""
+import os
+import gc
+import time
+import threading
+import torch
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+import logging
+
+from gutenocr_engine import GutenOCREngine
+from cpu_capabilities import detect_cpu_features
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Shares loaded GutenOCR engines between every UI and processor in the process
+
+    Engines are keyed by (model_id, device, dtype, quantization). Callers
+    ``acquire`` an engine and ``release`` it when they switch away; released
+    engines stay loaded while they fit the memory budget of their device and
+    are evicted least recently used first. Before a model is loaded, idle
+    models are evicted to make room for it, so switching models never holds
+    the old and the new weights at the same time unless both fit. Engine
+    settings outside the key (cache_dir, batch_size, ...) come from the
+    caller that loaded the engine first.
+    """
+
+    def __init__(self, memory_budget_bytes: Optional[int] = None):
+        """
+        Initialize ModelRegistry
+
+        Args:
+            memory_budget_bytes: Weight bytes allowed per device class
+                (default: GUTENOCR_MODEL_MEMORY_BUDGET_GB, else 75% of host
+                memory for CPU and 90% of GPU memory for CUDA)
+        """
+        budget_gb = os.environ.get("GUTENOCR_MODEL_MEMORY_BUDGET_GB")
+        if memory_budget_bytes is None and budget_gb:
+            memory_budget_bytes = int(float(budget_gb) * 2**30)
+        self.memory_budget_bytes = memory_budget_bytes
+
+        # Loads happen under this lock, so two callers never load in parallel
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        # Weight size of every key loaded so far, used to size evictions on reload
+        self._known_bytes: Dict[Tuple, int] = {}
+        self._stats = {"loads": 0, "hits": 0, "evictions": 0}
+
+    def acquire(
+        self,
+        model_id: str = "rootsautomation/GutenOCR-3B",
+        device: str = "auto",
+        use_cpu: bool = False,
+        torch_dtype: Optional[torch.dtype] = None,
+        quantization: Optional[str] = None,
+        **engine_kwargs: Any
+    ) -> GutenOCREngine:
+        """
+        Return a loaded engine for these settings, loading it if needed
+
+        Args:
+            model_id: HuggingFace model ID
+            device: Device to use ('auto', 'cuda', 'cpu')
+            use_cpu: Force CPU usage
+            torch_dtype: Explicit dtype (None picks per device)
+            quantization: CPU quantization mode
+            **engine_kwargs: Further GutenOCREngine arguments, used only on load
+
+        Returns:
+            Shared GutenOCREngine; pass it to release() when done with it
+        """
+        on_cpu = use_cpu or not torch.cuda.is_available()
+        resolved_device, resolved_dtype, resolved_quantization = GutenOCREngine.resolve_placement(
+            device, use_cpu, torch_dtype, quantization,
+            detect_cpu_features() if on_cpu else None
+        )
+        key = (model_id, resolved_device, str(resolved_dtype), resolved_quantization)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry["refs"] += 1
+                entry["last_used"] = time.time()
+                self._stats["hits"] += 1
+                return entry["engine"]
+
+            device_class = self._device_class(resolved_device)
+            # Unknown size: free every idle model on the device before loading
+            self._evict_idle(device_class, incoming=self._known_bytes.get(key))
+
+            logger.info(f"Registry loading {key}")
+            engine = GutenOCREngine(
+                model_id=model_id,
+                device=device,
+                use_cpu=use_cpu,
+                torch_dtype=torch_dtype,
+                quantization=quantization,
+                **engine_kwargs
+            )
+            memory_bytes = engine._model_memory_bytes()
+            self._known_bytes[key] = memory_bytes
+            self._entries[key] = {
+                "engine": engine,
+                "refs": 1,
+                "memory_bytes": memory_bytes,
+                "device_class": device_class,
+                "last_used": time.time()
+            }
+            self._stats["loads"] += 1
+            self._evict_idle(device_class, incoming=0)
+            return engine
+
+    def release(self, engine: GutenOCREngine):
+        """
+        Mark one user of an engine as done; idle engines become evictable
+
+        Args:
+            engine: Engine previously returned by acquire()
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                if entry["engine"] is engine:
+                    entry["refs"] = max(0, entry["refs"] - 1)
+                    entry["last_used"] = time.time()
+                    self._evict_idle(entry["device_class"], incoming=0)
+                    return
+
+    def clear(self):
+        """Evict every idle engine"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry["refs"] == 0]:
+                self._evict(key)
+
+    def _device_class(self, device: str) -> str:
+        return "cpu" if device == "cpu" else "cuda"
+
+    def _budget(self, device_class: str) -> int:
+        if self.memory_budget_bytes is not None:
+            return self.memory_budget_bytes
+        if device_class == "cuda":
+            return int(torch.cuda.get_device_properties(0).total_memory * 0.9)
+
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        # Inside a container the cgroup limit is what actually applies
+        for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    total = min(total, int(f.read().strip()))
+                break
+            except (OSError, ValueError):
+                continue
+        return int(total * 0.75)
+
+    def _evict_idle(self, device_class: str, incoming: Optional[int]):
+        """Evict idle engines (LRU first) until the device fits ``incoming`` more bytes"""
+        candidates = [
+            key for key, entry in self._entries.items()
+            if entry["device_class"] == device_class and entry["refs"] == 0
+        ]
+        if incoming is None:
+            for key in candidates:
+                self._evict(key)
+            return
+
+        budget = self._budget(device_class)
+        for key in candidates:
+            used = sum(
+                entry["memory_bytes"] for entry in self._entries.values()
+                if entry["device_class"] == device_class
+            )
+            if used + incoming <= budget:
+                break
+            self._evict(key)
+
+    def _evict(self, key: Tuple):
+        entry = self._entries.pop(key)
+        logger.info(f"Registry evicting {key} ({entry['memory_bytes'] / 2**30:.2f} GiB)")
+        del entry
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        self._stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get loaded engines, budget use and load/hit/eviction counters"""
+        with self._lock:
+            return {
+                **self._stats,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "models": [
+                    {
+                        "model_id": key[0],
+                        "device": key[1],
+                        "torch_dtype": key[2],
+                        "quantization": key[3],
+                        "refs": entry["refs"],
+                        "memory_bytes": entry["memory_bytes"]
+                    }
+                    for key, entry in self._entries.items()
+                ]
+            }
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    """Return the process-wide ModelRegistry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
+
+# Made with Bob
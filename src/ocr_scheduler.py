@@ -0,0 +1,411 @@
+# ocr_scheduler.py
+"""
+OCR Scheduler - Shares one GutenOCREngine between many concurrent callers
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, List, Tuple, Iterable, Iterator
+from PIL import Image
+import logging
+
+from gutenocr_engine import GutenOCREngine
+from stopping_criteria import CancellationToken
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Marks a request whose decode/tokenize is in progress
+_PREPARING = object()
+
+
+class OCRScheduler:
+    """
+    Dynamic (batch-at-a-time) batching scheduler in front of a GutenOCREngine
+
+    Callers on any thread submit requests and get a Future back. A single
+    worker thread owns the model: at every scheduling step it admits the
+    oldest pending request plus up to ``max_batch_size - 1`` compatible
+    requests (same prompt, token and pixel budget) into one batched generate
+    call. This is not continuous batching: rows cannot join a running
+    decode, so a request that arrives during a long decode waits for it to
+    finish, and requests that arrive meanwhile are batched together once
+    the model is free. Within a batch, each Future resolves the step its
+    row emits EOS, so a short receipt is handed back while longer rows keep
+    decoding; the model stays busy until the longest row ends. Only images
+    that resize to similar areas (within ``max_size_ratio``) share a batch.
+    A prefetch thread decodes and tokenizes queued requests one at a time
+    while the model is busy; batch membership is decided on the model
+    thread when the batch starts.
+    """
+
+    def __init__(
+        self,
+        engine: GutenOCREngine,
+        max_batch_size: Optional[int] = None,
+        batch_wait_ms: float = 20.0,
+        prefetch_depth: int = 2,
+        max_size_ratio: Optional[float] = 4.0
+    ):
+        """
+        Initialize OCRScheduler
+
+        Args:
+            engine: Loaded GutenOCR engine; only the scheduler thread calls generate
+            max_batch_size: Maximum requests per generate call (default: engine batch_size)
+            batch_wait_ms: How long to wait for more requests before starting a batch
+            prefetch_depth: Batches' worth of queued requests prepared ahead of the
+                model; bounds the tokenized images held in memory (0 prepares
+                on the model thread)
+            max_size_ratio: Largest ratio between the biggest and smallest image
+                area (after the pixel budget) in one batch; None ignores size
+        """
+        self.engine = engine
+        self.max_batch_size = max(1, max_batch_size or engine.batch_size)
+        self.batch_wait_ms = batch_wait_ms
+        self.prefetch_depth = max(0, prefetch_depth)
+        self.max_size_ratio = max_size_ratio
+
+        self._pending: List[Tuple[Tuple, str, Future, Dict[str, Any]]] = []
+        self._condition = threading.Condition()
+        self._running = True
+        self._stats = {
+            "requests": 0, "completed": 0, "batches": 0, "max_batch_seen": 0,
+            "prepare_wait_seconds": 0.0, "early_results": 0
+        }
+
+        if self.prefetch_depth:
+            self._preparer = threading.Thread(
+                target=self._prepare_loop, name="ocr-scheduler-prefetch", daemon=True
+            )
+            self._preparer.start()
+        self._worker = threading.Thread(
+            target=self._run, name="ocr-scheduler", daemon=True
+        )
+        self._worker.start()
+
+    def submit(
+        self,
+        image_path: str,
+        task_type: str = "reading",
+        output_format: str = "TEXT",
+        max_new_tokens: int = 4096,
+        custom_prompt: Optional[str] = None,
+        pixel_preset: Optional[str] = None,
+        min_pixels: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        deadline: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        time_budget: Optional[float] = None
+    ) -> Future:
+        """
+        Queue an image for OCR
+
+        Args:
+            image_path: Path to the image file
+            task_type: Type of task
+            output_format: Output format
+            max_new_tokens: Maximum number of tokens to generate
+            custom_prompt: Custom prompt (overrides default)
+            pixel_preset: Pixel budget preset (default: engine setting)
+            min_pixels: Minimum image area (overrides preset)
+            max_pixels: Maximum image area (overrides preset)
+            deadline: time.monotonic() value after which decoding stops with partial text
+            cancel_token: Token the caller can cancel to stop this request early
+            time_budget: Seconds the request may take once it is admitted into a batch
+
+        Returns:
+            Future resolving to the same result dict as GutenOCREngine.process_image
+        """
+        future: Future = Future()
+        area = self._image_area(image_path, pixel_preset, min_pixels, max_pixels)
+        key = (
+            task_type, output_format, max_new_tokens, custom_prompt,
+            pixel_preset, min_pixels, max_pixels
+        )
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("OCRScheduler has been shut down")
+            control = {
+                "deadline": deadline,
+                "cancel_token": cancel_token,
+                "time_budget": time_budget,
+                "area": area,
+                # None until prepared; then the prepared chunk or the error it raised
+                "prepared": None
+            }
+            self._pending.append((key, image_path, future, control))
+            self._stats["requests"] += 1
+            # Both the prefetch and the model thread wait on this condition
+            self._condition.notify_all()
+        return future
+
+    def process_image(
+        self,
+        image_path: str,
+        task_type: str = "reading",
+        output_format: str = "TEXT",
+        max_new_tokens: int = 4096,
+        custom_prompt: Optional[str] = None,
+        pixel_preset: Optional[str] = None,
+        min_pixels: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        deadline: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        """Blocking drop-in for GutenOCREngine.process_image"""
+        return self.submit(
+            image_path,
+            task_type=task_type,
+            output_format=output_format,
+            max_new_tokens=max_new_tokens,
+            custom_prompt=custom_prompt,
+            pixel_preset=pixel_preset,
+            min_pixels=min_pixels,
+            max_pixels=max_pixels,
+            deadline=deadline,
+            cancel_token=cancel_token
+        ).result()
+
+    def imap(
+        self,
+        image_paths: Iterable[str],
+        window: Optional[int] = None,
+        **options: Any
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Submit images as earlier ones finish, yielding results in input order
+
+        Keeps ``window`` requests queued, enough to fill batches and keep the
+        prefetch thread busy, without reading a lazy path generator (e.g. a
+        work queue claiming files) further ahead than that.
+
+        Args:
+            image_paths: Images to process
+            window: Requests in flight at once (default: enough for the
+                running batch plus the prefetched ones)
+            **options: submit() arguments shared by every image
+
+        Yields:
+            One result dict per image
+        """
+        window = max(1, window or self.max_batch_size * (self.prefetch_depth + 2))
+        futures = deque()
+        for image_path in image_paths:
+            futures.append(self.submit(image_path, **options))
+            if len(futures) >= window:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+    def _next_batch(self) -> List[Tuple[Tuple, str, Future, Dict[str, Any]]]:
+        """Wait for work and pop the next batch of compatible requests"""
+        with self._condition:
+            while self._running and not self._pending:
+                self._condition.wait()
+            if not self._pending:
+                return []
+
+            # Give concurrent callers a short window to join this batch
+            deadline = time.monotonic() + self.batch_wait_ms / 1000.0
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    break
+                self._condition.wait(remaining)
+
+            key = self._pending[0][0]
+            batch, rest = [], []
+            smallest = largest = None
+            for request in self._pending:
+                area = request[3]["area"]
+                if request[0] != key or len(batch) >= self.max_batch_size:
+                    rest.append(request)
+                elif batch and not self._similar_size(smallest, largest, area):
+                    # Left for a later batch of images its own size
+                    rest.append(request)
+                else:
+                    batch.append(request)
+                    if area is not None:
+                        smallest = area if smallest is None else min(smallest, area)
+                        largest = area if largest is None else max(largest, area)
+            self._pending = rest
+            return batch
+
+    def _image_area(
+        self,
+        image_path: str,
+        pixel_preset: Optional[str],
+        min_pixels: Optional[int],
+        max_pixels: Optional[int]
+    ) -> Optional[int]:
+        """Area the image is resized to, read from its header; a proxy for its decode length"""
+        if not self.max_size_ratio:
+            return None
+        try:
+            low, high = self.engine._resolve_pixel_budget(pixel_preset, min_pixels, max_pixels)
+            with Image.open(image_path) as image:
+                area = image.width * image.height
+        except Exception:
+            # Unreadable images fail fast whatever batch they join
+            return None
+        high = high or self.engine._default_max_pixels()
+        if high:
+            area = min(area, high)
+        if low:
+            area = max(area, low)
+        return area
+
+    def _similar_size(self, smallest: Optional[int], largest: Optional[int], area: Optional[int]) -> bool:
+        """Whether an image of ``area`` keeps the batch within max_size_ratio"""
+        if area is None or smallest is None or not self.max_size_ratio:
+            return True
+        return max(largest, area) <= self.max_size_ratio * min(smallest, area)
+
+    def _prepare(self, batch: List[Tuple[Tuple, str, Future, Dict[str, Any]]]):
+        """Decode and tokenize requests; errors are raised later on the model thread"""
+        (task_type, output_format, max_new_tokens, custom_prompt,
+         pixel_preset, min_pixels, max_pixels) = batch[0][0]
+        try:
+            return self.engine._prepare_chunk(
+                [request[1] for request in batch],
+                task_type,
+                output_format,
+                max_new_tokens,
+                custom_prompt=custom_prompt,
+                pixel_preset=pixel_preset,
+                min_pixels=min_pixels,
+                max_pixels=max_pixels,
+                cancel_tokens=[request[3]["cancel_token"] for request in batch]
+            )
+        except Exception as e:
+            return e
+
+    def _next_unprepared(self) -> Optional[Tuple[Tuple, str, Future, Dict[str, Any]]]:
+        """Oldest queued request not yet prepared, unless enough are prepared ahead (lock held)"""
+        ahead = 0
+        candidate = None
+        for request in self._pending:
+            if request[3]["prepared"] is not None:
+                ahead += 1
+            elif candidate is None:
+                candidate = request
+        if ahead >= self.prefetch_depth * self.max_batch_size:
+            return None
+        return candidate
+
+    def _prepare_loop(self):
+        """Prefetch loop: decode and tokenize queued requests one at a time while the model is busy"""
+        while True:
+            with self._condition:
+                request = self._next_unprepared()
+                while request is None and self._running:
+                    self._condition.wait()
+                    request = self._next_unprepared()
+                if request is None:
+                    return
+                request[3]["prepared"] = _PREPARING
+            prepared = self._prepare([request])
+            with self._condition:
+                request[3]["prepared"] = prepared
+                self._condition.notify_all()
+
+    def _prepare_batch(self, batch: List[Tuple[Tuple, str, Future, Dict[str, Any]]]):
+        """Collect a batch's prepared requests, preparing stragglers here, and merge them"""
+        with self._condition:
+            inline = [request for request in batch if request[3]["prepared"] is None]
+            for request in inline:
+                # Keeps the prefetch thread off requests this thread prepares
+                request[3]["prepared"] = _PREPARING
+        for request in inline:
+            prepared = self._prepare([request])
+            with self._condition:
+                request[3]["prepared"] = prepared
+        with self._condition:
+            while any(request[3]["prepared"] is _PREPARING for request in batch):
+                self._condition.wait()
+            # Admitted requests no longer count against the prefetch bound
+            self._condition.notify_all()
+
+        chunks = [request[3]["prepared"] for request in batch]
+        for chunk in chunks:
+            if isinstance(chunk, Exception):
+                return chunk
+        return self.engine._merge_chunks(chunks)
+
+    def _run(self):
+        """Scheduler loop: admit, generate, retire"""
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            waited = time.monotonic()
+            prepared = self._prepare_batch(batch)
+
+            # Time budgets start counting when the request is admitted, not queued
+            admitted = time.monotonic()
+            deadlines = [
+                request[3]["deadline"] if request[3]["time_budget"] is None
+                else admitted + request[3]["time_budget"]
+                for request in batch
+            ]
+            with self._condition:
+                self._stats["prepare_wait_seconds"] += admitted - waited
+                self._stats["batches"] += 1
+                self._stats["max_batch_seen"] = max(self._stats["max_batch_seen"], len(batch))
+
+            try:
+                if isinstance(prepared, Exception):
+                    raise prepared
+                results = self.engine._run_chunk(
+                    prepared,
+                    deadlines=deadlines,
+                    cancel_tokens=[request[3]["cancel_token"] for request in batch],
+                    on_result=lambda index, result: self._resolve(batch[index], result, early=True)
+                )
+                for request, result in zip(batch, results):
+                    self._resolve(request, result)
+            except Exception as e:
+                logger.error(f"Scheduler batch failed: {e}")
+                for request in batch:
+                    if not request[2].done():
+                        request[2].set_exception(e)
+
+    def _resolve(
+        self,
+        request: Tuple[Tuple, str, Future, Dict[str, Any]],
+        result: Dict[str, Any],
+        early: bool = False
+    ):
+        """Hand a result to its caller, once; ``early`` if its batch is still decoding"""
+        if request[2].done():
+            return
+        request[2].set_result(result)
+        with self._condition:
+            self._stats["completed"] += 1
+            if early:
+                self._stats["early_results"] += 1
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting requests; pending requests are still processed"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if wait:
+            self._worker.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get scheduler counters"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats["max_batch_size"] = self.max_batch_size
+        stats["prefetch_depth"] = self.prefetch_depth
+        stats["prepare_wait_seconds"] = round(stats["prepare_wait_seconds"], 2)
+        stats["average_batch_size"] = (
+            f"{stats['completed'] / stats['batches']:.2f}" if stats["batches"] else "0"
+        )
+        return stats
+
+# Made with Bob
@@ -0,0 +1,69 @@
+# prefetch.py
+"""
+Prefetch - Bounded look-ahead for preparing batch work off the model thread
+"""
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, TypeVar
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def prefetch(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    depth: int = 2,
+    workers: int = 1
+) -> Iterator[R]:
+    """
+    Map ``fn`` over ``items`` on background threads, ahead of the consumer
+
+    At most ``depth`` items are being prepared or waiting while the consumer
+    works on the current one, which caps the memory held by prepared
+    results. Image decode, resizing and tokenization release the GIL, so
+    threads overlap them with ``generate`` without copying tensors between
+    processes. Results come back in input order; an exception raised by
+    ``fn`` is re-raised when its result is reached.
+
+    Args:
+        fn: Preparation function, called once per item
+        items: Work items (consumed lazily)
+        depth: Results prepared ahead of the consumer (0: call fn inline)
+        workers: Preparation threads (never more than ``depth``)
+
+    Yields:
+        ``fn(item)`` for every item, in order
+    """
+    if depth <= 0:
+        for item in items:
+            yield fn(item)
+        return
+
+    iterator = iter(items)
+    pending = deque()
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(workers, depth)),
+        thread_name_prefix="ocr-prefetch"
+    )
+    try:
+        for item in itertools.islice(iterator, depth):
+            pending.append(executor.submit(fn, item))
+        while pending:
+            result = pending.popleft().result()
+            # Refill before handing the result over so the look-ahead stays full
+            for item in itertools.islice(iterator, 1):
+                pending.append(executor.submit(fn, item))
+            yield result
+    finally:
+        # Consumer stopped early: drop what has not started yet
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+# Made with Bob
@@ -0,0 +1,146 @@
+# prepare_model.py
+"""
+Prepare Model - Write GutenOCR weights in the exact dtype the engine will run
+"""
+import os
+import json
+import shutil
+import socket
+import time
+import uuid
+import torch
+from typing import Optional
+import logging
+
+import transformers
+from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor
+
+from gutenocr_engine import GutenOCREngine, PREPARED_MANIFEST
+from cpu_capabilities import detect_cpu_features
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def prepare_model(
+    model_id: str = "rootsautomation/GutenOCR-3B",
+    output_dir: str = "./models/prepared",
+    use_cpu: bool = True,
+    torch_dtype: Optional[torch.dtype] = None,
+    quantization: Optional[str] = None,
+    max_shard_size: str = "2GB",
+    overwrite: bool = False
+) -> str:
+    """
+    Convert a checkpoint once so engines can load it without conversion
+
+    The dtype is resolved exactly as GutenOCREngine would on this host, the
+    weights are saved as safetensors in that dtype next to the processor
+    files, and a manifest records what was written. Each replica writes its
+    own temporary directory and renames it into place; the first rename wins
+    and later replicas discard their copy, so concurrent replicas never load
+    or clobber a half-written copy.
+
+    Args:
+        model_id: HuggingFace model ID
+        output_dir: Root directory for prepared models (GUTENOCR_PREPARED_DIR)
+        use_cpu: Prepare for CPU inference
+        torch_dtype: Explicit dtype (None picks the engine default for this host)
+        quantization: Engine quantization mode (int8-dynamic is applied at load
+            time, so its weights are prepared in float32)
+        max_shard_size: Safetensors shard size
+        overwrite: Re-write an existing prepared copy
+
+    Returns:
+        Path of the prepared copy
+    """
+    on_cpu = use_cpu or not torch.cuda.is_available()
+    _, dtype, _ = GutenOCREngine.resolve_placement(
+        "auto", use_cpu, torch_dtype, quantization,
+        detect_cpu_features() if on_cpu else None
+    )
+    path = GutenOCREngine.prepared_path_for(output_dir, model_id, dtype)
+    if os.path.exists(os.path.join(path, PREPARED_MANIFEST)) and not overwrite:
+        logger.info(f"Prepared weights already at {path}")
+        return path
+
+    start = time.perf_counter()
+    # Init containers all run as PID 1 in their own namespace; the hostname and
+    # a random suffix keep every replica's working copy apart on a shared volume
+    tmp_path = f"{path}.tmp-{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+    logger.info(f"Converting {model_id} to {dtype} in {tmp_path}")
+    model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
+        model_id,
+        torch_dtype=dtype,
+        device_map="cpu",
+        low_cpu_mem_usage=True
+    )
+    model.save_pretrained(tmp_path, safe_serialization=True, max_shard_size=max_shard_size)
+    del model
+    AutoProcessor.from_pretrained(model_id).save_pretrained(tmp_path)
+
+    manifest = {
+        "model_id": model_id,
+        "torch_dtype": str(dtype),
+        "transformers_version": transformers.__version__,
+        "torch_version": torch.__version__,
+        "prepared_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "prepare_seconds": round(time.perf_counter() - start, 2)
+    }
+    with open(os.path.join(tmp_path, PREPARED_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(path):
+        if not overwrite:
+            # Another replica finished first; keep its copy
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return path
+        shutil.rmtree(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Renaming onto a directory another replica just created fails
+        if not os.path.exists(os.path.join(path, PREPARED_MANIFEST)):
+            raise
+        logger.info(f"Another replica prepared {path} first; keeping its copy")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return path
+    logger.info(f"Prepared {model_id} ({dtype}) at {path} in {manifest['prepare_seconds']}s")
+    return path
+
+
+def main():
+    """Main entry point for command-line usage"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prepare GutenOCR weights for fast, offline loading")
+    parser.add_argument("--model", default="rootsautomation/GutenOCR-3B", help="GutenOCR model")
+    parser.add_argument("--output", default=os.environ.get("GUTENOCR_PREPARED_DIR", "./models/prepared"), help="Prepared model directory")
+    parser.add_argument("--gpu", action="store_true", help="Prepare for GPU inference (bfloat16)")
+    parser.add_argument("--dtype", choices=["auto", "float32", "bfloat16"], default="auto", help="Weight dtype (auto: what the engine picks on this host)")
+    parser.add_argument("--quantization", choices=["int8-dynamic"], default=None, help="Engine quantization mode")
+    parser.add_argument("--overwrite", action="store_true", help="Re-write an existing prepared copy")
+
+    args = parser.parse_args()
+
+    torch_dtype = None if args.dtype == "auto" else getattr(torch, args.dtype)
+    if args.gpu and torch_dtype is None:
+        # The engine runs bfloat16 on GPU; the preparing host may not have one
+        torch_dtype = torch.bfloat16
+
+    path = prepare_model(
+        model_id=args.model,
+        output_dir=args.output,
+        use_cpu=not args.gpu,
+        torch_dtype=torch_dtype,
+        quantization=args.quantization,
+        overwrite=args.overwrite
+    )
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
+
+# Made with Bob
@@ -0,0 +1,106 @@
+# readiness.py
+"""
+Readiness - Liveness/readiness endpoints served next to the Gradio UI
+"""
+import threading
+import time
+from typing import Dict, Any
+import logging
+
+import gradio as gr
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ReadinessState:
+    """
+    Thread-safe record of whether the model is loaded and warmed up
+
+    The pod is out of rotation only while a model is loading. Once a load
+    finished, failed, or was skipped (no preload) the pod is ready, so the
+    UI, which shows the error and has the Initialize button, stays reachable;
+    the /ready body tells these states apart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = False
+        self._status: Dict[str, Any] = {"state": "starting", "since": time.time()}
+
+    def mark_loading(self, model_id: str):
+        """Model load started; traffic should not be routed here"""
+        self._set(False, {"state": "loading", "model_id": model_id})
+
+    def mark_ready(self, **detail: Any):
+        """Model loaded and warmed up"""
+        self._set(True, {"state": "ready", **detail})
+
+    def mark_failed(self, error: str):
+        """Model load or warmup failed; served so the UI can report it and retry"""
+        self._set(True, {"state": "failed", "error": error})
+
+    def mark_idle(self):
+        """No model is loaded at startup; the UI loads one on request"""
+        self._set(True, {"state": "idle"})
+
+    def _set(self, ready: bool, status: Dict[str, Any]):
+        with self._lock:
+            self._ready = ready
+            self._status = {**status, "since": time.time()}
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self._ready
+
+    def status(self) -> Dict[str, Any]:
+        """Current state for the /ready response body"""
+        with self._lock:
+            return {"ready": self._ready, **self._status}
+
+
+def launch_with_probes(
+    interface: gr.Blocks,
+    readiness: ReadinessState,
+    server_name: str = "0.0.0.0",
+    server_port: int = 7860,
+    share: bool = False
+):
+    """
+    Serve the Gradio interface with /healthz and /ready routes
+
+    /healthz answers as soon as the server is up (liveness); /ready returns
+    503 while the readiness state is starting or loading a model. Gradio share links need
+    Gradio's own launcher, so with ``share`` the probes are not served.
+
+    Args:
+        interface: Gradio Blocks (queue already configured)
+        readiness: State backing the /ready route
+        server_name: Server host
+        server_port: Server port
+        share: Create a public Gradio link instead
+    """
+    if share:
+        logger.warning("Share links use Gradio's launcher; /healthz and /ready are not served")
+        interface.launch(server_name=server_name, server_port=server_port, share=True)
+        return
+
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+
+    @app.get("/healthz")
+    def healthz():
+        return {"status": "alive"}
+
+    @app.get("/ready")
+    def ready():
+        return JSONResponse(readiness.status(), status_code=200 if readiness.ready else 503)
+
+    app = gr.mount_gradio_app(app, interface, path="/")
+    uvicorn.run(app, host=server_name, port=server_port)
+
+# Made with Bob
@@ -0,0 +1,186 @@
+# result_cache.py
+"""
+Result Cache - Content-addressed cache for OCR results
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRResultCache:
+    """
+    Two-tier (memory LRU + on-disk) cache for OCR results
+
+    Entries are keyed by the hash of the image bytes together with every
+    parameter that changes the model output, so a renamed or moved file still
+    hits while a different model, dtype or prompt misses.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = "./output/.ocr_cache",
+        max_memory_entries: int = 256,
+        max_disk_bytes: int = 1 << 30
+    ):
+        """
+        Initialize OCRResultCache
+
+        Args:
+            cache_dir: Directory for the on-disk tier
+            max_memory_entries: Number of results kept in the in-memory LRU
+            max_disk_bytes: Size bound for the on-disk tier (least recently used evicted first)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # Index of on-disk entries: key -> (size, last access time)
+        self._disk_index: Dict[str, list] = {}
+        self._disk_bytes = 0
+        for entry in self._scan_disk():
+            self._disk_index[entry[0]] = [entry[1], entry[2]]
+            self._disk_bytes += entry[1]
+
+    @staticmethod
+    def make_key(image_hash: str, **params: Any) -> str:
+        """Build a cache key from the image hash and generation parameters"""
+        payload = json.dumps(
+            {"image": image_hash, **{k: str(v) for k, v in params.items()}},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path_for(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _scan_disk(self):
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    yield entry.name[:-5], stat.st_size, stat.st_mtime
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            Copy of the cached result, or None on a miss
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return dict(self._memory[key])
+
+            if key in self._disk_index:
+                path = self._path_for(key)
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        result = json.load(f)
+                    os.utime(path)
+                    self._disk_index[key][1] = path.stat().st_mtime
+                    self._remember(key, result)
+                    self.hits += 1
+                    return dict(result)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Dropping unreadable cache entry {path}: {e}")
+                    self._drop_disk(key)
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """
+        Store a result in both tiers
+
+        Args:
+            key: Cache key from make_key
+            result: OCR result dictionary (must be JSON serialisable)
+        """
+        with self._lock:
+            self._remember(key, result)
+
+            path = self._path_for(key)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix('.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(result, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not write cache entry {path}: {e}")
+                return
+
+            if key in self._disk_index:
+                self._disk_bytes -= self._disk_index[key][0]
+            stat = path.stat()
+            self._disk_index[key] = [stat.st_size, stat.st_mtime]
+            self._disk_bytes += stat.st_size
+            self._evict_disk()
+
+    def _remember(self, key: str, result: Dict[str, Any]):
+        self._memory[key] = dict(result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _drop_disk(self, key: str):
+        size, _ = self._disk_index.pop(key)
+        self._disk_bytes -= size
+        try:
+            self._path_for(key).unlink()
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        for key, _ in sorted(self._disk_index.items(), key=lambda item: item[1][1]):
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._drop_disk(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": f"{(self.hits / lookups * 100):.2f}%" if lookups else "0%",
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+                "cache_dir": str(self.cache_dir)
+            }
+
+# Made with Bob
@@ -0,0 +1,161 @@
+# result_sink.py
+"""
+Result Sink - Stream batch results to disk as they complete
+"""
+import os
+import json
+import time
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Iterator
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ResultStatistics:
+    """
+    Summary statistics built one result at a time
+
+    Produces the same summary as FileProcessor.get_statistics without
+    keeping the results themselves.
+    """
+
+    def __init__(self, text_key: str = "text"):
+        """
+        Initialize ResultStatistics
+
+        Args:
+            text_key: Result field holding the extracted text
+                ('combined_text' for combined Docling results)
+        """
+        self.text_key = text_key
+        self.total = 0
+        self.successful = 0
+        self.partial = 0
+        self.total_characters = 0
+
+    def add(self, result: Dict[str, Any]):
+        """Count one result"""
+        self.total += 1
+        if result.get('success'):
+            self.successful += 1
+            self.total_characters += len(result.get(self.text_key) or '')
+        status = result.get('status') or result.get('metadata', {}).get('ocr_status')
+        if status in ('deadline_exceeded', 'cancelled'):
+            self.partial += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Statistics so far, in FileProcessor.get_statistics form"""
+        failed = self.total - self.successful
+        avg_chars = self.total_characters / self.successful if self.successful > 0 else 0
+        return {
+            "total_images": self.total,
+            "successful": self.successful,
+            "failed": failed,
+            "partial": self.partial,
+            "success_rate": f"{(self.successful/self.total*100):.2f}%" if self.total > 0 else "0%",
+            "total_characters": self.total_characters,
+            "average_characters_per_image": f"{avg_chars:.2f}",
+            "timestamp": datetime.now().isoformat()
+        }
+
+
+class JSONLResultSink:
+    """
+    Append-only JSON Lines writer for batch results
+
+    Every result is written as one compact line the moment it completes, so
+    memory stays flat however large the run and a crash loses at most the
+    lines written since the last flush. Statistics are kept incrementally.
+    Use as a context manager, or call close().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_every: int = 100,
+        flush_seconds: float = 10.0,
+        fsync: bool = False,
+        text_key: str = "text"
+    ):
+        """
+        Initialize JSONLResultSink
+
+        Args:
+            path: Output file; appended to if it exists
+            flush_every: Flush after this many results (1: after every result)
+            flush_seconds: Flush at least this often while results arrive
+            fsync: Also fsync on every flush (survives node failure, slower)
+            text_key: Result field holding the extracted text
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_every = max(1, flush_every)
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self.statistics = ResultStatistics(text_key=text_key)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, result: Dict[str, Any]) -> bool:
+        """
+        Append one result and update the statistics
+
+        Returns:
+            True when this write flushed the file (everything so far is on disk)
+        """
+        self._file.write(json.dumps(result, ensure_ascii=False, separators=(',', ':'), default=str))
+        self._file.write('\n')
+        self.statistics.add(result)
+        self._unflushed += 1
+        if (
+            self._unflushed >= self.flush_every
+            or time.monotonic() - self._last_flush >= self.flush_seconds
+        ):
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        """Push buffered lines to the file system"""
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """Flush and close the file"""
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+        logger.info(f"Results saved to: {self.path} ({self.statistics.total} results)")
+
+    def __enter__(self) -> "JSONLResultSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read results back from a JSON Lines file, one at a time
+
+    A truncated last line (the writer was killed mid-write) is skipped.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping malformed line in {path}")
+
+# Made with Bob
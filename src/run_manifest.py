@@ -0,0 +1,185 @@
+# run_manifest.py
+"""
+Run Manifest - Record finished files so batch runs can resume
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple
+import logging
+
+from result_cache import hash_file
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "processed_manifest.jsonl"
+
+
+def is_finished(result: Dict[str, Any]) -> bool:
+    """
+    Whether a result is complete and successful, i.e. its file need not run again
+
+    Failed and partial (deadline_exceeded, cancelled) results are not, nor is
+    a combined result whose OCR step failed.
+    """
+    status = result.get("status") or result.get("metadata", {}).get("ocr_status")
+    if not result.get("success") or status not in (None, "completed"):
+        return False
+    # A combined result succeeds even when its OCR step failed
+    if result.get("metadata", {}).get("gutenocr_processed"):
+        return bool((result.get("gutenocr_ocr") or {}).get("success"))
+    return True
+
+
+class RunManifest:
+    """
+    Append-only record of the files a batch has finished
+
+    Each finished file gets one JSON line with its path relative to the
+    input directory, size, mtime, SHA-256, model and processing options. A
+    later run with the same model and options skips a file whose size and
+    mtime still match without reading it; if only the mtime changed (copied
+    or touched) the content hash decides. New and changed files are
+    processed again. Only complete, successful results are recorded, so
+    failures and partial results are retried.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        input_dir: str,
+        model_id: str,
+        options: Optional[Dict[str, Any]] = None,
+        name: str = MANIFEST_NAME
+    ):
+        """
+        Initialize RunManifest and load what earlier runs finished
+
+        Args:
+            output_dir: Directory holding the manifest
+            input_dir: Root that recorded paths are relative to
+            model_id: Model the results came from
+            options: Settings that change the output (task, format, pixel budget, ...)
+            name: Manifest file name (one per shard, so shards never append to the same file)
+        """
+        self.path = Path(output_dir) / name
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.input_dir = str(input_dir)
+        self.model_id = model_id
+        self.options = options or {}
+        self.fingerprint = hashlib.sha256(
+            json.dumps({"model_id": model_id, "options": self.options}, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()[:16]
+
+        # relative path -> (size, mtime_ns, sha256) for this fingerprint
+        self._entries: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"skipped": 0, "rehashed": 0, "recorded": 0}
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from a killed run
+                    continue
+                if entry.get("fingerprint") == self.fingerprint:
+                    self._entries[entry["path"]] = (entry["size"], entry["mtime_ns"], entry["sha256"])
+        logger.info(f"Manifest {self.path}: {len(self._entries)} files finished with these settings")
+
+    def relative_path(self, file_path: str) -> str:
+        """Path as recorded in the manifest"""
+        return os.path.relpath(file_path, self.input_dir)
+
+    def is_done(self, file_path: str) -> bool:
+        """
+        Whether an earlier run already finished this exact file
+
+        Args:
+            file_path: File about to be processed
+
+        Returns:
+            True when the file can be skipped
+        """
+        key = self.relative_path(file_path)
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        size, mtime_ns, sha256 = entry
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime_ns != mtime_ns:
+            # Same size, new mtime: only the content can tell
+            with self._lock:
+                self._stats["rehashed"] += 1
+            if hash_file(file_path) != sha256:
+                return False
+            self._append(key, stat.st_size, stat.st_mtime_ns, sha256, {"status": "unchanged"})
+        with self._lock:
+            self._stats["skipped"] += 1
+        return True
+
+    def record(self, file_path: str, result: Dict[str, Any], sha256: Optional[str] = None):
+        """
+        Record a finished file; failed and partial results are not recorded
+
+        Args:
+            file_path: File that was processed
+            result: Its processing result
+            sha256: Content hash, if the caller already has it
+        """
+        if not is_finished(result):
+            return
+        try:
+            stat = os.stat(file_path)
+            sha256 = sha256 or hash_file(file_path)
+        except OSError as e:
+            logger.warning(f"Not recording {file_path} in the manifest: {e}")
+            return
+        self._append(self.relative_path(file_path), stat.st_size, stat.st_mtime_ns, sha256, {"status": "completed"})
+        with self._lock:
+            self._stats["recorded"] += 1
+
+    def _append(self, key: str, size: int, mtime_ns: int, sha256: str, extra: Dict[str, Any]):
+        line = json.dumps({
+            "path": key,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha256": sha256,
+            "model_id": self.model_id,
+            "options": self.options,
+            "fingerprint": self.fingerprint,
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **extra
+        }, separators=(',', ':'), default=str)
+        with self._lock:
+            self._entries[key] = (size, mtime_ns, sha256)
+            # One flushed line per file, so a restart loses at most the file in flight
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        """Close the manifest file"""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get skip/record counters"""
+        with self._lock:
+            return {**self._stats, "finished": len(self._entries), "path": str(self.path)}
+
+# Made with Bob
@@ -0,0 +1,245 @@
+# stopping_criteria.py
+"""
+Stopping Criteria - Early-stop rules evaluated between decode steps
+"""
+import time
+import threading
+import logging
+import torch
+from typing import Callable, Dict, Iterable, List, Optional
+from transformers import StoppingCriteria
+
+logger = logging.getLogger(__name__)
+
+
+class CancellationToken:
+    """
+    Thread-safe flag a caller can set to abandon an in-flight OCR request
+    """
+
+    def __init__(self, event=None):
+        """
+        Initialize CancellationToken
+
+        Args:
+            event: Existing Event to wrap, e.g. a multiprocessing.Event shared
+                with worker processes (default: a new threading.Event)
+        """
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        """Request cancellation; generation stops at the next decode step"""
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+def _finished(input_ids: torch.LongTensor, row: int, prompt_length: int, ignore_token_ids: set) -> bool:
+    """Whether a batch row already emitted EOS and is only being padded"""
+    return input_ids.shape[1] > prompt_length and int(input_ids[row, -1]) in ignore_token_ids
+
+
+class RepetitionStoppingCriteria(StoppingCriteria):
+    """
+    Stop a sequence once its output tail is a block repeated over and over
+
+    A repeated OCR line shows up as a periodic token tail. For every period
+    up to ``max_period`` tokens the tail is checked for ``min_repeats``
+    back-to-back copies that together span at least ``min_span`` tokens, so
+    short legitimate repeats (e.g. "0.00 0.00") do not trigger it.
+    """
+
+    def __init__(
+        self,
+        prompt_length: int,
+        max_period: int = 128,
+        min_repeats: int = 4,
+        min_span: int = 64,
+        check_every: int = 8,
+        ignore_token_ids: Iterable[int] = ()
+    ):
+        """
+        Initialize RepetitionStoppingCriteria
+
+        Args:
+            prompt_length: Length of the (padded) prompt preceding generated tokens
+            max_period: Longest repeated block, in tokens, that is detected
+            min_repeats: Minimum number of consecutive copies of the block
+            min_span: Minimum number of tokens covered by the repeated copies
+            check_every: Only inspect the tail every N decode steps
+            ignore_token_ids: Tokens (EOS/pad) marking rows that already finished
+        """
+        self.prompt_length = prompt_length
+        self.max_period = max_period
+        self.min_repeats = min_repeats
+        self.min_span = min_span
+        self.check_every = check_every
+        self.ignore_token_ids = set(ignore_token_ids)
+        # row index -> number of generated tokens when repetition was detected
+        self.triggered: Dict[int, int] = {}
+
+    def _is_repeating(self, generated: torch.Tensor) -> bool:
+        length = generated.shape[0]
+        for period in range(1, self.max_period + 1):
+            repeats = max(self.min_repeats, -(-self.min_span // period))
+            span = period * repeats
+            if span > length:
+                if period * self.min_repeats > length:
+                    break
+                continue
+            tail = generated[-span:].view(repeats, period)
+            if bool((tail == tail[0]).all()):
+                return True
+        return False
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        generated_length = input_ids.shape[1] - self.prompt_length
+        for row in self.triggered:
+            done[row] = True
+        if generated_length < self.min_span or generated_length % self.check_every:
+            return done
+
+        for row in range(input_ids.shape[0]):
+            if row in self.triggered:
+                continue
+            # Rows that hit EOS are padded from then on; that is not a loop
+            if _finished(input_ids, row, self.prompt_length, self.ignore_token_ids):
+                continue
+            if self._is_repeating(input_ids[row, self.prompt_length:]):
+                self.triggered[row] = generated_length
+                done[row] = True
+        return done
+
+
+class DeadlineStoppingCriteria(StoppingCriteria):
+    """
+    Stop each sequence once its own deadline (a time.monotonic() value) passes
+
+    Rows that already finished in a batched generate are left alone, so a
+    complete result is never reported as deadline_exceeded.
+    """
+
+    def __init__(
+        self,
+        prompt_length: int,
+        deadlines: List[Optional[float]],
+        ignore_token_ids: Iterable[int] = ()
+    ):
+        """
+        Initialize DeadlineStoppingCriteria
+
+        Args:
+            prompt_length: Length of the (padded) prompt preceding generated tokens
+            deadlines: Per-row deadline, or None for rows without one
+            ignore_token_ids: Tokens (EOS/pad) marking rows that already finished
+        """
+        self.prompt_length = prompt_length
+        self.deadlines = deadlines
+        self.ignore_token_ids = set(ignore_token_ids)
+        # row index -> number of generated tokens when the deadline passed
+        self.triggered: Dict[int, int] = {}
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        now = time.monotonic()
+        for row, deadline in enumerate(self.deadlines):
+            if row in self.triggered:
+                done[row] = True
+            elif deadline is not None and now >= deadline:
+                if _finished(input_ids, row, self.prompt_length, self.ignore_token_ids):
+                    continue
+                self.triggered[row] = input_ids.shape[1] - self.prompt_length
+                done[row] = True
+        return done
+
+
+class CancellationStoppingCriteria(StoppingCriteria):
+    """
+    Stop each sequence as soon as its CancellationToken is cancelled
+
+    Rows that already finished in a batched generate are left alone, so a
+    complete result is never reported as cancelled.
+    """
+
+    def __init__(
+        self,
+        prompt_length: int,
+        tokens: List[Optional[CancellationToken]],
+        ignore_token_ids: Iterable[int] = ()
+    ):
+        """
+        Initialize CancellationStoppingCriteria
+
+        Args:
+            prompt_length: Length of the (padded) prompt preceding generated tokens
+            tokens: Per-row cancellation token, or None for rows without one
+            ignore_token_ids: Tokens (EOS/pad) marking rows that already finished
+        """
+        self.prompt_length = prompt_length
+        self.tokens = tokens
+        self.ignore_token_ids = set(ignore_token_ids)
+        # row index -> number of generated tokens when cancellation was seen
+        self.triggered: Dict[int, int] = {}
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        for row, token in enumerate(self.tokens):
+            if row in self.triggered:
+                done[row] = True
+            elif token is not None and token.cancelled:
+                if _finished(input_ids, row, self.prompt_length, self.ignore_token_ids):
+                    continue
+                self.triggered[row] = input_ids.shape[1] - self.prompt_length
+                done[row] = True
+        return done
+
+
+class FinishedRowCallback(StoppingCriteria):
+    """
+    Report each row of a batched generate at the step it emits EOS
+
+    Never stops anything itself; it lets a caller hand back a short row's
+    result while longer rows of the same batch are still decoding. Rows
+    stopped by another criterion (deadline, cancellation, repetition) are
+    padded from then on and are not reported. Put it after those criteria.
+    """
+
+    def __init__(
+        self,
+        prompt_length: int,
+        callback: Callable[[int, torch.Tensor], None],
+        finished_token_ids: Iterable[int],
+        others: Iterable[StoppingCriteria] = ()
+    ):
+        """
+        Initialize FinishedRowCallback
+
+        Args:
+            prompt_length: Length of the (padded) prompt preceding generated tokens
+            callback: Called with (row, generated token ids) once per finished row
+            finished_token_ids: Tokens (EOS/pad) marking rows that finished
+            others: Criteria whose ``triggered`` rows are not reported
+        """
+        self.prompt_length = prompt_length
+        self.callback = callback
+        self.finished_token_ids = set(finished_token_ids)
+        self.others = [criterion for criterion in others if criterion is not None]
+        self.reported = set()
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        for row in range(input_ids.shape[0]):
+            if row in self.reported or any(row in criterion.triggered for criterion in self.others):
+                continue
+            if _finished(input_ids, row, self.prompt_length, self.finished_token_ids):
+                self.reported.add(row)
+                try:
+                    self.callback(row, input_ids[row, self.prompt_length:])
+                except Exception as e:
+                    # The row is still returned when generate ends
+                    logger.warning(f"Finished-row callback failed: {e}")
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+# Made with Bob
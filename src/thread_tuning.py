@@ -0,0 +1,179 @@
+# thread_tuning.py
+"""
+Thread Tuning - Find and persist the best torch thread count per host
+"""
+import os
+import json
+import time
+import hashlib
+import torch
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+import logging
+
+from cpu_capabilities import detect_cpu_features
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_TUNING_FILE = os.path.join(os.path.expanduser("~"), ".cache", "gutenocr", "thread_tuning.json")
+
+
+def _tuning_file(path: Optional[str] = None) -> Path:
+    return Path(path or os.environ.get("GUTENOCR_TUNING_FILE", DEFAULT_TUNING_FILE))
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (cgroup/affinity aware)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def host_fingerprint(features: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Identify the host shape a thread setting was tuned for
+
+    Two pods on the same CPU model with the same core allotment share a
+    fingerprint, so a tuning run on one node applies to its siblings.
+    """
+    features = features or detect_cpu_features()
+    payload = json.dumps({
+        "model_name": features["model_name"],
+        "capability": features["capability"],
+        "logical_cpus": features["logical_cpus"],
+        "available_cpus": available_cpus(),
+        "torch": torch.__version__
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def candidate_thread_counts(max_threads: Optional[int] = None) -> List[int]:
+    """Thread counts worth trying: powers of two and common core counts up to the allotment"""
+    max_threads = max_threads or available_cpus()
+    counts = {count for count in (1, 2, 4, 6, 8, 12, 16, 24, 32, 48, 64) if count <= max_threads}
+    counts.update({max_threads, max(1, max_threads // 2)})
+    return sorted(counts)
+
+
+def tune_threads(
+    engine,
+    candidates: Optional[List[int]] = None,
+    prompt_tokens: int = 128,
+    new_tokens: int = 16,
+    typical_prompt_tokens: int = 1024,
+    typical_new_tokens: int = 512,
+    save: bool = True,
+    tuning_file: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Benchmark the engine at several intra-op thread counts and keep the best
+
+    Each setting runs GutenOCREngine.benchmark; settings are scored by the
+    estimated time of a typical OCR request (prefill of
+    ``typical_prompt_tokens`` plus ``typical_new_tokens`` decode steps), so
+    prefill-heavy and decode-heavy hosts are weighed the way OCR uses them.
+    Inter-op threads can only be set before torch starts work and stay as
+    they are.
+
+    Args:
+        engine: Loaded CPU GutenOCREngine
+        candidates: Thread counts to try (default: candidate_thread_counts())
+        prompt_tokens: Synthetic prompt length per measurement
+        new_tokens: Decode steps per measurement
+        typical_prompt_tokens: Prompt length of the request being optimised for
+        typical_new_tokens: Output length of the request being optimised for
+        save: Persist the winner for this host fingerprint
+        tuning_file: Where tuned settings are stored (default: GUTENOCR_TUNING_FILE)
+
+    Returns:
+        Tuned configuration including every measurement
+    """
+    original = torch.get_num_threads()
+    measurements = []
+    try:
+        for threads in candidates or candidate_thread_counts():
+            torch.set_num_threads(threads)
+            # One untimed run so thread pool start-up is not measured
+            engine.benchmark(prompt_tokens=prompt_tokens, new_tokens=2)
+            rates = engine.benchmark(prompt_tokens=prompt_tokens, new_tokens=new_tokens)
+            estimate = (
+                typical_prompt_tokens / max(rates["prefill_tokens_per_second"], 1e-6)
+                + typical_new_tokens / max(rates["decode_tokens_per_second"], 1e-6)
+            )
+            measurements.append({"intra_op_threads": threads, **rates, "estimated_request_seconds": round(estimate, 2)})
+            logger.info(f"{threads} threads: {rates} (~{estimate:.1f}s per typical request)")
+    finally:
+        torch.set_num_threads(original)
+
+    best = min(measurements, key=lambda m: m["estimated_request_seconds"])
+    config = {
+        "intra_op_threads": best["intra_op_threads"],
+        "inter_op_threads": torch.get_num_interop_threads(),
+        "model_id": engine.model_id,
+        "torch_dtype": str(engine.torch_dtype),
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "measurements": measurements
+    }
+    if save:
+        save_thread_config(config, tuning_file=tuning_file)
+    return config
+
+
+def save_thread_config(config: Dict[str, Any], fingerprint: Optional[str] = None, tuning_file: Optional[str] = None):
+    """Store a tuned configuration under this host's fingerprint"""
+    path = _tuning_file(tuning_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        stored = {}
+    stored[fingerprint or host_fingerprint()] = config
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(stored, f, indent=2)
+    os.replace(tmp_path, path)
+    logger.info(f"Saved thread configuration to {path}")
+
+
+def load_thread_config(fingerprint: Optional[str] = None, tuning_file: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Return the tuned configuration for this host, if one was saved"""
+    try:
+        with open(_tuning_file(tuning_file), 'r', encoding='utf-8') as f:
+            return json.load(f).get(fingerprint or host_fingerprint())
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    """Tune the thread count for this host and save it"""
+    import argparse
+    from gutenocr_engine import GutenOCREngine
+
+    parser = argparse.ArgumentParser(description="GutenOCR CPU thread tuner")
+    parser.add_argument("--model", default="rootsautomation/GutenOCR-3B", help="GutenOCR model")
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="Thread counts to try")
+    parser.add_argument("--tuning-file", default=None, help="Where to store the result (default: GUTENOCR_TUNING_FILE)")
+
+    args = parser.parse_args()
+
+    engine = GutenOCREngine(model_id=args.model, use_cpu=True, thread_tuning=False)
+    config = tune_threads(engine, candidates=args.threads, tuning_file=args.tuning_file)
+
+    print(f"\n=== Thread Tuning ({host_fingerprint()}) ===")
+    print(f"{'threads':>8}{'prefill tok/s':>16}{'decode tok/s':>16}{'est. request s':>16}")
+    for m in config["measurements"]:
+        print(
+            f"{m['intra_op_threads']:>8}"
+            f"{m['prefill_tokens_per_second']:>16.2f}"
+            f"{m['decode_tokens_per_second']:>16.2f}"
+            f"{m['estimated_request_seconds']:>16.2f}"
+        )
+    print(f"Best: {config['intra_op_threads']} intra-op threads")
+
+
+if __name__ == "__main__":
+    main()
+
+# Made with Bob
@@ -0,0 +1,284 @@
+# work_queue.py
+"""
+Work Queue - Lease-based file claiming for replicas sharing one input volume
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterable, Iterator
+import logging
+
+from run_manifest import is_finished
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LeaseWorkQueue:
+    """
+    Splits one batch between every replica that runs it
+
+    Before processing a file a replica claims it by creating a lease file
+    (O_CREAT | O_EXCL, atomic on local disks and NFS) on the shared output
+    volume. A background thread renews held leases; a replica that crashes
+    stops renewing, and once its leases expire another replica takes the
+    files over. Successfully finished files get a done marker holding their
+    size and mtime, so they are skipped until they change; failed and
+    partial results are released instead, so they are retried. Processing is
+    at-least-once: a file runs twice only if a replica stalls for longer
+    than the lease. A replica skips files leased by others as it walks the
+    tree, so files whose claimant died are taken over by whichever replica
+    next reaches them, at the latest on the next run.
+    """
+
+    def __init__(
+        self,
+        queue_dir: str,
+        input_dir: str,
+        namespace: str = "default",
+        owner: Optional[str] = None,
+        lease_seconds: float = 300.0
+    ):
+        """
+        Initialize LeaseWorkQueue
+
+        Args:
+            queue_dir: Directory on a volume every replica mounts
+            input_dir: Root that claimed paths are relative to
+            namespace: Separate queues for different settings (e.g. an options hash)
+            owner: Name of this replica in lease files (default: host-pid-random)
+            lease_seconds: How long a claim survives without renewal
+        """
+        self.root = Path(queue_dir) / namespace
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.input_dir = str(input_dir)
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+
+        # relative path -> lease file, for leases this replica holds
+        self._held: Dict[str, Path] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "claimed": 0, "taken_over": 0, "skipped_done": 0, "skipped_leased": 0,
+            "completed": 0, "released": 0, "lost": 0
+        }
+        self._stop = threading.Event()
+        self._renewer = threading.Thread(target=self._renew_loop, name="lease-renewer", daemon=True)
+        self._renewer.start()
+
+    def _paths(self, relative_path: str):
+        digest = hashlib.sha1(relative_path.encode('utf-8')).hexdigest()
+        directory = self.root / digest[:2]
+        return directory / f"{digest}.lease", directory / f"{digest}.done"
+
+    def _lease_body(self, relative_path: str) -> str:
+        return json.dumps({
+            "path": relative_path,
+            "owner": self.owner,
+            "expires_at": time.time() + self.lease_seconds
+        })
+
+    def _create(self, path: Path, body: str) -> bool:
+        """Create ``path`` with ``body`` only if it does not exist"""
+        # Written in full first and then hard-linked into place (atomic, and
+        # fails if the path exists, on NFS too), so no reader sees an empty lease
+        tmp_path = path.with_name(f"{path.name}.{self.owner}.{uuid.uuid4().hex[:6]}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(body)
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
+
+    def _expired(self, lease: Path, current: Optional[Dict[str, Any]]) -> bool:
+        """Whether a lease may be taken over"""
+        if current is not None:
+            return current.get("expires_at", 0) <= time.time()
+        # Unreadable (e.g. torn by a crash): held until it is a full lease period old
+        try:
+            return time.time() - os.stat(lease).st_mtime > self.lease_seconds
+        except OSError:
+            return True
+
+    def _replace(self, path: Path, body: str):
+        tmp_path = path.with_name(f"{path.name}.{self.owner}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    def _read(self, path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def claim(self, file_path: str) -> bool:
+        """
+        Try to claim a file for this replica
+
+        Args:
+            file_path: File about to be processed
+
+        Returns:
+            True when this replica now holds the file and should process it
+        """
+        relative_path = os.path.relpath(file_path, self.input_dir)
+        lease, done = self._paths(relative_path)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+
+        marker = self._read(done)
+        if (
+            marker and marker.get("success") is not False
+            and marker.get("size") == stat.st_size and marker.get("mtime_ns") == stat.st_mtime_ns
+        ):
+            self._count("skipped_done")
+            return False
+
+        lease.parent.mkdir(parents=True, exist_ok=True)
+        if not self._create(lease, self._lease_body(relative_path)):
+            if not self._take_over(lease, relative_path):
+                self._count("skipped_leased")
+                return False
+            self._count("taken_over")
+
+        with self._lock:
+            self._held[relative_path] = lease
+            self._stats["claimed"] += 1
+        return True
+
+    def _take_over(self, lease: Path, relative_path: str) -> bool:
+        """Take over an expired lease; a steal lock makes sure only one replica does"""
+        if not self._expired(lease, self._read(lease)):
+            return False
+        steal_lock = lease.with_name(f"{lease.name}.steal")
+        if not self._create(steal_lock, self.owner):
+            # A replica that died mid take-over leaves its steal lock behind
+            try:
+                if time.time() - os.stat(steal_lock).st_mtime > self.lease_seconds:
+                    os.remove(steal_lock)
+            except OSError:
+                pass
+            return False
+        try:
+            # Re-check under the steal lock: the owner may have renewed meanwhile
+            current = self._read(lease)
+            if not self._expired(lease, current):
+                return False
+            logger.info(f"Taking over expired lease on {relative_path} from {current and current.get('owner')}")
+            self._replace(lease, self._lease_body(relative_path))
+            return True
+        finally:
+            try:
+                os.remove(steal_lock)
+            except OSError:
+                pass
+
+    def claim_iter(self, file_paths: Iterable[str]) -> Iterator[str]:
+        """
+        Yield only the files this replica manages to claim
+
+        Claims are made lazily as the consumer asks for the next file, so
+        the batch is split as it runs rather than up front.
+        """
+        for file_path in file_paths:
+            if self.claim(file_path):
+                yield file_path
+
+    def complete(self, file_path: str, result: Optional[Dict[str, Any]] = None):
+        """
+        Mark a claimed file finished and drop its lease
+
+        A failed or partial result releases the file instead, so a replica
+        retries it rather than skipping it for good.
+
+        Args:
+            file_path: Claimed file
+            result: Its processing result
+        """
+        if result is not None and not is_finished(result):
+            self.release(file_path)
+            return
+        relative_path = os.path.relpath(file_path, self.input_dir)
+        lease, done = self._paths(relative_path)
+        try:
+            stat = os.stat(file_path)
+            self._replace(done, json.dumps({
+                "path": relative_path,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "owner": self.owner,
+                "success": True if result else None,
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+            }))
+        except OSError as e:
+            logger.warning(f"Could not mark {relative_path} done: {e}")
+        self._drop(relative_path, lease)
+        self._count("completed")
+
+    def release(self, file_path: str):
+        """Give a claimed file back unfinished (e.g. cancelled) so any replica can retry it"""
+        relative_path = os.path.relpath(file_path, self.input_dir)
+        lease, _ = self._paths(relative_path)
+        self._drop(relative_path, lease)
+        self._count("released")
+
+    def _drop(self, relative_path: str, lease: Path):
+        with self._lock:
+            held = self._held.pop(relative_path, None)
+        current = self._read(lease)
+        if held is not None and current is not None and current.get("owner") == self.owner:
+            try:
+                os.remove(lease)
+            except OSError:
+                pass
+
+    def _renew_loop(self):
+        """Extend every held lease well before it expires"""
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                held = list(self._held.items())
+            for relative_path, lease in held:
+                current = self._read(lease)
+                if current is None or current.get("owner") != self.owner:
+                    # Expired and taken over while this replica stalled
+                    logger.warning(f"Lost lease on {relative_path}")
+                    with self._lock:
+                        self._held.pop(relative_path, None)
+                        self._stats["lost"] += 1
+                    continue
+                try:
+                    self._replace(lease, self._lease_body(relative_path))
+                except OSError as e:
+                    logger.warning(f"Could not renew lease on {relative_path}: {e}")
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def close(self):
+        """Stop renewing and give back every unfinished claim"""
+        self._stop.set()
+        with self._lock:
+            held = list(self._held.items())
+        for relative_path, lease in held:
+            self._drop(relative_path, lease)
+            self._count("released")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get claim counters for this replica"""
+        with self._lock:
+            return {**self._stats, "held": len(self._held), "owner": self.owner}
+
+# Made with Bob
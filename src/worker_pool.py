@@ -0,0 +1,360 @@
+# worker_pool.py
+"""
+Worker Pool - Multi-process CPU OCR with per-worker thread slices
+"""
+import os
+import glob
+import time
+import queue
+import threading
+import multiprocessing as mp
+from typing import Optional, Dict, Any, List, Iterable, Iterator
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Runs are flagged cancelled in a shared ring of this many slots (run_id % size);
+# far more than the runs ever in flight at once
+RUN_SLOTS = 1024
+
+
+class _RunFlag:
+    """Event-like view of one run's slot in the shared cancel ring"""
+
+    def __init__(self, flags, slot: int):
+        self._flags = flags
+        self._slot = slot
+
+    def is_set(self) -> bool:
+        return bool(self._flags[self._slot])
+
+
+def _parse_cpulist(text: str) -> List[int]:
+    """Parse a kernel cpulist such as '0-3,8-11'"""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _numa_nodes(available: List[int]) -> List[List[int]]:
+    """CPUs of each NUMA node restricted to ``available`` (one node if unknown)"""
+    nodes = []
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cpus = [cpu for cpu in _parse_cpulist(f.read()) if cpu in available]
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [available]
+
+
+def plan_cpu_slices(
+    num_workers: int,
+    threads_per_worker: Optional[int] = None,
+    exclude_cpus: Iterable[int] = ()
+) -> List[List[int]]:
+    """
+    Split the CPUs this process may use into one slice per worker
+
+    Workers are spread round-robin over NUMA nodes and never straddle one,
+    so each worker's weights and activations stay in node-local memory.
+
+    Args:
+        num_workers: Number of worker processes
+        threads_per_worker: CPUs per worker (default: node CPUs / workers on the node)
+        exclude_cpus: CPUs kept for other work in this process (e.g. Docling)
+
+    Returns:
+        One list of CPU ids per worker
+    """
+    if hasattr(os, "sched_getaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+    excluded = set(exclude_cpus)
+    available = [cpu for cpu in available if cpu not in excluded] or available
+    nodes = _numa_nodes(available)
+
+    workers_per_node = [0] * len(nodes)
+    for worker in range(num_workers):
+        workers_per_node[worker % len(nodes)] += 1
+
+    slices = []
+    for node_cpus, count in zip(nodes, workers_per_node):
+        if count == 0:
+            continue
+        size = threads_per_worker or max(1, len(node_cpus) // count)
+        for worker in range(count):
+            # More workers than CPUs: share the node rather than fail
+            slices.append(node_cpus[worker * size:(worker + 1) * size] or node_cpus)
+    return slices
+
+
+def _worker_main(
+    worker_id: int,
+    cpus: List[int],
+    model_id: str,
+    engine_kwargs: Dict[str, Any],
+    tasks,
+    results,
+    cancel_flags
+):
+    """Worker process: pin to its CPU slice, load an engine, serve tasks"""
+    try:
+        if cpus and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        threads = str(len(cpus) or 1)
+        os.environ["OMP_NUM_THREADS"] = threads
+        os.environ["MKL_NUM_THREADS"] = threads
+
+        import torch
+        torch.set_num_threads(int(threads))
+        from gutenocr_engine import GutenOCREngine
+        from stopping_criteria import CancellationToken
+
+        # The slice size wins over the host-wide tuned thread count
+        engine = GutenOCREngine(
+            model_id=model_id, use_cpu=True, num_threads=int(threads), **engine_kwargs
+        )
+    except Exception as e:
+        results.put(("error", None, worker_id, str(e)))
+        return
+    results.put(("ready", None, worker_id, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        run_id, index, image_path, options = task
+        options = dict(options)
+        time_budget = options.pop("time_budget", None)
+        # A cancelled or abandoned run's queued images return as cancelled straight away
+        result = engine.process_image(
+            image_path,
+            deadline=time.monotonic() + time_budget if time_budget else None,
+            cancel_token=CancellationToken(_RunFlag(cancel_flags, run_id % RUN_SLOTS)),
+            **options
+        )
+        result["worker"] = worker_id
+        results.put(("result", run_id, index, result))
+
+
+class OCRWorkerPool:
+    """
+    Pool of GutenOCR engine processes for CPU batch OCR
+
+    One engine decoding one image scales poorly past 8-12 threads, so the
+    pool starts N processes, each pinned to its own slice of cores (one NUMA
+    node at most) with a matching torch thread count. Every worker loads its
+    own copy of the model. Images go through one shared work queue and
+    results come back in input order. Several runs (e.g. two UI batches) may
+    iterate at once; each gets its own results and can be cancelled alone.
+    """
+
+    def __init__(
+        self,
+        model_id: str = "rootsautomation/GutenOCR-3B",
+        num_workers: Optional[int] = None,
+        threads_per_worker: Optional[int] = None,
+        engine_kwargs: Optional[Dict[str, Any]] = None,
+        start_timeout: float = 1800.0,
+        exclude_cpus: Iterable[int] = ()
+    ):
+        """
+        Initialize OCRWorkerPool and wait for every worker to load its model
+
+        Args:
+            model_id: HuggingFace model ID
+            num_workers: Worker processes (default: one per 8 available CPUs)
+            threads_per_worker: CPUs per worker (default: even split per NUMA node)
+            engine_kwargs: Further GutenOCREngine arguments for every worker
+            start_timeout: Seconds to wait for the workers to load
+            exclude_cpus: CPUs the workers must leave free
+        """
+        if num_workers is None:
+            num_workers = max(1, len(plan_cpu_slices(1)[0]) // 8)
+        self.model_id = model_id
+        self.num_workers = num_workers
+        self.cpu_slices = plan_cpu_slices(num_workers, threads_per_worker, exclude_cpus)
+
+        # spawn: forked children would inherit torch's thread pools and locks
+        context = mp.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._cancel_flags = context.Array('b', RUN_SLOTS, lock=False)
+        # Guards the run table below and who reads the shared result queue
+        self._condition = threading.Condition()
+        self._run_id = 0
+        # run id -> results received but not yet yielded, for every live run
+        self._runs: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        self._reading = False
+        self._stats = {"runs": 0, "images": 0, "per_worker": [0] * num_workers}
+
+        self._workers = [
+            context.Process(
+                target=_worker_main,
+                args=(
+                    worker_id, cpus, model_id, engine_kwargs or {},
+                    self._tasks, self._results, self._cancel_flags
+                ),
+                name=f"gutenocr-worker-{worker_id}",
+                daemon=True
+            )
+            for worker_id, cpus in enumerate(self.cpu_slices)
+        ]
+        for worker in self._workers:
+            worker.start()
+        logger.info(f"Started {num_workers} OCR workers on CPU slices {self.cpu_slices}")
+
+        ready = 0
+        deadline = time.monotonic() + start_timeout
+        while ready < num_workers:
+            kind, _, worker_id, payload = self._get_result(deadline)
+            if kind == "error":
+                self.shutdown(wait=False)
+                raise RuntimeError(f"OCR worker {worker_id} failed to start: {payload}")
+            ready += 1
+
+    def _get_result(self, deadline: Optional[float] = None):
+        """Wait for the next worker message, failing fast if a worker died"""
+        while True:
+            try:
+                return self._results.get(timeout=5.0)
+            except queue.Empty:
+                dead = [worker.name for worker in self._workers if not worker.is_alive()]
+                if dead:
+                    raise RuntimeError(f"OCR worker(s) exited unexpectedly: {', '.join(dead)}")
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError("Timed out waiting for OCR workers")
+
+    def imap(
+        self,
+        image_paths: Iterable[str],
+        max_in_flight: Optional[int] = None,
+        **options: Any
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        OCR images across the pool, yielding results in input order
+        
+        ``image_paths`` is consumed only as workers free up, so a lazy
+        discovery or claiming generator is never read far ahead.
+        
+        Args:
+            image_paths: Images to process (e.g. FileProcessor.discover_images())
+            max_in_flight: Images queued or running at once (default: 2 per worker)
+            **options: GutenOCREngine.process_image arguments, plus time_budget
+                in seconds per image
+        
+        Yields:
+            One result dict per image, in the order of ``image_paths``
+        """
+        max_in_flight = max(1, max_in_flight or 2 * self.num_workers)
+        with self._condition:
+            self._run_id += 1
+            run_id = self._run_id
+            self._cancel_flags[run_id % RUN_SLOTS] = 0
+            self._runs[run_id] = {}
+            self._stats["runs"] += 1
+        tasks = enumerate(image_paths)
+        submitted = 0
+        exhausted = False
+        next_index = 0
+        try:
+            while True:
+                while not exhausted and submitted - next_index < max_in_flight:
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    index, image_path = task
+                    self._tasks.put((run_id, index, image_path, options))
+                    submitted += 1
+                if next_index >= submitted:
+                    return
+                # Workers finish out of order; results wait in the run's buffer until their turn
+                result = self._receive(run_id, next_index)
+                next_index += 1
+                yield result
+        finally:
+            # Finished, or the consumer stopped early: queued and running images
+            # of this run are cancelled and their late results dropped
+            with self._condition:
+                self._runs.pop(run_id, None)
+                if next_index < submitted:
+                    self._cancel_flags[run_id % RUN_SLOTS] = 1
+
+    def _receive(self, run_id: int, index: int) -> Dict[str, Any]:
+        """Wait for one result of a run; one caller at a time reads the shared queue for all runs"""
+        while True:
+            with self._condition:
+                while True:
+                    buffered = self._runs[run_id]
+                    if index in buffered:
+                        return buffered.pop(index)
+                    if not self._reading:
+                        self._reading = True
+                        break
+                    self._condition.wait()
+            message = None
+            try:
+                message = self._get_result()
+            finally:
+                with self._condition:
+                    self._reading = False
+                    if message is not None:
+                        kind, result_run, result_index, result = message
+                        # Start-up messages and results of abandoned runs are dropped
+                        if kind == "result" and result_run in self._runs:
+                            self._runs[result_run][result_index] = result
+                            self._stats["images"] += 1
+                            self._stats["per_worker"][result["worker"]] += 1
+                    self._condition.notify_all()
+
+    @property
+    def busy(self) -> bool:
+        """Whether any run is still iterating"""
+        with self._condition:
+            return bool(self._runs)
+
+    def map(self, image_paths: Iterable[str], **options: Any) -> List[Dict[str, Any]]:
+        """Blocking form of imap"""
+        return list(self.imap(image_paths, **options))
+
+    def cancel(self):
+        """Cancel every live run; its queued images return as cancelled straight away"""
+        with self._condition:
+            for run_id in self._runs:
+                self._cancel_flags[run_id % RUN_SLOTS] = 1
+
+    def shutdown(self, wait: bool = True):
+        """Stop every worker process"""
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            if wait:
+                worker.join(timeout=30)
+            if worker.is_alive():
+                worker.terminate()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool layout and per-worker counters"""
+        with self._condition:
+            stats = {**self._stats, "per_worker": list(self._stats["per_worker"]), "live_runs": len(self._runs)}
+        return {
+            **stats,
+            "num_workers": self.num_workers,
+            "cpu_slices": self.cpu_slices,
+            "alive": sum(1 for worker in self._workers if worker.is_alive())
+        }
+
+# Made with Bob